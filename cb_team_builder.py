@@ -3,29 +3,81 @@
 # Assignment: Python Section Presentation
 # Date: 11/11/2019
 
-# These imports required for Google Sheets API
 from __future__ import print_function
 import pickle
+import io                               # for unpickling bytes with ModuleUnpickler
 import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+# the Google Sheets API imports are slow, so they're in sheets_backend.py, which is only imported if a Google Sheet 
+# is used (see get_sheets_data)
 
 # Other imports
-import api_keys                         # this is a file hidden from Github, containing API keys
+# api_keys is a file hidden from Github, containing API keys.  it's imported by get_api_key when the WG API key is needed
+import sys                              # for command line arguments and exit codes
+import argparse                         # for the command line interface
+from contextlib import redirect_stdout  # for keeping progress messages out of JSON output
 import math                             # for using INF in Lineup scoring system
 import json                             # for calling game's API
 import requests                         # useful for calling game's API
-from tkinter import *                   # for GUI
-from tkinter import ttk                 # for themed widgets
-from tkinter import messagebox
+import asyncio                          # for sending many API requests at the same time
+from concurrent.futures import ThreadPoolExecutor      # threads for the API requests that asyncio is waiting on
+import threading                        # for sharing the API rate limiter between threads
+import time                             # for waiting between API requests
+import random                           # for adding jitter to API retry waits
+import sqlite3                          # for the on-disk API response cache
+import queue                            # for passing background loading progress to the GUI
+import hashlib                          # for the lineup cache keys
+import unicodedata                      # for matching ship names without accents (ie Kleber and Kléber)
+from collections import OrderedDict     # for the lineup cache's least recently used order
+try:
+    from tkinter import *               # for GUI
+    from tkinter import ttk             # for themed widgets
+    from tkinter import messagebox
+except ImportError:                     # the GUI is optional, the lineups command line doesn't need Tk
+    ttk = messagebox = None
 from itertools import permutations      # for finding all possible permutations of input players
+from itertools import combinations      # for picking groups of players for ships that appear more than once
+from itertools import chain             # for joining the owner lists of a ship group
+from itertools import product, combinations_with_replacement  # for building ship compositions from rules
+import heapq                            # for pulling ranked lineups off a priority queue
+from bisect import bisect_left          # for prefix searches over sorted clan tags and names
+from concurrent.futures import ProcessPoolExecutor     # for scoring lineups on several CPU cores
+np = None                               # optional NumPy, for scoring lineups in batches.  it's slow to import, so get_numpy imports it when first needed
 # =====================    CLASSES  ============================= #
+# shared by every LazyAttributes object, so two threads never load the same attribute at once
+lazy_load_lock = threading.RLock()
+
+class LazyAttributes:
+    '''
+    '   Base class for objects with attributes that are slow to load.  Attributes listed in lazy_attributes aren't 
+    '   set in __init__.  The first time one is read, its loader method is called and the result is stored, so later 
+    '   reads are normal attribute reads.  Loading is thread safe, so a background thread can load them early.
+    '   Attributes: lazy_attributes (dict of attribute name: name of the method that loads it)
+    '   Methods: is_loaded - check if an attribute was loaded yet
+    '''
+
+    lazy_attributes = {}
+
+    def __getattr__(self, name):
+        ''' only called when the attribute isn't set yet, ie the first read of a lazy attribute '''
+        loader_name = type(self).lazy_attributes.get(name)
+        if loader_name is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        with lazy_load_lock:
+            # another thread may have loaded it while this one waited for the lock
+            if name not in self.__dict__:
+                self.__dict__[name] = getattr(self, loader_name)()
+        return self.__dict__[name]
+
+    def is_loaded(self, name):
+        ''' Parameters: attribute name (string)     Returns: True if the attribute is set '''
+        return name in self.__dict__
+
 class Clan:
     '''
     '   This class will hold all information related to a clan (mainly the roster and preferred ship lineup)
     '   Attributes: A roster of players (list of Player objects)
     '               A list of ships (the header of the input spreadsheet)
+    '               lineup_cache (LineupCache of generate_lineup_cached results)
     '   Methods: get_player - Get a player object from the clan's roster given a username string
     '            generate_lineup - the main player lineup algorithm
     '            get_list_of_players_owning_ship - get a list of players in the clan who own a specific ship
@@ -197,7 +249,7 @@ class Player:
     '   Attributes: username_wg (string)
     '               username_discord (string)
     '               join_date (string), 
-    '               ships (nested dict)
+    '               ships (nested dict, keyed by ship name)
     '               is_active (boolean)
     '               is_alpha_team (boolean)
     '               overall_PR (int)
@@ -293,49 +345,75 @@ class Lineup:
     mod_stat_AVG_DMG = 1
     mod_needs_wins = 1
 
-    def __init__(self, input_player_list, clan, lineup_id):
-        ''' Parameters: list of Player objects and clan object (so that the target ship lineup can be retrieved) '''
+    def __init__(self, input_player_list, clan, lineup_id, ship_lineup=None):
+        ''' 
+        '   Parameters: list of Player objects and clan object (so that the target ship lineup can be retrieved),
+        '               and optionally a different ship lineup to use instead of the clan's target ship lineup
+        '''
 
         # store lineup id
         self.id = lineup_id
 
+        # use the clan's target ship lineup unless a different one was given
+        if ship_lineup is None:
+            ship_lineup = clan.target_ship_lineup
+
         # player/ship nexted list
         self.player_and_ship_list = []
 
         # combine player and ship list into one list of lists
-        for i in range(len(clan.target_ship_lineup)):
-            self.player_and_ship_list.append( [input_player_list[i], clan.target_ship_lineup[i]] )
+        for i in range(len(ship_lineup)):
+            self.player_and_ship_list.append( [input_player_list[i], ship_lineup[i]] )
 
         # initialize points for this player/ship combo
         points = 0
 
-        # calculate the Lineup's score
+        # calculate the Lineup's score by adding up the points of each player/ship combo
         for combo in self.player_and_ship_list:
-
-            # if the ship is not in that player's list of ships, set points to -inf and skip the rest
-            if combo[1] not in combo[0].ships.keys():
-                points = -math.inf
-            else:
-                # add points if they are admiral preferred ship
-                if combo[0].ships[combo[1]]['admiral_strong_preferred']:
-                    points += Lineup.const_points * Lineup.mod_admiral_strong_preferred
-                # add points if they are admiral preferred ship
-                if combo[0].ships[combo[1]]['admiral_weak_preferred']:
-                    points += Lineup.const_points * Lineup.mod_admiral_weak_preferred
-                # add points if alpha team player
-                if combo[0].is_alpha_team:
-                    points += Lineup.const_points * Lineup.mod_is_alpha
-                # add points if player preferred ship
-                if combo[0].ships[combo[1]]['player_preferred']:
-                    points += Lineup.const_points * Lineup.mod_player_preferred           
-
-                # add points if player doesn't main that class
-                # add points if they don't need wins
-                # add points if they have bad ship stats
+            points += Lineup.get_combo_points(combo[0], combo[1])
 
         # set score equal to points
         self.score = points
 
+    @staticmethod
+    def get_weights():
+        ''' Returns: dict of the scoring constants and modifiers (const_points and every mod_*) '''
+        return {name: getattr(Lineup, name) for name in dir(Lineup) if name == 'const_points' or name.startswith('mod_')}
+
+    @staticmethod
+    def get_combo_points(player, ship):
+        '''
+        '   This function scores a single player/ship combo.  A Lineup's score is the sum of its combo points,
+        '   so the lineup solvers in Clan2 use this same function to weight each player/ship pairing
+        '   Parameters: Player object and ship name (string)
+        '   Returns: points (float), or -inf if the player does not own the ship
+        '''
+        # if the ship is not in that player's list of ships, the combo is invalid
+        if ship not in player.ships.keys():
+            return -math.inf
+
+        # initialize points for this player/ship combo
+        points = 0
+
+        # add points if they are admiral preferred ship
+        if player.ships[ship]['admiral_strong_preferred']:
+            points += Lineup.const_points * Lineup.mod_admiral_strong_preferred
+        # add points if they are admiral preferred ship
+        if player.ships[ship]['admiral_weak_preferred']:
+            points += Lineup.const_points * Lineup.mod_admiral_weak_preferred
+        # add points if alpha team player
+        if player.is_alpha_team:
+            points += Lineup.const_points * Lineup.mod_is_alpha
+        # add points if player preferred ship
+        if player.ships[ship]['player_preferred']:
+            points += Lineup.const_points * Lineup.mod_player_preferred
+
+        # add points if player doesn't main that class
+        # add points if they don't need wins
+        # add points if they have bad ship stats
+
+        return points
+
     # a function for displaying what a Lineup looks like (it'll print off all 8 player/ship combos)
     def __repr__(self):
         ''' Parameters: none Returns: string with each player/ship seperated on newlines '''
@@ -345,10 +423,257 @@ class Lineup:
         return_string += f"Linup score is {self.score}"
         return return_string
 
+class LineupStore:
+    '''
+    '   This class holds a sorted list of lineups without making a Lineup object for each one.  Lineups are kept as 
+    '   (score, -lineup ID, tuple of players) entries, best first, and Lineup objects are only made for the lineups
+    '   that are actually used (ie the page of lineups shown in the GUI).  It can be used like a list of Lineups.
+    '   Attributes: clan (Clan2), ship_lineup (list of ship names the lineups were made for), entries (list)
+    '   Methods: get_page - get the Lineups from one position to another
+    '            get_lineup - get a Lineup by its ID
+    '''
+
+    def __init__(self, clan, entries):
+        ''' Parameters: Clan2 object, list of (score, -lineup ID, tuple of players) sorted best first '''
+        self.clan = clan
+        # copy the ship lineup, in case the clan's target ship lineup changes before the lineups are shown
+        self.ship_lineup = list(clan.target_ship_lineup)
+        self.entries = entries
+        # Lineup objects made so far, by position
+        self.lineups = {}
+        # lineup ID: position, built the first time a lineup is looked up by ID
+        self.positions = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        ''' get a Lineup by position, or a list of Lineups by slice '''
+        if isinstance(index, slice):
+            return [self.get_lineup_at(i) for i in range(*index.indices(len(self.entries)))]
+        if index < 0:
+            index += len(self.entries)
+        if not 0 <= index < len(self.entries):
+            raise IndexError("lineup index out of range")
+        return self.get_lineup_at(index)
+
+    def get_lineup_at(self, position):
+        ''' Parameters: position (int)      Returns: Lineup object, made the first time it's needed '''
+        if position not in self.lineups:
+            score, neg_lineup_id, players = self.entries[position]
+            self.lineups[position] = Lineup(list(players), self.clan, -neg_lineup_id, self.ship_lineup)
+        return self.lineups[position]
+
+    def get_page(self, start, count):
+        ''' Parameters: first position, number of lineups      Returns: list of up to count Lineup objects '''
+        return self[start:start+count]
+
+    def get_lineup(self, lineup_id):
+        ''' Parameters: lineup ID (int)     Returns: Lineup object, or None if there isn't a lineup with that ID '''
+        if self.positions is None:
+            self.positions = {-self.entries[i][1]: i for i in range(len(self.entries))}
+        position = self.positions.get(lineup_id)
+        return None if position is None else self.get_lineup_at(position)
+
+class LineupCache:
+    '''
+    '   This class remembers the results of generate_lineup_cached, so picking the same players again (ie after 
+    '   toggling them with Add/Remove/Clear) shows the lineups right away instead of searching again.
+    '   Results are kept in memory, least recently used first out, and optionally in an SQLite file so they're still
+    '   there after a restart.  Keys are made by Clan2.get_lineup_cache_key, and change when anything that affects 
+    '   the lineups changes, so old results are never returned, they just age out.
+    '   The disk tier is limited by total size as well as by count, since a result with thousands of lineups can be 
+    '   over a megabyte.  A result bigger than the whole size limit is only kept in memory
+    '   Attributes: path (string, or None for memory only), max_entries, max_disk_entries, max_disk_bytes (ints), 
+    '               hit_count, miss_count (ints)
+    '   Methods: get - get a cached result
+    '            put - store a result
+    '            get_stats - get hit/miss counts
+    '''
+
+    def __init__(self, path=None, max_entries=16, max_disk_entries=200, max_disk_bytes=32*1024*1024):
+        '''
+        '   Parameters: database file path (None to only keep results in memory), max results kept in memory and on 
+        '               disk, max total size of the results on disk (bytes)
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hit_count = 0
+        self.miss_count = 0
+        # key: result, oldest use first
+        self.entries = OrderedDict()
+
+        # lineups are generated on a background thread, so everything is behind a lock
+        self.lock = threading.Lock()
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS lineup_results (key TEXT PRIMARY KEY, used_at REAL, result BLOB)")
+            self.connection.commit()
+
+    def get(self, key):
+        '''
+        '   Get a cached result, from memory or else from disk
+        '   Parameters: key (string)     Returns: the result given to put, or None if it isn't cached
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hit_count += 1
+                return self.entries[key]
+
+            row = None
+            if self.connection is not None:
+                row = self.connection.execute("SELECT result FROM lineup_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.miss_count += 1
+                return None
+
+            # found on disk: mark it used, and keep it in memory for next time
+            self.connection.execute("UPDATE lineup_results SET used_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            result = pickle.loads(row[0])
+            self.add_entry(key, result)
+            self.hit_count += 1
+            return result
+
+    def put(self, key, result):
+        '''
+        '   Store a result in memory, and on disk if there's a cache file
+        '   Parameters: key (string), result (anything that can be pickled)
+        '''
+        with self.lock:
+            self.add_entry(key, result)
+            if self.connection is None:
+                return
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+            if len(data) > self.max_disk_bytes:
+                return
+            self.connection.execute("INSERT OR REPLACE INTO lineup_results VALUES (?, ?, ?)", (key, time.time(), data))
+            # drop the least recently used results over the limits: past max_disk_entries results, or past 
+            # max_disk_bytes counting the newest results first
+            self.connection.execute('''DELETE FROM lineup_results WHERE key IN (
+                                           SELECT key FROM (SELECT key, ROW_NUMBER() OVER newest AS position, SUM(LENGTH(result)) OVER newest AS total_bytes
+                                                            FROM lineup_results WINDOW newest AS (ORDER BY used_at DESC, key))
+                                           WHERE position > ? OR total_bytes > ?)''', (self.max_disk_entries, self.max_disk_bytes))
+            self.connection.commit()
+
+    def add_entry(self, key, result):
+        ''' add a result to memory, dropping the least recently used results over max_entries (call with the lock held) '''
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_stats(self):
+        ''' Returns: dict of hits and misses '''
+        with self.lock:
+            return {'hits': self.hit_count, 'misses': self.miss_count}
+
+class IncrementalLineupSolver:
+    '''
+    '   This class keeps the best lineup of a set of players up to date as players are added and removed one at a 
+    '   time.  Instead of solving the assignment problem again (see Clan2.generate_best_lineup), each change repairs
+    '   the last best assignment with one chain of players moving to other slots, so it is fast enough to update the
+    '   GUI every time the selected players change.
+    '   Attributes: clan (Clan2), ship_lineup (list of ship names), players (list of Player objects), score_matrix
+    '               (slot x player combo points), assignment (list of the player index in each slot, or None if 
+    '               there's no valid lineup), score (best lineup's score, -inf if there's no valid lineup)
+    '   Methods: reset - start over with a new list of players
+    '            add_player / remove_player - update the best lineup for one player added or removed
+    '            get_best_lineup - get the best lineup as a Lineup object
+    '''
+
+    def __init__(self, clan, player_list=()):
+        ''' Parameters: Clan2 object, list of Player objects to start with '''
+        self.clan = clan
+        self.reset(player_list)
+
+    def reset(self, player_list=()):
+        '''
+        '   Start over with a new list of players (and the clan's current target ship lineup), solving it in full
+        '   Parameters: list of Player objects
+        '''
+        self.players = list(player_list)
+        self.ship_lineup = list(self.clan.target_ship_lineup)
+        self.score_matrix = self.clan.get_score_matrix(self.players)
+        self.score, self.assignment = solve_assignment(self.score_matrix)
+
+    def add_player(self, player):
+        '''
+        '   Update the best lineup for a player being added
+        '   Parameters: Player object (nothing changes if they were already added)
+        '''
+        if player in self.players:
+            return
+        # the ship lineup changed since the last solve, so the old assignment doesn't apply
+        if self.ship_lineup != self.clan.target_ship_lineup:
+            self.reset(self.players + [player])
+            return
+
+        self.players.append(player)
+        for slot in range(len(self.ship_lineup)):
+            self.score_matrix[slot].append(Lineup.get_combo_points(player, self.ship_lineup[slot]))
+
+        # if there was no valid lineup, there's no assignment to repair, so solve it in full
+        if self.assignment is None:
+            self.score, self.assignment = solve_assignment(self.score_matrix)
+        else:
+            self.score, self.assignment = repair_assignment_after_add(self.score_matrix, self.assignment, len(self.players) - 1)
+
+    def remove_player(self, player):
+        '''
+        '   Update the best lineup for a player being removed
+        '   Parameters: Player object (nothing changes if they weren't added)
+        '''
+        if player not in self.players:
+            return
+        if self.ship_lineup != self.clan.target_ship_lineup:
+            self.reset([other_player for other_player in self.players if other_player is not player])
+            return
+
+        # repair the assignment first, while the player's column is still in the matrix.  with no valid lineup before,
+        # there can't be one with fewer players
+        column = self.players.index(player)
+        if self.assignment is not None:
+            self.score, self.assignment = repair_assignment_after_remove(self.score_matrix, self.assignment, column)
+
+        # take out the player's column, moving the later columns down one
+        del self.players[column]
+        for row in self.score_matrix:
+            del row[column]
+        if self.assignment is not None:
+            self.assignment = [j - 1 if j > column else j for j in self.assignment]
+
+    def get_best_lineup(self):
+        ''' Returns: the best Lineup, or False if the players can't form the ship lineup '''
+        if self.assignment is None:
+            return False
+        return Lineup([self.players[j] for j in self.assignment], self.clan, 1, self.ship_lineup)
+
 class Interface:
     '''
     '   This is an interface class to managing information in the Tkinter Gui
+    '   The window is shown right away, and the clan's ships and roster are loaded on a background thread, with a
+    '   progress bar, and added to the window when they're ready.  Lineups are also generated on a background thread,
+    '   showing the best lineups found so far while it runs, and can be cancelled.  The best lineup of the selected
+    '   players is also shown live, updated every time a player is added or removed
     '''
+
+    # how often (ms) the GUI checks on the background loading
+    loading_poll_ms = 50
+    # how often (ms) the GUI checks on lineup generation, about 60 times a second
+    algorithm_poll_ms = 16
+    # number of best lineups kept for Possible Lineups
+    lineup_count = 50000
+    # Possible Lineups only has some of the lineups in it: this many at first, and this many more each time 
+    # it's scrolled near the bottom.  so showing 50 or 50,000 lineups costs the same
+    lineup_page_size = 50
+    # how close to the bottom (fraction of the list) to load the next page
+    lineup_page_threshold = 0.1
+
     def __init__(self, root, clan, image):
         '''constructor'''
 
@@ -382,14 +707,22 @@ class Interface:
         self.player_count = ttk.Label(self.main_frame, text=" ")     
         # target ship list at the right
         self.update_target_ship_list(clan)                                           
+        # progress bar shown while the clan is loading
+        self.progress_loading = ttk.Progressbar(self.main_frame, orient=HORIZONTAL, mode='determinate')
+        self.progress_loading.grid(column=1, row=14)
 
         # add treeviews and pack for listing players/lineups
         self.tree_clan_players = ttk.Treeview(self.main_frame, show='tree')
         self.tree_clan_players.grid(column=1, row=2, rowspan=12)
         self.tree_selected_players = ttk.Treeview(self.main_frame, show='tree')
         self.tree_selected_players.grid(column=3, row=2, rowspan=12)
-        self.tree_possible_lineups = ttk.Treeview(self.main_frame, show='tree', selectmode="browse")
+        self.tree_possible_lineups = ttk.Treeview(self.main_frame, show='tree', selectmode="browse", yscrollcommand=self.on_possible_lineups_scroll)
         self.tree_possible_lineups.grid(column=1, row=16, rowspan=12)
+        self.scrollbar_possible_lineups = ttk.Scrollbar(self.main_frame, orient=VERTICAL, command=self.tree_possible_lineups.yview)
+        self.scrollbar_possible_lineups.grid(column=2, row=17, rowspan=11, sticky=(N,S,W))
+        # lineups that can be shown in tree_possible_lineups, and how many of them are in the tree so far
+        self.generated_lineups = []
+        self.shown_lineup_count = 0
         self.tree_selected_lineup = ttk.Treeview(self.main_frame, show='tree', selectmode="none")
         self.tree_selected_lineup.grid(column=3, row=16, rowspan=12)
 
@@ -403,16 +736,74 @@ class Interface:
         self.button_clear.grid(column=2, row=8)
         self.button_generate_lineups = ttk.Button(self.main_frame, text="Generate Lineups", command=self.start_algorithm, state=DISABLED)
         self.button_generate_lineups.grid(column=2, row=14)
+        self.button_cancel = ttk.Button(self.main_frame, text="Cancel", command=self.cancel_algorithm, state=DISABLED)
+        self.button_cancel.grid(column=2, row=15)
+        # progress bar shown while lineups are generated
+        self.progress_algorithm = ttk.Progressbar(self.main_frame, orient=HORIZONTAL, mode='determinate', maximum=1)
+        self.algorithm_queue = None
+        self.algorithm_cancel_event = threading.Event()
         self.button_team_comp = ttk.Button(self.main_frame, text="Update Ship Composition", command=self.update_ship_comp, state=DISABLED)
         self.button_team_comp.grid(column=4, row=20, rowspan=3)
 
-        # add info to lists
-        for player in clan.roster:
-            self.tree_clan_players.insert('', 'end', clan.roster[player].player_id, text=clan.roster[player].username_wg)
-
         # store clan to be used for start_algorithm method
         self.stored_clan = clan
 
+        # best lineup of the selected players, updated live as players are added and removed
+        self.best_lineup_solver = IncrementalLineupSolver(clan)
+        self.label_best_lineup = ttk.Label(self.main_frame, text=" ")
+        self.label_best_lineup.grid(column=4, row=24, rowspan=4)
+
+        # load the clan on a background thread.  Tkinter widgets can only be used from this thread, so the loading
+        # thread puts its progress in a queue, and check_loading reads it every loading_poll_ms
+        self.root = root
+        self.loading_queue = queue.Queue()
+        threading.Thread(target=self.load_clan, daemon=True).start()
+        self.root.after(Interface.loading_poll_ms, self.check_loading)
+
+    def load_clan(self):
+        '''
+        '   Runs on the background thread: loads the clan's ships and roster, putting progress messages in loading_queue
+        '''
+        try:
+            self.stored_clan.load_resources(lambda done, total, step: self.loading_queue.put(('progress', done, total, step)))
+            self.loading_queue.put(('done',))
+        except Exception as error:
+            self.loading_queue.put(('error', error))
+
+    def check_loading(self):
+        '''
+        '   Runs on the Tkinter thread: updates the progress bar from loading_queue, and fills the roster when loading is done
+        '''
+        while True:
+            try:
+                message = self.loading_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if message[0] == 'progress':
+                done, total, step = message[1:]
+                self.progress_loading.configure(maximum=total, value=done)
+                self.label_status.configure(text=f"Loading {self.stored_clan.clan_tag} {step}..." if done < total else " ")
+            elif message[0] == 'done':
+                self.progress_loading.grid_forget()
+                self.fill_clan_roster()
+                return
+            else:
+                self.progress_loading.grid_forget()
+                self.label_status.configure(text=f"Error loading clan {self.stored_clan.clan_tag}: {message[1]}")
+                return
+
+        # not done yet, check again later
+        self.root.after(Interface.loading_poll_ms, self.check_loading)
+
+    def fill_clan_roster(self):
+        '''
+        '   Add the clan's players to the roster tree
+        '''
+        # add info to lists
+        for player in self.stored_clan.roster:
+            self.tree_clan_players.insert('', 'end', self.stored_clan.roster[player].player_id, text=self.stored_clan.roster[player].username_wg)
+
     def select_players(self):
         '''
         '   When button_add is pressed, call this fuction to move players to selected list
@@ -426,6 +817,7 @@ class Interface:
             for player in selection:
                 # add player to selected tree view
                 self.tree_selected_players.insert('','end', player, text=self.stored_clan.get_player_name_from_id(int(player)))
+                self.best_lineup_solver.add_player(self.stored_clan.get_player_by_id(int(player)))
 
             # clear 'already selected" error message bhy forgetting the pack
             self.error_label.grid_forget()
@@ -434,8 +826,8 @@ class Interface:
             self.player_count.configure(text=f"Player Count: {len(self.tree_selected_players.get_children())}")
             self.player_count.grid(column=3, row=14, sticky=N)
 
-            # enable button only if enough players are selected
-            if len(self.tree_selected_players.get_children()) == len(self.stored_clan.target_ship_lineup):
+            # enable button once at least a full team is selected (the best lineups are picked from all of them)
+            if len(self.tree_selected_players.get_children()) >= len(self.stored_clan.target_ship_lineup):
                 self.button_generate_lineups.configure(state = 'normal')
             else:
                 self.button_generate_lineups.configure(state = DISABLED)
@@ -445,6 +837,8 @@ class Interface:
             # error is shown by packing error message into grid (already created label in init)
             self.error_label.grid(column=2, row=4)
 
+        self.show_best_lineup()
+
     def remove_players(self):
         '''
         '   When button_remove is pressed, call this fuction to remove players to selected list
@@ -453,13 +847,15 @@ class Interface:
         selection = self.tree_selected_players.selection()
         for player in selection:
             self.tree_selected_players.delete(player)
+            self.best_lineup_solver.remove_player(self.stored_clan.get_player_by_id(int(player)))
+        self.show_best_lineup()
         
         # update player count
         self.player_count.configure(text=f"Player Count: {len(self.tree_selected_players.get_children())}")
         self.player_count.grid(column=3, row=14, sticky=N)             
 
         # enable button if enough players are selected
-        if len(self.tree_selected_players.get_children()) == len(self.stored_clan.target_ship_lineup):
+        if len(self.tree_selected_players.get_children()) >= len(self.stored_clan.target_ship_lineup):
             self.button_generate_lineups.configure(state = 'normal')
         else:
             self.button_generate_lineups.configure(state = DISABLED)
@@ -469,14 +865,34 @@ class Interface:
         '   When button_clear is pressed, call this fuction to clear players from selected list
         '
         '''
+        # stop any lineup generation that is running
+        self.cancel_algorithm()
+        self.algorithm_queue = None
+        self.progress_algorithm.grid_forget()
+
         # clear all trees, hide the player count
         self.tree_possible_lineups.delete(*self.tree_possible_lineups.get_children())
         self.tree_selected_lineup.delete(*self.tree_selected_lineup.get_children())
         self.tree_selected_players.delete(*self.tree_selected_players.get_children())
         self.player_count.grid_forget()
+        self.best_lineup_solver.reset()
+        self.label_best_lineup.configure(text=" ")
         # disable generate button
         self.button_generate_lineups.configure(state=DISABLED)
 
+    def show_best_lineup(self):
+        '''
+        '   Show the best lineup of the selected players (kept up to date by best_lineup_solver)
+        '''
+        lineup = self.best_lineup_solver.get_best_lineup()
+        if lineup:
+            text = f"Best lineup (score {lineup.score}):\n" + "\n".join(f"{ship}: {player.username_wg}" for player, ship in lineup.player_and_ship_list)
+        elif len(self.best_lineup_solver.players) < len(self.best_lineup_solver.ship_lineup):
+            text = "Best lineup: not enough players yet"
+        else:
+            text = "Best lineup: these players can't form the ship composition"
+        self.label_best_lineup.configure(text=text)
+
     def update_target_ship_list(self,clan):
         '''
         '   A function for updating the target ship lineup
@@ -491,43 +907,162 @@ class Interface:
         self.tree_possible_lineups.delete(*self.tree_possible_lineups.get_children())
         self.tree_selected_lineup.delete(*self.tree_selected_lineup.get_children())
 
-        # get list of player objects                                                                                            ###### PICKUP HERE, GET WORKING WITH NEW ROSTER/PLAYER DICTIONARY STRUCTURE
+        # get list of player objects.  the selected players tree uses player IDs as item IDs
         player_obj_list = []
         for player in self.tree_selected_players.get_children():
-            player_obj_list.append(self.stored_clan.get_player(player))
+            player_obj_list.append(self.stored_clan.get_player_by_id(int(player)))
         print(f"playe_obj list is {player_obj_list}")
 
         print(self.stored_clan.get_dict_players_with_ships(player_obj_list))
 
-        # call generate lineups
-        self.generated_lineups, bad_perm_count, total_perm_count = self.stored_clan.generate_lineup(player_obj_list,len(player_obj_list))
+        # check that these players can form the ship composition before generating anything
+        is_feasible, feasibility_message = self.stored_clan.check_lineup_feasibility(player_obj_list)
+        if not is_feasible:
+            self.label_status.configure(text=feasibility_message)
+            messagebox.showerror("Lineup Error", f"Those players cannot form the desired ship composition!  Please select different players.\n\n{feasibility_message}")
+            return
+
+        # bind an event so that you can display a lineup when it's selected in tree_possible_lineups
+        self.tree_possible_lineups.bind("<<TreeviewSelect>>",self.on_possible_lineup_click)
 
+        # generate lineups on a background thread so the window keeps responding.  like the clan loading, the thread
+        # only puts messages in a queue, and check_algorithm reads them every algorithm_poll_ms
+        self.generated_lineups = []
+        self.algorithm_queue = queue.Queue()
+        self.algorithm_cancel_event = threading.Event()
+        self.button_generate_lineups.configure(state=DISABLED)
+        self.button_cancel.configure(state='normal')
+        self.progress_algorithm.configure(value=0)
+        self.progress_algorithm.grid(column=2, row=16)
+        self.label_status.configure(text="Generating lineups...")
+        threading.Thread(target=self.run_algorithm, args=(player_obj_list, self.algorithm_queue, self.algorithm_cancel_event), daemon=True).start()
+        self.root.after(Interface.algorithm_poll_ms, self.check_algorithm, self.algorithm_queue)
+
+    def run_algorithm(self, player_obj_list, algorithm_queue, cancel_event):
+        '''
+        '   Runs on the background thread: generates lineups, putting progress and the results in algorithm_queue
+        '''
         try:
-            # put lineups into tree_possible_lineups
-            for lineup in self.generated_lineups:
-                self.tree_possible_lineups.insert('', 'end', lineup.id, text=f"Lineup ID: {lineup.id}  Score: {lineup.score}")      
-        except TypeError:
-            # if no valid lineups, show error message
-            if not self.generated_lineups:
+            result = self.stored_clan.generate_lineup_cached(player_obj_list, Interface.lineup_count, 
+                                                             lambda fraction, valid_count, lineups: algorithm_queue.put(('progress', fraction, valid_count, lineups)),
+                                                             cancel_event)
+            algorithm_queue.put(('done',) + result)
+        except Exception as error:
+            algorithm_queue.put(('error', error))
+
+    def check_algorithm(self, algorithm_queue):
+        '''
+        '   Runs on the Tkinter thread: shows the lineup generation's progress, and the results when it's done
+        '   Parameters: the queue of the run being checked (runs that were cleared or replaced are ignored)
+        '''
+        if algorithm_queue is not self.algorithm_queue:
+            return
+
+        # only the newest progress message matters, so older ones waiting in the queue are skipped
+        message = None
+        while True:
+            try:
+                message = algorithm_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] != 'progress':
+                break
+
+        if message is None or message[0] == 'progress':
+            if message is not None:
+                fraction, valid_count, lineups = message[1:]
+                self.progress_algorithm.configure(value=fraction)
+                self.label_status.configure(text=f"Generating lineups... {fraction:.0%} done, {valid_count} valid lineups so far.  Showing the best so far.")
+                self.show_possible_lineups(lineups)
+            # not done yet, check again later
+            self.root.after(Interface.algorithm_poll_ms, self.check_algorithm, algorithm_queue)
+            return
+
+        # done (or failed), so reset the buttons and progress bar
+        self.algorithm_queue = None
+        self.progress_algorithm.grid_forget()
+        self.button_cancel.configure(state=DISABLED)
+        if len(self.tree_selected_players.get_children()) >= len(self.stored_clan.target_ship_lineup):
+            self.button_generate_lineups.configure(state='normal')
+
+        if message[0] == 'error':
+            self.label_status.configure(text=f"Error generating lineups: {message[1]}")
+            return
+
+        lineups, bad_perm_count, total_perm_count = message[1:]
+        # if no valid lineups, show error message
+        if not lineups:
+            self.show_possible_lineups([])
+            if bad_perm_count is not None:
                 messagebox.showerror("Lineup Error", "Those players cannot form the desired ship composition!  Please select different players.")
-      
+            self.label_status.configure(text="Cancelled before any valid lineups were found." if bad_perm_count is None else " ")
+            return
+        self.show_possible_lineups(lineups)
+
         # update status bar
-        self.label_status.configure(text=f"{total_perm_count} total permutations with {bad_perm_count} invalid lineups.\n Showing {total_perm_count-bad_perm_count} valid lineups in best to worst order.")
+        if bad_perm_count is None:
+            self.label_status.configure(text=f"Cancelled.  Showing the best {len(lineups)} lineups found before cancelling, in best to worst order.")
+        else:
+            self.label_status.configure(text=f"{total_perm_count} distinct lineups with {bad_perm_count} invalid lineups.\n Showing the best {len(lineups)} of {total_perm_count-bad_perm_count} valid lineups in best to worst order.")
 
-        # bind an event so that you can display a lineup when it's selected in tree_possible_lineups
-        self.tree_possible_lineups.bind("<<TreeviewSelect>>",self.on_possible_lineup_click)
+    def cancel_algorithm(self):
+        '''
+        '   When button_cancel is pressed, stop the lineup generation.  The best lineups found so far are kept
+        '''
+        self.algorithm_cancel_event.set()
+        self.button_cancel.configure(state=DISABLED)
+
+    def show_possible_lineups(self, lineups):
+        '''
+        '   Replace the lineups in tree_possible_lineups.  Only the first page is put in the tree, and the rest are added
+        '   a page at a time as the tree is scrolled (see on_possible_lineups_scroll)
+        '   Parameters: LineupStore, best first
+        '''
+        # keep the selected lineup selected, if it's still on the first page
+        selection = self.tree_possible_lineups.selection()
+
+        self.generated_lineups = lineups
+        self.shown_lineup_count = 0
+        self.tree_possible_lineups.delete(*self.tree_possible_lineups.get_children())
+        self.show_next_lineup_page()
+
+        if selection and self.tree_possible_lineups.exists(selection[0]):
+            self.tree_possible_lineups.selection_set(selection[0])
+
+    def show_next_lineup_page(self):
+        '''
+        '   Add the next page of lineups to the bottom of tree_possible_lineups
+        '''
+        page = self.generated_lineups[self.shown_lineup_count:self.shown_lineup_count + Interface.lineup_page_size]
+        # put lineups into tree_possible_lineups
+        for lineup in page:
+            self.tree_possible_lineups.insert('', 'end', lineup.id, text=f"Lineup ID: {lineup.id}  Score: {lineup.score}")      
+        self.shown_lineup_count += len(page)
+
+    def on_possible_lineups_scroll(self, first, last):
+        '''
+        '   Called by tree_possible_lineups when it scrolls (or rows are added).  Moves the scrollbar, and adds the next
+        '   page of lineups when the bottom of the tree is close to being shown
+        '   Parameters: the fractions of the tree shown at the top and bottom (strings)
+        '''
+        self.scrollbar_possible_lineups.set(first, last)
+        if float(last) >= 1 - Interface.lineup_page_threshold and self.shown_lineup_count < len(self.generated_lineups):
+            # add the page after Tkinter is done with this scroll
+            self.root.after_idle(self.show_next_lineup_page)
 
     def on_possible_lineup_click(self,virtual_event):
 
         # reset/remove items from tree_selected_lineup
         self.tree_selected_lineup.delete(*self.tree_selected_lineup.get_children())
 
+        # nothing is selected when the list is cleared or refreshed
+        if not self.tree_possible_lineups.selection():
+            return
+
         # get lineup ID
         this_lineup_id = int(self.tree_possible_lineups.selection()[0])
         # retrieve lineup object
-        for lineup in self.generated_lineups:
-            if int(lineup.id) == this_lineup_id:
-                this_lineup_obj = lineup
+        this_lineup_obj = self.generated_lineups.get_lineup(this_lineup_id)
 
         # print(f"Lineup retrieved: {this_lineup_obj}")
 
@@ -538,18 +1073,580 @@ class Interface:
     def update_ship_comp(self):
         print('update ship comp')
         
-class WOWsGame:
+class TokenBucket:
+    '''
+    '   This class is a rate limiter.  The bucket holds up to "capacity" tokens and refills at "rate" tokens per 
+    '   second.  Each request takes a token, and waits for one if the bucket is empty.  It is shared between threads.
+    '   Attributes: rate (tokens per second), capacity (max tokens)
+    '   Methods: acquire - take a token, waiting if needed
+    '''
+
+    def __init__(self, rate, capacity=None):
+        ''' Parameters: tokens per second, and max tokens (defaults to one second's worth) '''
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        '   Take a token from the bucket, waiting until one is available
+        '   Returns: seconds spent waiting (float, 0 if a token was ready)
+        '''
+        waited = 0
+        while True:
+            with self.lock:
+                # refill the bucket for the time since the last refill
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+
+                # take a token if there is one, otherwise work out how long until there is
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+
+            # wait outside of the lock so other threads can check the bucket
+            time.sleep(wait_time)
+            waited += wait_time
+
+class ResponseCache:
+    '''
+    '   This class is an on-disk (SQLite) cache of WG API responses, keyed by endpoint and query parameters.
+    '   Each kind of endpoint has its own time to live (TTL): the ship encyclopedia only changes with game patches,
+    '   while player stats change every battle.  In offline mode, cached responses are used no matter how old they are
+    '   and nothing is requested from WG.
+    '   Attributes: path (string), ttls (dict of endpoint prefix: seconds), offline (boolean), hit_count, miss_count (ints)
+    '   Methods: get - get a cached response if it is still fresh
+    '            put - store a response
+    '            get_stats - get hit/miss counts
+    '''
+
+    # default time to live for each kind of endpoint, in seconds.  endpoints not listed here aren't cached
+    default_ttls = {'encyclopedia/': 7 * 24 * 60 * 60,      # ships: changes with game patches
+                    'clans/list/': 24 * 60 * 60,            # clan directory: changes slowly
+                    'clans/info/': 60 * 60,                 # clan roster
+                    'account/info/': 10 * 60,               # player stats: change every battle
+                    'ships/stats/': 10 * 60,
+                    }
+
+    def __init__(self, path, ttls=None, offline=False):
+        ''' Parameters: database file path, dict of endpoint prefix: seconds (defaults to default_ttls), offline mode (boolean) '''
+        self.path = path
+        self.ttls = ttls if ttls is not None else ResponseCache.default_ttls
+        self.offline = offline
+        self.hit_count = 0
+        self.miss_count = 0
+
+        # the cache is used from the API client's threads, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (endpoint TEXT, params TEXT, fetched_at REAL, response TEXT, PRIMARY KEY (endpoint, params))")
+        self.connection.commit()
+
+    def get_ttl(self, endpoint):
+        ''' get the time to live (seconds) for an endpoint, 0 if it isn't cached '''
+        for prefix in self.ttls:
+            if endpoint.startswith(prefix):
+                return self.ttls[prefix]
+        return 0
+
+    def get(self, endpoint, params):
+        '''
+        '   Get a cached response
+        '   Parameters: endpoint (string), dict of query parameters
+        '   Returns: the JSON response (dict), or None if it isn't cached or is too old (ignoring age in offline mode)
+        '''
+        ttl = self.get_ttl(endpoint)
+        with self.lock:
+            row = self.connection.execute("SELECT fetched_at, response FROM responses WHERE endpoint = ? AND params = ?", 
+                                          (endpoint, json.dumps(params, sort_keys=True))).fetchone()
+            if row is not None and (self.offline or time.time() - row[0] < ttl):
+                self.hit_count += 1
+                return json.loads(row[1])
+            self.miss_count += 1
+            return None
+
+    def put(self, endpoint, params, response):
+        '''
+        '   Store a response, if this endpoint is cached
+        '   Parameters: endpoint (string), dict of query parameters, the JSON response (dict)
+        '''
+        if self.get_ttl(endpoint) <= 0:
+            return
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", 
+                                    (endpoint, json.dumps(params, sort_keys=True), time.time(), json.dumps(response)))
+            self.connection.commit()
+
+    def get_stats(self):
+        ''' Returns: dict of hits and misses '''
+        with self.lock:
+            return {'hits': self.hit_count, 'misses': self.miss_count}
+
+class WGApiClient:
+    '''
+    '   This class makes all calls to the WG API.  Requests can be sent one at a time (get) or many at once (get_many),
+    '   in which case asyncio sends up to "concurrency" requests at the same time.  All requests share one 
+    '   requests.Session, so connections to the WG servers are kept open and reused.
+    '   Every request goes through one token bucket rate limiter, so the WG per-application request limit isn't hit,
+    '   and requests that fail with REQUEST_LIMIT_EXCEEDED or a network error are retried after a jittered 
+    '   exponential backoff.
+    '   If a ResponseCache is given, fresh cached responses are returned without a request, and successful
+    '   responses are cached.  Refreshes that have to see the current data (ie a roster refresh) pass use_cache=False
+    '   to skip cached responses (they're still used in offline mode, since nothing else is available).
+    '   Attributes: api_url (string), api_key (string), concurrency (int), rate_limiter (TokenBucket), cache (ResponseCache or None)
+    '               request_count, throttled_count, retried_count, limit_exceeded_count, transport_error_count (ints)
+    '   Methods: get - send one request and wait for the result
+    '            get_many - send many requests at once and wait for all results (sync wrapper for fetch_many)
+    '            fetch - async version of get
+    '            fetch_many - async version of get_many
+    '            get_stats - get the request counters
+    '''
+
+    def __init__(self, api_url, api_key, concurrency=10, requests_per_second=10, max_retries=5, backoff_base=0.5, backoff_max=30, cache=None):
+        ''' 
+        '   Parameters: base url of the WG API, application ID, max number of requests at the same time, 
+        '               max requests per second, max retries per request, first retry wait and max retry wait (seconds),
+        '               and an optional ResponseCache
+        '''
+        self.api_url = api_url
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.cache = cache
+
+        # rate limiting and retries
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # counters, so the request rate can be tuned up to the WG limit
+        self.request_count = 0              # requests sent (including retries)
+        self.throttled_count = 0            # requests that had to wait for the rate limiter
+        self.retried_count = 0              # requests that were retried
+        self.limit_exceeded_count = 0       # REQUEST_LIMIT_EXCEEDED errors from WG
+        self.transport_error_count = 0      # network errors
+        self.counter_lock = threading.Lock()
+
+        # shared connection pool, big enough for every concurrent request
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # requests blocks while waiting on the network, so async calls run it in these threads
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def get(self, endpoint, params, use_cache=True):
+        '''
+        '   Send one request to the WG API, waiting for the rate limiter and retrying if needed
+        '   Parameters: endpoint (string, ie 'clans/info/'), dict of query parameters (lists are joined with commas),
+        '               use_cache (False to skip cached responses, the response is still cached)
+        '   Returns: the JSON response (dict).  Raises the last network error if every retry failed.
+        '''
+        # the application ID is added to every request, and lists of IDs/fields are sent comma separated
+        query_params = {'application_id': self.api_key}
+        for key, value in params.items():
+            if isinstance(value, (list, tuple)):
+                value = ','.join(str(item) for item in value)
+            query_params[key] = value
+
+        # use the cached response if there is a fresh one (the application ID isn't part of the cache key)
+        if self.cache is not None:
+            cache_params = {key: query_params[key] for key in query_params if key != 'application_id'}
+            query = self.cache.get(endpoint, cache_params) if use_cache or self.cache.offline else None
+            if query is not None:
+                return query
+            # in offline mode, a response that isn't cached is an error
+            if self.cache.offline:
+                return {'status': 'error', 'error': {'message': 'NOT_CACHED_OFFLINE', 'endpoint': endpoint}}
+
+        attempt = 0
+        while True:
+            # wait for the rate limiter
+            waited = self.rate_limiter.acquire()
+            self.add_to_counter('request_count')
+            if waited > 0:
+                self.add_to_counter('throttled_count')
+
+            # send the request.  network errors (and garbled responses) are retried
+            try:
+                response = self.session.get(f"{self.api_url}/wows/{endpoint}", params=query_params)
+                query = json.loads(response.text)
+            except (requests.RequestException, ValueError) as error:
+                self.add_to_counter('transport_error_count')
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Error reaching WG API ({error}), retrying.  This error thrown from WGApiClient get method")
+            else:
+                # WG's request limit was hit, so retry.  any other response is returned as is
+                if query.get('status') == 'error' and query.get('error', {}).get('message') == 'REQUEST_LIMIT_EXCEEDED':
+                    self.add_to_counter('limit_exceeded_count')
+                    if attempt >= self.max_retries:
+                        return query
+                else:
+                    # only successful responses are cached
+                    if self.cache is not None and query.get('status') == 'ok':
+                        self.cache.put(endpoint, cache_params, query)
+                    return query
+
+            # wait before retrying: the wait doubles each attempt (up to backoff_max), with random jitter so 
+            # requests that failed together don't all retry together
+            attempt += 1
+            self.add_to_counter('retried_count')
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            time.sleep(backoff / 2 + random.uniform(0, backoff / 2))
+
+    def add_to_counter(self, counter_name):
+        ''' add one to a request counter (requests are sent from several threads) '''
+        with self.counter_lock:
+            setattr(self, counter_name, getattr(self, counter_name) + 1)
+
+    def get_stats(self):
+        '''
+        '   Get the request counters
+        '   Returns: dict of counter name: count
+        '''
+        with self.counter_lock:
+            return {'requests': self.request_count,
+                    'throttled': self.throttled_count,
+                    'retried': self.retried_count,
+                    'limit_exceeded': self.limit_exceeded_count,
+                    'transport_errors': self.transport_error_count}
+
+    async def fetch(self, endpoint, params, semaphore=None, use_cache=True):
+        ''' async version of get.  if a semaphore is given, it limits how many requests run at once '''
+        loop = asyncio.get_running_loop()
+        if semaphore is None:
+            return await loop.run_in_executor(self.executor, self.get, endpoint, params, use_cache)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, self.get, endpoint, params, use_cache)
+
+    async def fetch_many(self, request_list, use_cache=True):
+        '''
+        '   async version of get_many
+        '   Parameters: list of (endpoint, params) tuples, use_cache (see get)     Returns: list of JSON responses, in the same order
+        '''
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self.fetch(endpoint, params, semaphore, use_cache) for endpoint, params in request_list])
+
+    def get_many(self, request_list, use_cache=True):
+        '''
+        '   Send many requests to the WG API at the same time, and wait for all of them.  This can be called from
+        '   normal (non async) code, like the Tkinter GUI.
+        '   Parameters: list of (endpoint, params) tuples, use_cache (see get)     Returns: list of JSON responses, in the same order
+        '''
+        if not request_list:
+            return []
+        return asyncio.run(self.fetch_many(request_list, use_cache))
+
+class ClanSearchIndex:
+    '''
+    '   This class is an in-memory search index over the clan directory's tags and names, for a type-ahead clan picker.
+    '   Tags and names are kept in sorted lists, so prefix matches are found with a binary search, and each string's 
+    '   1, 2 and 3 letter pieces (n-grams) point to the clans containing them, so substring matches only check a few clans.
+    '   Results are ranked: tag prefix matches (an exact tag first), then name prefix matches, then tag substring 
+    '   matches, then name substring matches.  Substring matches are ranked by how early the match is, then by length.
+    '   All matching is case insensitive.
+    '   Attributes: tags (sorted list of strings), clan_info (list of {'id', 'name'} dicts, same order as tags)
+    '   Methods: search - get ranked clans matching a query
+    '            get_data / from_data - save and rebuild the index as plain lists and dicts
+    '''
+
+    def __init__(self, clan_directory):
+        ''' Parameters: clan directory dict of clan tag: {'id', 'name'} '''
+        # every clan gets an index number, its position in the tag sorted list
+        self.tags = sorted(clan_directory)
+        self.clan_info = [clan_directory[tag] for tag in self.tags]
+        self.lower_tags = [tag.lower() for tag in self.tags]
+        self.lower_names = [info['name'].lower() for info in self.clan_info]
+
+        # lowercase tags and names in sorted order, with the clan index for each, for prefix searches
+        self.tag_keys, self.tag_order = ClanSearchIndex.get_sorted_keys(self.lower_tags)
+        self.name_keys, self.name_order = ClanSearchIndex.get_sorted_keys(self.lower_names)
+
+        # n-gram: list of clan indexes, for substring searches
+        self.tag_ngrams = ClanSearchIndex.get_ngram_postings(self.lower_tags)
+        self.name_ngrams = ClanSearchIndex.get_ngram_postings(self.lower_names)
+
+    # the attributes that make up the index, saved by get_data and restored by from_data
+    data_attributes = ('tags', 'clan_info', 'lower_tags', 'lower_names', 'tag_keys', 'tag_order', 'name_keys', 'name_order',
+                       'tag_ngrams', 'name_ngrams')
+
+    def get_data(self):
+        '''
+        '   The index as plain lists and dicts, for saving in the store.  Pickling the object itself would save its
+        '   class as __main__.ClanSearchIndex or cb_team_builder.ClanSearchIndex, depending on how this file was run
+        '   Returns: dict of attribute name: value
+        '''
+        return {name: getattr(self, name) for name in ClanSearchIndex.data_attributes}
+
+    @classmethod
+    def from_data(cls, data):
+        '''
+        '   Rebuild an index from get_data's dict, without sorting or splitting the clan directory again
+        '   Returns: ClanSearchIndex object
+        '''
+        index = cls.__new__(cls)
+        for name in ClanSearchIndex.data_attributes:
+            setattr(index, name, data[name])
+        return index
+
+    @staticmethod
+    def get_sorted_keys(keys):
+        ''' Parameters: list of strings     Returns: the strings sorted, and the original index of each '''
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return [keys[i] for i in order], order
+
+    @staticmethod
+    def get_ngram_postings(keys, max_length=3):
+        ''' Parameters: list of strings     Returns: dict of n-gram (1 to max_length letters): list of indexes of the strings containing it '''
+        postings = {}
+        for i in range(len(keys)):
+            for ngram in {keys[i][j:j+n] for n in range(1, max_length + 1) for j in range(len(keys[i]) - n + 1)}:
+                postings.setdefault(ngram, []).append(i)
+        return postings
+
+    def search(self, query, limit=10):
+        '''
+        '   Search the clan directory by tag and name
+        '   Parameters: query (string), max number of results (int)
+        '   Returns: list of (clan tag, {'id', 'name'}) tuples, best match first
+        '''
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        # clan indexes found so far, in rank order.  each tier is only searched if the better tiers didn't fill the limit
+        found = []
+        seen = set()
+        for matches in (lambda: self.get_prefix_matches(query, self.tag_keys, self.tag_order),
+                        lambda: self.get_prefix_matches(query, self.name_keys, self.name_order),
+                        lambda: self.get_substring_matches(query, self.lower_tags, self.tag_ngrams, limit),
+                        lambda: self.get_substring_matches(query, self.lower_names, self.name_ngrams, limit)):
+            for i in matches():
+                if i not in seen:
+                    seen.add(i)
+                    found.append(i)
+                    if len(found) == limit:
+                        break
+            if len(found) == limit:
+                break
+
+        return [(self.tags[i], self.clan_info[i]) for i in found]
+
+    def get_prefix_matches(self, query, sorted_keys, order):
+        ''' generator of clan indexes whose key starts with query, in alphabetical order (so shorter/exact keys first) '''
+        position = bisect_left(sorted_keys, query)
+        while position < len(sorted_keys) and sorted_keys[position].startswith(query):
+            yield order[position]
+            position += 1
+
+    def get_substring_matches(self, query, keys, ngrams, limit):
+        '''
+        '   Returns: list of the best (up to limit) clan indexes whose key contains query, ranked by match position,
+        '            then key length.  since the better tiers can only have found limit clans, limit is always enough
+        '''
+        # only check the clans that have the query's rarest trigram (or the whole query, if it's shorter than 3 letters)
+        if len(query) >= 3:
+            candidates = min([ngrams.get(query[j:j+3], []) for j in range(len(query) - 2)], key=len)
+        else:
+            candidates = ngrams.get(query, [])
+
+        matches = (i for i in candidates if query in keys[i])
+        return heapq.nsmallest(limit, matches, key=lambda i: (keys[i].find(query), len(keys[i]), keys[i]))
+
+class GameDataStore:
+    '''
+    '   This class is the on-disk (SQLite) store for game data: ships, the clan directory, clan rosters and each
+    '   player's ship stats.  Each kind of data is its own indexed table, so callers only read the rows they need
+    '   (one clan tag, one clan's members) and updates are row level upserts instead of rewriting a whole pickle.
+    '   Attributes: path (string)
+    '   Methods: save_ships / load_ships - the game ships, keyed by ship ID
+    '            save_clans / get_clan / load_clan_directory - the clan directory, looked up by clan tag
+    '            save_roster / load_roster - a clan's players and their ship stats, looked up by clan ID
+    '            save_search_index / load_search_index - the clan directory's ClanSearchIndex
+    '            is_empty - check if a table has no rows (used to migrate the old pickle files)
+    '''
+
+    def __init__(self, path):
+        ''' Parameters: database file path '''
+        self.path = path
+
+        # the store can be used from worker threads, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS ships (ship_id TEXT PRIMARY KEY, name TEXT, type TEXT);
+            CREATE TABLE IF NOT EXISTS clans (tag TEXT PRIMARY KEY, clan_id INTEGER, name TEXT);
+            CREATE INDEX IF NOT EXISTS clans_clan_id ON clans (clan_id);
+            CREATE TABLE IF NOT EXISTS players (player_id INTEGER PRIMARY KEY, clan_id INTEGER, username_wg TEXT, 
+                                                last_battle_time INTEGER, overall_WR REAL);
+            CREATE INDEX IF NOT EXISTS players_clan_id ON players (clan_id);
+            CREATE TABLE IF NOT EXISTS player_ship_stats (player_id INTEGER, ship_id INTEGER, ship_WR REAL, 
+                                                          ship_avg_damage INTEGER, ship_battles INTEGER, 
+                                                          PRIMARY KEY (player_id, ship_id));
+            CREATE INDEX IF NOT EXISTS player_ship_stats_ship_id ON player_ship_stats (ship_id);
+            CREATE TABLE IF NOT EXISTS search_index (name TEXT PRIMARY KEY, data BLOB);
+            ''')
+        self.connection.commit()
+
+    def is_empty(self, table):
+        ''' Parameters: table name (string)     Returns: True if the table has no rows '''
+        with self.lock:
+            return self.connection.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+    def save_ships(self, ships):
+        '''
+        '   Replace the stored game ships
+        '   Parameters: dict of ship ID (string): {'name', 'type'}, as built by WOWsGame.update_ships
+        '''
+        with self.lock:
+            # ships that left the tier (or the game) are dropped, so the whole table is replaced in one transaction
+            with self.connection:
+                self.connection.execute("DELETE FROM ships")
+                self.connection.executemany("INSERT INTO ships VALUES (?, ?, ?)", 
+                                            [(ship_id, ship['name'], ship['type']) for ship_id, ship in ships.items()])
+
+    def load_ships(self):
+        ''' Returns: dict of ship ID (string): {'name', 'type'} '''
+        with self.lock:
+            rows = self.connection.execute("SELECT ship_id, name, type FROM ships").fetchall()
+        return {ship_id: {'name': name, 'type': ship_type} for ship_id, name, ship_type in rows}
+
+    def save_clans(self, clan_directory):
+        '''
+        '   Add or update clans in the directory
+        '   Parameters: dict of clan tag: {'id', 'name'}, as built by WOWsGame.update_all_clan_directory
+        '''
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO clans VALUES (?, ?, ?)", 
+                                            [(tag, clan['id'], clan['name']) for tag, clan in clan_directory.items()])
+                # the saved search index no longer matches the directory
+                self.connection.execute("DELETE FROM search_index WHERE name = 'clans'")
+
+    def get_clan(self, tag):
+        ''' Parameters: clan tag (string)       Returns: {'id', 'name'} dict for the clan, or None if the tag isn't stored '''
+        with self.lock:
+            row = self.connection.execute("SELECT clan_id, name FROM clans WHERE tag = ?", (tag,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'name': row[1]}
+
+    def load_clan_directory(self):
+        ''' Returns: dict of every stored clan tag: {'id', 'name'} '''
+        with self.lock:
+            rows = self.connection.execute("SELECT tag, clan_id, name FROM clans").fetchall()
+        return {tag: {'id': clan_id, 'name': name} for tag, clan_id, name in rows}
+
+    def save_search_index(self, index):
+        ''' Parameters: ClanSearchIndex built from the stored clan directory (saved as plain data, see get_data) '''
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO search_index VALUES ('clans', ?)", 
+                                        (pickle.dumps(index.get_data(), pickle.HIGHEST_PROTOCOL),))
+
+    def load_search_index(self):
+        ''' Returns: the saved ClanSearchIndex, or None if there isn't one (or the directory changed since it was saved) '''
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM search_index WHERE name = 'clans'").fetchone()
+        if row is None:
+            return None
+        try:
+            data = pickle.loads(row[0])
+        except (pickle.UnpicklingError, AttributeError, EOFError):
+            # an index saved by an older version, as a pickled object.  it's rebuilt and saved again as plain data
+            return None
+        if not isinstance(data, dict) or any(name not in data for name in ClanSearchIndex.data_attributes):
+            return None
+        return ClanSearchIndex.from_data(data)
+
+    def save_roster(self, clan_id, players):
+        '''
+        '   Store a clan's roster.  Players and their ship stats are upserted, and players that are no longer 
+        '   in the roster are removed from the clan
+        '   Parameters: clan ID (int), dict of player ID: Player2 object
+        '''
+        player_rows = []
+        ship_rows = []
+        for player_id, player in players.items():
+            player_rows.append((player_id, clan_id, getattr(player, 'username_wg', None), 
+                                getattr(player, 'last_battle_time', None), getattr(player, 'overall_WR', None)))
+            # rosters saved before ships were keyed by name use the ship ID as the key
+            for ship_key, ship in getattr(player, 'ships', {}).items():
+                ship_rows.append((player_id, ship.get('ship_id', ship_key), ship['ship_WR'], ship['ship_avg_damage'], ship['ship_battles']))
+
+        with self.lock:
+            with self.connection:
+                # drop players who left the clan, and every stored ship of the players being saved (ships 
+                # can drop out of a player's stats if they leave game_ships)
+                departed_ids = [row[0] for row in self.connection.execute("SELECT player_id FROM players WHERE clan_id = ?", (clan_id,)) 
+                                if row[0] not in players]
+                self.connection.executemany("DELETE FROM players WHERE player_id = ?", [(player_id,) for player_id in departed_ids])
+                self.connection.executemany("DELETE FROM player_ship_stats WHERE player_id = ?", 
+                                            [(player_id,) for player_id in departed_ids + list(players)])
+                self.connection.executemany("INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?)", player_rows)
+                self.connection.executemany("INSERT INTO player_ship_stats VALUES (?, ?, ?, ?, ?)", ship_rows)
+
+    def load_roster(self, clan_id, game_info):
+        '''
+        '   Load one clan's roster
+        '   Parameters: clan ID (int), WOWsGame object (given to each player)
+        '   Returns: dict of player ID: Player2 object (empty if the clan has no stored players)
+        '''
+        with self.lock:
+            player_rows = self.connection.execute("SELECT player_id, username_wg, last_battle_time, overall_WR FROM players WHERE clan_id = ?", 
+                                                  (clan_id,)).fetchall()
+            ship_rows = self.connection.execute('''SELECT player_ship_stats.player_id, ship_id, ship_WR, ship_avg_damage, ship_battles 
+                                                   FROM player_ship_stats JOIN players ON players.player_id = player_ship_stats.player_id 
+                                                   WHERE players.clan_id = ?''', (clan_id,)).fetchall()
+
+        # group ship stats by player, keyed by ship name.  ships that aren't in game_ships anymore are skipped
+        player_ships = {row[0]: {} for row in player_rows}
+        for player_id, ship_id, ship_WR, ship_avg_damage, ship_battles in ship_rows:
+            ship = game_info.game_ships.get(str(ship_id))
+            if ship is not None:
+                player_ships[player_id][ship['name']] = Player2.get_ship_entry(ship_id, ship_WR, ship_avg_damage, ship_battles)
+
+        return {player_id: Player2.from_stored_info(player_id, game_info, username_wg, last_battle_time, overall_WR, player_ships[player_id])
+                for player_id, username_wg, last_battle_time, overall_WR in player_rows}
+
+class WOWsGame(LazyAttributes):
     ''''
     '   This class will be used to manage current information about the game.
+    '   game_ships and clan_directory are loaded from the store the first time they're used (see LazyAttributes)
     '   Attributes: game_ships = list of dictionaries of active ships at specific tier
+    '               clan_directory = dict of every clan tag: {'id', 'name'}, only loaded if it's used
     '               game_tier = list of ships at a given tier
+    '               api_client = WGApiClient used for all calls to the WG API
+    '               store = GameDataStore holding ships, clans and rosters
+    '   Methods: get_clan_info - look up one clan by tag
+    '            get_ship_name - look up a game ship's name, ignoring case and accents
+    '            get_clan_directory - get every stored clan
+    '            search_clans - find clans by tag or name prefix/substring (for a type-ahead clan picker)
+    '            update_ships, update_all_clan_directory - refresh ships/clans through the WG API
+    '            get_account_info_bulk, get_ship_stats_bulk - player info for many players at once
     '               
     '''
 
-    def __init__(self, api_key, realm):
+    # attributes loaded on first use, and the methods that load them.  api_client and store are made in __init__,
+    # and are only made lazily for objects loaded from a pickle (see __setstate__)
+    lazy_attributes = {'game_ships': 'load_game_ships', 'clan_directory': 'get_clan_directory', 
+                       'api_client': 'create_api_client', 'store': 'create_store'}
+
+    def __init__(self, api_key, realm, api_url=None, concurrency=10, requests_per_second=10, cache_path='resources/api_cache.db', offline=False, refresh_from_api=False, 
+                 store_path='resources/wows_data.db'):
         ''' constructor for WOWsGame Object
         '   Attributes: 
-        '
+        '   Parameters: WG API key, realm ('NA', 'RU', 'EU' or 'ASIA'), optional base url for the WG API (ie a local 
+        '               test server), max number of WG API requests at the same time, max WG API requests per second,
+        '               path of the API response cache (None for no cache), offline mode (only use cached responses),
+        '               refresh_from_api (update the ships and clan directory through the API/cache at startup),
+        '               and path of the game data store
         '''
         # ATTRIBUTES:
         
@@ -564,16 +1661,127 @@ class WOWsGame:
             self.region = 'eu'
         elif realm == 'ASIA':
             self.region = 'asia'               
+        # base url for WG API calls (can be changed to point at a local test server)
+        if api_url is None:
+            api_url = f"https://api.worldofwarships.{self.region}"
+        self.api_url = api_url
+        # client for all WG API calls, shared by WOWsGame, Clan2 and Player2 so they share one rate limit and cache
+        self.api_concurrency = concurrency
+        self.api_requests_per_second = requests_per_second
+        self.cache_path = cache_path
+        self.offline = offline
+        self.api_client = self.create_api_client()
         # ship tier that we will be building a team at
         self.game_tier = 10
         # invalid/old/work in progress ships that should be excluded             
         self.game_invalid_ship_names = ['Paolo Emilio', 'Hayate', 'Slava', 'Brennus', 'STALINGRAD #2', 'Puerto Rico', 'Marceau', 'Goliath']
-        # # read all ships from saved .pkl file
-        self.game_ships = load_obj("all_ships")
-        # self.game_ships = self.update_ships()
-        # # read in all clans from saved .pkl file
-        self.clan_directory = load_obj("clan_directory")
-        # self.clan_directory = self.update_all_clan_directory() 
+        # ships, clans and rosters are kept in an indexed SQLite store.  clans are looked up by tag when needed 
+        # instead of loading the whole directory
+        self.store_path = store_path
+        self.store = self.create_store()
+        self.migrate_pickles()
+        # search index over clan tags and names, loaded from the store (or built) the first time it's needed
+        self.clan_search_index = None
+        # game_ships is read from the store the first time it's used
+        # update through the API.  if the cached responses are still fresh, this doesn't touch the network
+        if refresh_from_api:
+            self.game_ships = self.update_ships()
+            self.update_all_clan_directory() 
+
+    def migrate_pickles(self):
+        ''' copy the ships and clan directory from the old .pkl files into the store, the first time the store is used '''
+        for name, table, save in (("all_ships", 'ships', self.store.save_ships), ("clan_directory", 'clans', self.store.save_clans)):
+            if self.store.is_empty(table):
+                try:
+                    save(load_obj(name))
+                    print(f"Copied {name}.pkl into {self.store_path}")
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    pass
+
+    def load_game_ships(self):
+        ''' Returns: dict of ship ID: {'name', 'type'} for the stored ships '''
+        return self.store.load_ships()
+
+    def get_ship_name(self, name):
+        '''
+        '   Look up a game ship by name, ignoring case and accents, so typed names match the WG API's (ie "kleber" 
+        '   finds "Kléber")
+        '   Parameters: ship name (string)      Returns: the game's name for the ship, or None if there isn't one
+        '''
+        ship_names = {get_ship_name_key(ship['name']): ship['name'] for ship in self.game_ships.values()}
+        return ship_names.get(get_ship_name_key(name))
+
+    def get_clan_info(self, tag):
+        '''
+        '   Look up a clan in the directory
+        '   Parameters: clan tag (string)       Returns: dict with the clan's 'id' and 'name'
+        '''
+        clan = self.store.get_clan(tag)
+        if clan is None:
+            raise KeyError(tag)
+        return clan
+
+    def get_clan_directory(self):
+        ''' Returns: dict of every stored clan tag: {'id', 'name'} '''
+        return self.store.load_clan_directory()
+
+    def get_clan_search_index(self):
+        '''
+        '   Get the clan search index, loading it from the store, or building and saving it if the clan directory
+        '   changed since it was saved
+        '   Returns: ClanSearchIndex
+        '''
+        if self.clan_search_index is None:
+            self.clan_search_index = self.store.load_search_index()
+        if self.clan_search_index is None:
+            self.clan_search_index = ClanSearchIndex(self.get_clan_directory())
+            self.store.save_search_index(self.clan_search_index)
+        return self.clan_search_index
+
+    def search_clans(self, query, limit=10):
+        '''
+        '   Find clans by tag or name.  Tag/name prefixes and case insensitive substrings are matched (see ClanSearchIndex)
+        '   Parameters: query (string), max number of results (int)
+        '   Returns: list of (clan tag, {'id', 'name'}) tuples, best match first
+        '''
+        return self.get_clan_search_index().search(query, limit)
+
+    def create_api_client(self):
+        ''' create the WG API client (and its response cache) from this object's settings '''
+        cache = ResponseCache(self.cache_path, offline=self.offline) if self.cache_path is not None else None
+        return WGApiClient(self.api_url, self.api_key, self.api_concurrency, self.api_requests_per_second, cache=cache)
+
+    def create_store(self):
+        ''' open the game data store at this object's store_path '''
+        return GameDataStore(self.store_path)
+
+    def __getstate__(self):
+        ''' the API client (connections, threads and cache database) and the store can't be pickled, so they are left out when saving players '''
+        state = self.__dict__.copy()
+        state.pop('api_client', None)
+        state.pop('store', None)
+        state['clan_search_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        '''
+        '   Fill in settings missing from older pickles.  The API client and store aren't opened here (loading a 
+        '   pickle shouldn't create database files): they're made from the settings the first time they're used,
+        '   and code that loads old players gives them the WOWsGame object in use instead
+        '''
+        self.__dict__.update(state)
+        if not hasattr(self, 'api_url'):
+            self.api_url = f"https://api.worldofwarships.{self.region}"
+        if not hasattr(self, 'api_concurrency'):
+            self.api_concurrency = 10
+        if not hasattr(self, 'api_requests_per_second'):
+            self.api_requests_per_second = 10
+        if not hasattr(self, 'cache_path'):
+            self.cache_path = 'resources/api_cache.db'
+            self.offline = False
+        if not hasattr(self, 'store_path'):
+            self.store_path = 'resources/wows_data.db'
+        self.clan_search_index = None
 
     def update_ships(self):
         '''
@@ -581,26 +1789,31 @@ class WOWsGame:
         '
         '''
         # get ship info (all ships, with tier, name, type, and available upgrades)
-        response = requests.get(f"https://api.worldofwarships.{self.region}/wows/encyclopedia/ships/?application_id={self.api_key}&fields=name")
-        page_query = json.loads(response.text)
+        page_query = self.api_client.get('encyclopedia/ships/', {'fields': 'name'})
 
-        # verify query worked
+        # verify query worked, keeping the current ships if it didn't
         try:
             # attempt to get page count for querying wiki
             if page_query['status'] == "ok":
                 page_count = page_query['meta']['page_total']
                 print("Updating ships from WG servers...data pull successful.")
+            else:
+                print(f"Error getting ship data from WG API: {page_query['error']}.  This error thrown from WOWsGame update_ships() method")
+                return self.game_ships
         except:
             print("Error getting ship data from WG API.  This error thrown from WOWsGame update_ships() method")
+            return self.game_ships
 
         # empy list for storing all data
         page_list = []
         game_ships_dict = {}
-        # iterate through page count
-        for i in range(page_count):
-            # query WG for that page of warships.  get ship ID (as key), name, tier, and type
-            response = requests.get(f"https://api.worldofwarships.{self.region}/wows/encyclopedia/ships/?application_id={self.api_key}&fields=name%2C+type%2C+tier&page_no={i+1}")
-            page_query = json.loads(response.text)
+        # query WG for every page of warships at once.  get ship ID (as key), name, tier, and type
+        page_queries = self.api_client.get_many([('encyclopedia/ships/', {'fields': ['name', 'type', 'tier'], 'page_no': i+1}) for i in range(page_count)])
+        for page_query in page_queries:
+            # if any page failed, keep the current ships instead of saving a partial list
+            if page_query.get('status') != "ok":
+                print(f"Error getting ship data from WG API: {page_query.get('error')}.  This error thrown from WOWsGame update_ships() method")
+                return self.game_ships
             # iterate through page query
             for ship in page_query['data'].items():
                 # append to list.  ship is a tuple, put into list so that it can be cast to a dict
@@ -622,8 +1835,8 @@ class WOWsGame:
                                                 'type': page_list[i][ship_id]['type'],
                                                 }
 
-        # save the ship listing to a file
-        save_obj(game_ships_dict, "all_ships")
+        # save the ship listing to the store
+        self.store.save_ships(game_ships_dict)
 
         # return game ships
         return game_ships_dict
@@ -631,77 +1844,221 @@ class WOWsGame:
     def update_all_clan_directory(self):
         '''
         '   A method for updating the clan listing based on region.
-        '   note that this takes a minute or two to pull ~15k clans, 100 at a time.   
+        '   ~15k clans are pulled 100 at a time, with several pages requested at the same time.   
         '''
-        # the api does not return a page count for this query, so we will iterate through until we get an error
+        # the api does not return a page count for this query, so we will request pages in batches until one comes back empty
         query_count = 100         # API returns a count of 100 max, so we will initilize variable with same amount
-        page_num = 0              # will use this to pull specific page
+        page_num = 0              # last page that was requested
+        batch_size = self.api_client.concurrency
         # empy list for storing all data
         clan_directory_dict = {}
 
         # continue iterating until API returns count of 0
         while query_count != 0:
             print(f"query count is {query_count} and page num is {page_num}")
-            # increment page count
-            page_num += 1
 
-            # query WG for that page of clans.  get all clan data (mainly, id, tag and name)
-            response = requests.get(f"https://api.worldofwarships.{self.region}/wows/clans/list/?application_id={self.api_key}&page_no={page_num}")
-            query = json.loads(response.text)
+            # query WG for the next batch of pages of clans.  get all clan data (mainly, id, tag and name)
+            queries = self.api_client.get_many([('clans/list/', {'page_no': page_num + i + 1}) for i in range(batch_size)])
+            page_num += batch_size
 
-            # iterate through page query
-            for i in range(len(query['data'])):
-                # append clan to dict.  each key is the clan tag, value is a nested dict containing "id" and "name"
-                clan_directory_dict[   query['data'][i]['tag']   ] = { 'id': query['data'][i]['clan_id'], 'name': query['data'][i]['name'] }
-            
-            # set count equal to what was returned by API
-            query_count = query['meta']['count']
+            for query in queries:
+                # if any page failed, keep the current directory instead of saving a partial one
+                if query.get('status') != "ok":
+                    print(f"Error getting clan data from WG API: {query.get('error')}.  This error thrown from WOWsGame update_all_clan_directory() method")
+                    return self.get_clan_directory()
+
+                # iterate through page query
+                for i in range(len(query['data'])):
+                    # append clan to dict.  each key is the clan tag, value is a nested dict containing "id" and "name"
+                    clan_directory_dict[   query['data'][i]['tag']   ] = { 'id': query['data'][i]['clan_id'], 'name': query['data'][i]['name'] }
+                
+                # set count equal to what was returned by API, stopping at the first empty page
+                query_count = query['meta']['count']
+                if query_count == 0:
+                    break
 
 
-        # write page_list to a file
-        save_obj(clan_directory_dict, "clan_directory")
+        # upsert every clan into the store.  the search index is rebuilt the next time it's used
+        self.store.save_clans(clan_directory_dict)
+        self.clan_search_index = None
+        self.__dict__.pop('clan_directory', None)
 
         # return clan directory dict after saving
         return clan_directory_dict
 
-class Clan2:
+    def get_account_info_bulk(self, player_ids, use_cache=True):
+        '''
+        '   A method for getting basic account info (see Player2.account_info_fields) for many players at once.
+        '   The account/info endpoint takes up to 100 account IDs per request, so 50 players only need one request.
+        '   Parameters: list of player IDs, use_cache (False to skip cached responses, see WGApiClient.get)
+        '   Returns: dict of player ID (string): account info dict (None if not found)
+        '''
+        # dict of all account info returned
+        account_infos = {}
+
+        # request 100 players at a time
+        queries = self.api_client.get_many([('account/info/', {'account_id': player_ids[i:i+100], 'fields': Player2.account_info_fields}) 
+                                            for i in range(0, len(player_ids), 100)], use_cache)
+
+        for query in queries:
+            # verify query worked
+            try:
+                if query['status'] == "ok":
+                    print(f"Updating basic info for {len(query['data'])} players from WG servers...data pull successful.")
+                    account_infos.update(query['data'])
+                else:
+                    print(f"Error getting player data from WG API: {query['error']}.  This error thrown from WOWsGame get_account_info_bulk method")
+            except:
+                print("Error getting player data from WG API.  This error thrown from WOWsGame get_account_info_bulk method")
+
+        return account_infos
+
+    def get_ship_stats_bulk(self, player_ids, use_cache=True):
+        '''
+        '   A method for getting ship stats (see Player2.ship_stats_fields) for many players at the same time.
+        '   The ships/stats endpoint only takes one account ID, so there is one request per player, sent concurrently.
+        '   Parameters: list of player IDs, use_cache (False to skip cached responses, see WGApiClient.get)
+        '   Returns: dict of player ID (string): ships/stats JSON response
+        '''
+        queries = self.api_client.get_many([('ships/stats/', {'account_id': player_id, 'ship_id': list(self.game_ships), 'fields': Player2.ship_stats_fields}) 
+                                            for player_id in player_ids], use_cache)
+        return {str(player_ids[i]): queries[i] for i in range(len(player_ids))}
+
+class Clan2(LazyAttributes):
     '''
-    '   This class will hold all information related to a clan (mainly the roster and preferred ship lineup)
-    '   Attributes: A roster of players (list of Player objects)
+    '   This class will hold all information related to a clan (mainly the roster and preferred ship lineup).
+    '   The roster is loaded from the store the first time it's used (see LazyAttributes)
+    '   Attributes: A roster of players (dict of player ID: Player object)
+    '               Indexes of the roster: roster_by_name (dict of username: Player object) and 
+    '               ship_owner_ids (dict of ship name: set of IDs of players who own it)
     '               A list of ships (the header of the input spreadsheet)
     '   Methods: get_player - Get a player object from the clan's roster given a username string
-    '            generate_lineup - the main player lineup algorithm
+    '            get_player_by_id - Get a player object from the clan's roster given a player ID
+    '            load_roster - load the clan's roster from the game data store
+    '            set_roster - replace the roster (and its indexes)
+    '            load_resources - load the ships and roster ahead of time, reporting progress
+    '            generate_lineup - the brute force player lineup algorithm (reference implementation)
+    '            generate_lineup_streaming - stream valid lineups lazily, keeping only the best top_n in memory
+    '            generate_lineup_cached - generate_lineup_streaming, remembering results in lineup_cache
+    '            generate_lineup_parallel - same as generate_lineup_streaming, split across several processes
+    '            generate_lineup_vectorized - score lineups in large NumPy batches using a player x slot score matrix
+    '            generate_best_lineup - find the best lineup by solving an assignment problem
+    '            generate_lineup_branch_and_bound - find the best lineup by searching slots rarest ship first
+    '            generate_top_k_lineups - find the k best lineups in score order (Murty's algorithm)
+    '            check_lineup_feasibility - quickly check if players can fill the target ship lineup at all
+    '            generate_best_compositions - find the best ship compositions (and their best lineups) for the players
+    '            get_compositions_from_rules, get_composition_type_groups - build compositions from rules like 2 BB, 4 CA, 2 DD
+    '            generate_team_lineups - split the roster into several teams that play at the same time
     '            get_list_of_players_owning_ship - get a list of players in the clan who own a specific ship
     '
     '''
 
-    def __init__(self, tag, wows_game_obj):
-        ''' the init function for a Roster type '''
+    # attributes loaded on first use, and the methods that load them.  roster_by_name and ship_owner_ids are
+    # indexes of the roster, rebuilt the first time they're used after the roster changes (see set_roster)
+    lazy_attributes = {'roster': 'load_roster', 'roster_by_name': 'build_roster_by_name', 'ship_owner_ids': 'build_ship_owner_ids'}
+
+    # the clan the old clan_roster.pkl holds the players of (the app only built teams for KSD before the store).  only
+    # this clan's roster is copied from it, so other clans never get KSD's players
+    legacy_roster_clan_tag = 'KSD'
+
+    def __init__(self, tag, wows_game_obj, lineup_cache=None):
+        ''' 
+        '   the init function for a Roster type
+        '   Parameters: clan tag, WOWsGame object, optional LineupCache for generate_lineup_cached (defaults to an 
+        '               in-memory one)
+        '''
 
         # store pointer to the wows_game objected
         self.game_info = wows_game_obj
 
-        # retreive clan info from pickled directory
+        # results of generate_lineup_cached
+        self.lineup_cache = lineup_cache if lineup_cache is not None else LineupCache()
+
+        # retreive clan info from the store's clan directory
         self.clan_tag = tag
-        self.clan_id = self.game_info.clan_directory[self.clan_tag ]['id']
-        self.clan_name = self.game_info.clan_directory[self.clan_tag ]['name']
+        clan_info = self.game_info.get_clan_info(self.clan_tag)
+        self.clan_id = clan_info['id']
+        self.clan_name = clan_info['name']
 
-        # roster is list of Player objects
+        # roster is dict of player ID: Player objects, loaded from the store the first time it's used (only this 
+        # clan's players are read)
         # self.roster = self.update_roster()
-        self.roster = load_obj('clan_roster')
 
-        # the desired ship lineup, as a list of strings
-        self.target_ship_lineup = ['Kremlin', 'Yamato', 'Smolensk', 'Moskva', 'Des Moines', 'Kleber', 'Kleber', 'Gearing']
+        # the desired ship lineup, as a list of strings.  players' ships are keyed by the WG API's ship names, so these 
+        # have to be spelled the same way (see WOWsGame.get_ship_name)
+        self.target_ship_lineup = ['Kremlin', 'Yamato', 'Smolensk', 'Moskva', 'Des Moines', 'Kléber', 'Kléber', 'Gearing']
+
+    def load_roster(self):
+        '''
+        '   A function that loads the clan's roster from the store.  If the store doesn't have this clan yet and it's
+        '   the clan the old clan_roster.pkl was saved for, the pickle is copied into it.  Other clans start with an
+        '   empty roster until it's refreshed through the WG API (see update_roster_incremental)
+        '   Returns: dict of player ID: Player object
+        '''
+        roster = self.game_info.store.load_roster(self.clan_id, self.game_info)
+        if not roster and self.clan_tag == Clan2.legacy_roster_clan_tag:
+            try:
+                legacy_roster = load_obj('clan_roster')
+                # the pickled players have their own old WOWsGame object, so give them the one in use
+                for player in legacy_roster.values():
+                    player.game_info = self.game_info
+                self.game_info.store.save_roster(self.clan_id, legacy_roster)
+                # read it back, so the players are rebuilt in the current format
+                roster = self.game_info.store.load_roster(self.clan_id, self.game_info)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                # no old roster to copy.  a pickle that can't be rebuilt (ie AttributeError) is a real bug, so it isn't hidden
+                roster = {}
+        return roster
+
+    def load_resources(self, progress=None):
+        '''
+        '   A function that loads everything the GUI needs for this clan (the game ships, then the roster), so it can
+        '   be done on a background thread while the window is already showing
+        '   Parameters: optional progress function, called as progress(steps done, total steps, name of the next step)
+        '''
+        steps = [('ships', lambda: self.game_info.game_ships), ('roster', lambda: self.roster)]
+        for i in range(len(steps)):
+            if progress is not None:
+                progress(i, len(steps), steps[i][0])
+            steps[i][1]()
+        if progress is not None:
+            progress(len(steps), len(steps), 'done')
+
+    def set_roster(self, players):
+        '''
+        '   A function for replacing the roster.  The roster indexes are rebuilt the next time they're used
+        '   Parameters: dict of player ID: Player object
+        '''
+        self.roster = players
+        self.__dict__.pop('roster_by_name', None)
+        self.__dict__.pop('ship_owner_ids', None)
+
+    def build_roster_by_name(self):
+        ''' Returns: dict of username: Player object for the roster '''
+        return {player.username_wg: player for player in self.roster.values()}
+
+    def build_ship_owner_ids(self):
+        ''' Returns: dict of ship name: set of the IDs of the players in the roster who own it '''
+        ship_owner_ids = {}
+        for player in self.roster.values():
+            for ship in player.ships:
+                ship_owner_ids.setdefault(ship, set()).add(player.player_id)
+        return ship_owner_ids
 
     def get_player(self, name):
         '''
         '   A function for retrieving player object of given input username
         '   Parameters: WG username (string)        
-        '   Returns: Player object
+        '   Returns: Player object (None if there isn't a player with that name)
         '''
-        for i in range(len(self.roster)):
-            if self.roster[i].username_wg == name:
-                return self.roster[i]
+        return self.roster_by_name.get(name)
+
+    def get_player_by_id(self, player_id):
+        '''
+        '   A function for retrieving player object of given player ID
+        '   Parameters: player_id (int)     Returns: Player object (None if there isn't a player with that ID)
+        '''
+        return self.roster.get(player_id)
 
     def get_player_name_from_id(self, player_id):
         '''
@@ -715,12 +2072,17 @@ class Clan2:
         '''
         '   This is the main algorithm for generating the best lineup.  One important note is that this algorithm
         '   is reliant on having a player list that is exactly as long as the target ship lineup
-        '   Parameters: a list of player objects
+        '   Parameters: a list of player objects, team size (int, must match the target ship lineup)
         '   Returns: a Lineup object
         '''
 
+        # lineups always fill every slot of the target ship lineup, so any other team size is a mistake by the caller
+        if team_size != len(self.target_ship_lineup):
+            raise ValueError(f'team size {team_size} does not match the {len(self.target_ship_lineup)} ship target lineup')
+
         #   Here's how the algorithm works:
-        #   1. Generate all possible permutations of n players.  Each permutation is stored as a type Lineup
+        #   1. Generate all distinct lineups of n players.  Each lineup is stored as a type Lineup
+        #       (ships that appear more than once count as one group, so swapping two Kleber players isn't a new lineup)
         #       a. In the Lineup ___init__ function, a score for the Lineup will be generated
         #       b. The score will be used sort the Lineups, helping the user decide which is best
         #       c. If a player is paired with a ship that is not in their port for a given Lineup, 
@@ -734,13 +2096,13 @@ class Clan2:
         player_perm_list = []
         # create a counter, this will serve as each Lineup's ID
         lineup_id = 0
-        # iterate through all possible permutations of input player list and specified team size
-        for perm in list(permutations(player_list,team_size)):
+        # iterate through all distinct lineups of input player list
+        for perm in self.get_distinct_lineup_permutations(player_list):
             # increment lineup_ID
             lineup_id += 1
             # create a new Lineup, appended to lineup list
             player_perm_list.append(Lineup(perm, self, lineup_id))
-        # after all Lineup permutations are generated, the lineup_id will be the same as the total permutation count
+        # after all Lineups are generated, the lineup_id will be the same as the total distinct lineup count
         total_perm_count = lineup_id
         
         # create variable for tracking the number of invalid lineups
@@ -760,30 +2122,870 @@ class Clan2:
         player_perm_list.sort(key=lambda x: x.score, reverse=True)
 
         # some print messages about stats
-        print(f"{len(player_perm_list)} permutations were checked: {bad_perm_count} were invalid and {total_perm_count-bad_perm_count} were evaluated and compared against each other")
+        print(f"{total_perm_count} distinct lineups were checked: {bad_perm_count} were invalid and {total_perm_count-bad_perm_count} were evaluated and compared against each other")
 
         # check to see if there is no a valid lineup
         if len(player_perm_list) == 0:
             return False, bad_perm_count, total_perm_count
         
-        # return sorted best to worst list of lineups, the total bad lineups that were thrown out, and the total permutations generated
+        # return sorted best to worst list of lineups, the total bad lineups that were thrown out, and the total distinct lineups generated
         return player_perm_list, bad_perm_count, total_perm_count
-    
+
+    def get_distinct_lineup_permutations(self, player_list):
+        '''
+        '   This generator gives every distinct way of putting the players into the target ship lineup exactly once.
+        '   Ships that appear more than once are treated as a group, so a lineup with 2 Klebers is only made once
+        '   instead of twice (once per order of the two Kleber players).
+        '   Parameters: list of Player objects
+        '   Returns: yields tuples of Player objects, in the same order as target_ship_lineup
+        '''
+        # group the slot numbers by ship, ie {'Kleber': [5, 6], ...}, in order of first appearance
+        ship_slots = {}
+        for slot in range(len(self.target_ship_lineup)):
+            ship_slots.setdefault(self.target_ship_lineup[slot], []).append(slot)
+        ship_groups = list(ship_slots.values())
+
+        # the player picked for each slot
+        lineup = [None] * len(self.target_ship_lineup)
+
+        def fill_ship_group(group_index, remaining_players):
+            ''' pick players for one group of same-ship slots, then move on to the next group '''
+            # every group is filled, so the lineup is done
+            if group_index == len(ship_groups):
+                yield tuple(lineup)
+                return
+
+            slots = ship_groups[group_index]
+            # combinations (not permutations) so each group of players is only picked once for this ship
+            for picked_players in combinations(remaining_players, len(slots)):
+                for i in range(len(slots)):
+                    lineup[slots[i]] = picked_players[i]
+                yield from fill_ship_group(group_index + 1, [player for player in remaining_players if player not in picked_players])
+
+        yield from fill_ship_group(0, list(player_list))
+
+    def stream_lineup_candidates(self, player_list):
+        '''
+        '   This generator gives every distinct valid lineup one at a time, without storing them.  Players are only
+        '   tried for ships they own, so a partial lineup is dropped as soon as a slot can't be filled.
+        '   Parameters: list of Player objects
+        '   Returns: yields (score, tuple of Player objects in the same order as target_ship_lineup)
+        '''
+        ship_groups, ship_points = self.get_ship_group_points(player_list)
+        yield from stream_scored_lineups(ship_groups, ship_points, list(player_list), len(self.target_ship_lineup))
+
+    def get_ship_group_points(self, player_list, player_keys=None):
+        '''
+        '   This function gets what the lineup streaming needs: the slots of each ship, and the combo points of each owner
+        '   Parameters: list of Player objects, list of keys to use for the players (defaults to the Player objects)
+        '   Returns: list of (ship, list of slots) in order of first appearance, dict of ship: {player key: combo points}
+        '''
+        if player_keys is None:
+            player_keys = player_list
+
+        # group the slot numbers by ship, ie {'Kleber': [5, 6], ...}, in order of first appearance
+        ship_slots = {}
+        for slot in range(len(self.target_ship_lineup)):
+            ship_slots.setdefault(self.target_ship_lineup[slot], []).append(slot)
+
+        # combo points for each player who owns each ship, so each combo is only scored once
+        player_key = {player_list[i]: player_keys[i] for i in range(len(player_list))}
+        ship_points = {}
+        for ship in ship_slots:
+            ship_points[ship] = {player_key[player]: Lineup.get_combo_points(player, ship) for player in self.get_list_players_owning_ship(ship, player_list)}
+
+        return list(ship_slots.items()), ship_points
+
+    def count_distinct_lineups(self, player_count):
+        '''
+        '   This function counts the distinct lineups (valid or not) without generating them:
+        '   pick players for each group of same-ship slots from whoever is left
+        '   Parameters: number of players (int)     Returns: number of distinct lineups (int)
+        '''
+        total_count = 1
+        remaining_count = player_count
+        for ship in set(self.target_ship_lineup):
+            total_count *= math.comb(remaining_count, self.target_ship_lineup.count(ship))
+            remaining_count -= self.target_ship_lineup.count(ship)
+        return total_count
+
+    def generate_lineup_streaming(self, player_list, top_n=50, progress=None, cancel_event=None, progress_interval=0.1):
+        '''
+        '   This algorithm gives the same best lineups as generate_lineup, but it never stores every lineup.  Valid lineups
+        '   are streamed from stream_lineup_candidates, and only the best top_n are kept in a heap, so memory doesn't grow
+        '   with the number of players.
+        '   It can run on a background thread: every progress_interval seconds, progress is called with the fraction
+        '   done, the number of valid lineups so far, and the best lineups so far.  Setting cancel_event stops the search.
+        '   Parameters: list of Player objects, number of lineups to keep (int), optional progress function, 
+        '               optional threading.Event to cancel with, seconds between progress calls
+        '   Returns: same as generate_lineup (the top_n Lineups, sorted, as a LineupStore, or False, invalid count, total 
+        '            distinct count).  If it was cancelled, the best lineups found so far are returned and the invalid count is None
+        '''
+        # min heap of (score, -counter, players), so the worst kept lineup is on top and ties keep the earlier lineup
+        best_lineups = []
+        valid_count = 0
+        is_cancelled = False
+
+        # the search is split by the players picked for the first ship, so progress is the fraction of those done.
+        # the shards are searched in the same order stream_lineup_candidates would go, so the results are the same
+        ship_groups, ship_points = self.get_ship_group_points(player_list)
+        team_size = len(self.target_ship_lineup)
+        shards = [lineup for score, lineup in stream_scored_lineups(ship_groups[:1], ship_points, list(player_list), team_size)]
+        next_progress_time = time.monotonic() + progress_interval
+        shard_index = 0
+
+        def should_stop():
+            '''
+            '   Called by the search every few hundred steps, whether or not they found valid lineups (with few owners
+            '   most steps are dead ends), so cancelling and progress still respond quickly.  Returns: True to cancel
+            '''
+            nonlocal next_progress_time
+            if cancel_event is not None and cancel_event.is_set():
+                return True
+            if progress is not None and time.monotonic() >= next_progress_time:
+                progress(shard_index / len(shards), valid_count, self.get_sorted_lineups(best_lineups))
+                next_progress_time = time.monotonic() + progress_interval
+            return False
+
+        for shard_index in range(len(shards)):
+            first_pick = tuple(shards[shard_index][slot] for slot in ship_groups[0][1])
+            for score, players in stream_scored_lineups(ship_groups, ship_points, list(player_list), team_size, (first_pick,),
+                                                        should_stop if progress is not None or cancel_event is not None else None):
+                valid_count += 1
+                if len(best_lineups) < top_n:
+                    heapq.heappush(best_lineups, (score, -valid_count, players))
+                elif score > best_lineups[0][0]:
+                    heapq.heapreplace(best_lineups, (score, -valid_count, players))
+            # the search stops early when cancelled.  also check between shards, in case a shard is too small to check
+            if cancel_event is not None and cancel_event.is_set():
+                is_cancelled = True
+                break
+
+        # get the total number of distinct lineups
+        total_count = self.count_distinct_lineups(len(player_list))
+        bad_count = None if is_cancelled else total_count - valid_count
+
+        # print message about stats
+        if is_cancelled:
+            print(f"Cancelled after {valid_count} valid lineups were evaluated, out of {total_count} distinct lineups")
+        else:
+            print(f"{total_count} distinct lineups were checked: {bad_count} were invalid and {valid_count} were evaluated and compared against each other")
+
+        # check to see if there is no a valid lineup
+        if not best_lineups:
+            return False, bad_count, total_count
+
+        return self.get_sorted_lineups(best_lineups), bad_count, total_count
+
+    def get_sorted_lineups(self, best_lineups):
+        '''
+        '   This function sorts kept lineups best to worst (ties in the order they were found).  Lineup objects are only
+        '   made when each lineup is used, so a large top_n is cheap
+        '   Parameters: heap of (score, -counter, tuple of players)      Returns: LineupStore (used like a list of Lineups)
+        '''
+        # -counter is different for every lineup, so sorting the tuples never compares the players
+        return LineupStore(self, sorted(best_lineups, reverse=True))
+
+    def generate_lineup_cached(self, player_list, top_n=50, progress=None, cancel_event=None):
+        '''
+        '   This function gives the same results as generate_lineup_streaming, but remembers them in lineup_cache, so 
+        '   asking again for the same players and ship composition returns right away.  Cancelled runs aren't cached
+        '   Parameters: same as generate_lineup_streaming      Returns: same as generate_lineup_streaming
+        '''
+        key = self.get_lineup_cache_key(player_list, top_n)
+        cached = self.lineup_cache.get(key)
+        if cached is not None:
+            print("Using cached lineups for these players and ship composition")
+            return self.get_cached_lineups(cached, player_list)
+
+        lineups, bad_count, total_count = self.generate_lineup_streaming(player_list, top_n, progress, cancel_event)
+        if bad_count is not None:
+            # keep player IDs instead of Player objects, so the result is small and can be saved to disk
+            entries = [] if not lineups else [(score, -neg_lineup_id, tuple(player.player_id for player in players))
+                                              for score, neg_lineup_id, players in lineups.entries]
+            self.lineup_cache.put(key, (tuple(lineups.ship_lineup if lineups else self.target_ship_lineup), entries, bad_count, total_count))
+        return lineups, bad_count, total_count
+
+    def get_cached_lineups(self, cached, player_list):
+        '''
+        '   This function rebuilds generate_lineup_streaming's results from a lineup_cache result.  The cached lineups
+        '   can be for the same ships in a different slot order, so each lineup's players are moved to the current
+        '   target_ship_lineup's slots for their ships
+        '   Parameters: cached result (see generate_lineup_cached), list of Player objects
+        '   Returns: same as generate_lineup_streaming
+        '''
+        cached_ship_lineup, entries, bad_count, total_count = cached
+        if not entries:
+            return False, bad_count, total_count
+
+        players_by_id = {player.player_id: player for player in player_list}
+        ship_lineup = self.target_ship_lineup
+        lineup_entries = []
+        for score, lineup_id, player_ids in entries:
+            if tuple(ship_lineup) != cached_ship_lineup:
+                # ship: the players in that ship's slots, in slot order
+                ship_players = {}
+                for slot in range(len(cached_ship_lineup)):
+                    ship_players.setdefault(cached_ship_lineup[slot], []).append(player_ids[slot])
+                player_ids = [ship_players[ship].pop(0) for ship in ship_lineup]
+            lineup_entries.append((score, -lineup_id, tuple(players_by_id[player_id] for player_id in player_ids)))
+        return LineupStore(self, lineup_entries), bad_count, total_count
+
+    def get_lineup_cache_key(self, player_list, top_n):
+        '''
+        '   This function makes the lineup_cache key for a set of players: a hash of everything the lineups depend on.
+        '   The player order and slot order of the ships don't change the lineups' scores, so they're sorted (only
+        '   which of the lineups tied with the worst kept one are kept, and the order of ties, can be different)
+        '   Parameters: list of Player objects, number of lineups kept (int)     Returns: key (string)
+        '''
+        key_data = {'players': sorted(player.player_id for player in player_list),
+                    'composition': sorted(self.target_ship_lineup),
+                    'weights': Lineup.get_weights(),
+                    'roster_version': self.get_roster_data_version(player_list),
+                    'top_n': top_n}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def get_roster_data_version(self, player_list):
+        '''
+        '   This function gets a version of the roster data used to score lineups of these players: a hash of which
+        '   composition ships each player owns and their preferences for them.  It changes when a roster update or
+        '   the admirals change any of that, and stays the same across restarts if nothing changed
+        '   Parameters: list of Player objects      Returns: version (string)
+        '''
+        ships = sorted(set(self.target_ship_lineup))
+        version_data = []
+        for player in sorted(player_list, key=lambda player: player.player_id):
+            player_ships = [[ship, player.ships[ship]['admiral_strong_preferred'], player.ships[ship]['admiral_weak_preferred'], 
+                             player.ships[ship]['player_preferred']] for ship in ships if ship in player.ships]
+            version_data.append([player.player_id, player.is_alpha_team, player_ships])
+        return hashlib.sha256(json.dumps(version_data).encode()).hexdigest()
+
+    def generate_lineup_parallel(self, player_list, top_n=50, workers=None, prefix_groups=2):
+        '''
+        '   This algorithm gives exactly the same results as generate_lineup_streaming, but splits the work across
+        '   several processes.  The lineups are split into shards by the players picked for the first few ship groups,
+        '   each process keeps the top_n lineups of its shards, and the results are merged at the end.
+        '   Parameters: list of Player objects, number of lineups to keep (int), number of processes (None for one per CPU),
+        '               number of ship groups used to split the shards (int)
+        '   Returns: same as generate_lineup (sorted list of the top_n Lineups or False, invalid count, total distinct count)
+        '''
+        # processes only get player indexes and points, not Player objects
+        player_indexes = list(range(len(player_list)))
+        ship_groups, ship_points = self.get_ship_group_points(player_list, player_indexes)
+        team_size = len(self.target_ship_lineup)
+
+        # each shard is one way of filling the first few ship groups, in the same order generate_lineup_streaming
+        # finds them.  streaming with only those groups gives every way of filling them
+        shards = []
+        for score, lineup in stream_scored_lineups(ship_groups[:prefix_groups], ship_points, player_indexes, team_size):
+            shards.append([tuple(lineup[slot] for slot in slots) for ship, slots in ship_groups[:prefix_groups]])
+
+        # score the shards in other processes, keeping the results in shard order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(evaluate_lineup_shard, ship_groups, ship_points, player_indexes, team_size, shard, top_n) for shard in shards]
+            shard_results = [future.result() for future in futures]
+
+        # merge the shards.  the lineup ID is its number out of all valid lineups, same as generate_lineup_streaming,
+        # so ties are broken by the order the lineups would have been found in one process
+        candidates = []
+        valid_count = 0
+        for shard_lineups, shard_valid_count in shard_results:
+            for score, counter, lineup in shard_lineups:
+                candidates.append((-score, valid_count + counter, lineup))
+            valid_count += shard_valid_count
+        best_lineups = heapq.nsmallest(top_n, candidates)
+
+        # get the total number of distinct lineups
+        total_count = self.count_distinct_lineups(len(player_list))
+        bad_count = total_count - valid_count
+
+        # print message about stats
+        print(f"{total_count} distinct lineups were checked in {len(shards)} shards: {bad_count} were invalid and {valid_count} were evaluated and compared against each other")
+
+        # check to see if there is no a valid lineup
+        if not best_lineups:
+            return False, bad_count, total_count
+
+        return [Lineup([player_list[i] for i in lineup], self, lineup_id) for neg_score, lineup_id, lineup in best_lineups], bad_count, total_count
+
+    def generate_lineup_vectorized(self, player_list, top_n=50, batch_size=100000):
+        '''
+        '   This algorithm gives the same results as generate_lineup_streaming, but builds and scores the lineups in 
+        '   large NumPy batches instead of one at a time.  Like the streaming search, players are only picked for ships
+        '   they own: each group of same-ship slots is filled from the combinations of that ship's owners, and a batch
+        '   of partial lineups is joined with every combination at once, dropping rows that use a player twice.  The
+        '   slot x player score matrix is built once, and only the best top_n lineups are kept between batches.
+        '   Parameters: list of Player objects, number of lineups to return (int, None for all valid lineups), max rows per batch
+        '   Returns: same as generate_lineup_streaming (LineupStore of the best lineups or False, invalid count, total distinct count)
+        '''
+        # NumPy is optional, so use the streaming algorithm if it isn't installed
+        if get_numpy() is None:
+            print("NumPy is not installed, using generate_lineup_streaming instead of generate_lineup_vectorized")
+            return self.generate_lineup_streaming(player_list, top_n if top_n is not None else self.count_distinct_lineups(len(player_list)))
+
+        team_size = len(self.target_ship_lineup)
+
+        # slot x player matrix of combo points (-inf if the player doesn't own the ship)
+        score_matrix = np.array(self.get_score_matrix(player_list), dtype=float).reshape(team_size, len(player_list))
+        slot_index = np.arange(team_size)
+
+        # for each group of same-ship slots (in the same order as the streaming search), every combination of that 
+        # ship's owners as a (combinations x slots) array of player indexes
+        ship_groups, ship_points = self.get_ship_group_points(player_list, list(range(len(player_list))))
+        group_picks = []
+        for ship, slots in ship_groups:
+            owners = sorted(ship_points[ship])
+            group_picks.append(np.fromiter(chain.from_iterable(combinations(owners, len(slots))), dtype=np.intp).reshape(-1, len(slots)))
+
+        def fill_ship_groups(lineups, group_index):
+            '''
+            '   fill the next group of same-ship slots for a batch of partial lineups, a few rows at a time so no joined
+            '   batch is bigger than batch_size.  yields batches of full lineups in the same order as the streaming search
+            '''
+            if group_index == len(ship_groups):
+                yield lineups
+                return
+            slots = ship_groups[group_index][1]
+            filled_slots = [slot for ship, group_slots in ship_groups[:group_index] for slot in group_slots]
+            picks = group_picks[group_index]
+            rows_per_batch = max(1, batch_size // max(1, len(picks)))
+            for first_row in range(0, len(lineups), rows_per_batch):
+                # every partial lineup in this chunk, joined with every combination of owners
+                chunk = lineups[first_row:first_row + rows_per_batch]
+                joined = np.repeat(chunk, len(picks), axis=0)
+                joined_picks = np.tile(picks, (len(chunk), 1))
+                joined[:, slots] = joined_picks
+
+                # drop rows where a picked player is already in the lineup
+                is_distinct = np.ones(len(joined), dtype=bool)
+                for slot in filled_slots:
+                    is_distinct &= (joined_picks != joined[:, [slot]]).all(axis=1)
+                joined = joined[is_distinct]
+                if len(joined):
+                    yield from fill_ship_groups(joined, group_index + 1)
+
+        # batches of the best lineups so far: their scores, lineup IDs (the order they were found in) and player indexes
+        best_scores = []
+        best_ids = []
+        best_lineups = []
+        kept_count = 0
+        valid_count = 0
+
+        for lineups in fill_ship_groups(np.zeros((1, team_size), dtype=np.intp), 0):
+            # add up each slot's points in slot order, the same as Lineup, so the scores are exactly the same
+            slot_points = score_matrix[slot_index, lineups]
+            scores = slot_points[:, 0].copy()
+            for slot in range(1, team_size):
+                scores += slot_points[:, slot]
+            ids = valid_count + 1 + np.arange(len(lineups))
+            valid_count += len(lineups)
+
+            # keep the best top_n: highest score first, then the earliest found
+            best_scores.append(scores)
+            best_ids.append(ids)
+            best_lineups.append(lineups)
+            kept_count += len(lineups)
+            if top_n is not None and kept_count > top_n:
+                scores, ids, lineups = np.concatenate(best_scores), np.concatenate(best_ids), np.concatenate(best_lineups)
+                keep = np.lexsort((ids, -scores))[:top_n]
+                best_scores, best_ids, best_lineups = [scores[keep]], [ids[keep]], [lineups[keep]]
+                kept_count = len(keep)
+
+        # get the total number of distinct lineups
+        total_count = self.count_distinct_lineups(len(player_list))
+        bad_count = total_count - valid_count
+
+        # print message about stats
+        print(f"{total_count} distinct lineups were checked: {bad_count} were invalid and {valid_count} were evaluated and compared against each other")
+
+        # check to see if there is no a valid lineup
+        if valid_count == 0:
+            return False, bad_count, total_count
+
+        # sort best to worst (ties in the order they were found).  Lineup objects are only made when they're used
+        best_scores, best_ids, best_lineups = np.concatenate(best_scores), np.concatenate(best_ids), np.concatenate(best_lineups)
+        order = np.lexsort((best_ids, -best_scores))
+        entries = [(float(best_scores[k]), -int(best_ids[k]), tuple(player_list[i] for i in best_lineups[k])) for k in order]
+        return LineupStore(self, entries), bad_count, total_count
+
+    def generate_best_lineup(self, player_list):
+        '''
+        '   This algorithm finds the single best lineup without generating every permutation.  Slotting players into
+        '   ships is treated as an assignment problem (ship slots on one side, players on the other, combo points as 
+        '   the weights), which is solved in polynomial time.  It gives the same best score as generate_lineup.
+        '   Parameters: a list of player objects (can be longer than the target ship lineup)
+        '   Returns: a Lineup object, or False if the players cannot form the target ship lineup
+        '''
+        # get the slot x player matrix of combo points
+        score_matrix = self.get_score_matrix(player_list)
+
+        # solve the assignment problem: which player goes in each slot
+        best_score, assignment = solve_assignment(score_matrix)
+
+        # no valid assignment means no valid lineup
+        if assignment is None:
+            return False
+
+        # put the chosen players in slot order and build the Lineup (this also re-scores it)
+        return Lineup([player_list[j] for j in assignment], self, 1)
+
+    def generate_lineup_branch_and_bound(self, player_list):
+        '''
+        '   This algorithm finds the best lineup with a branch and bound search.  Slots are filled rarest ship first,
+        '   and a partial lineup is dropped as soon as a slot has no owning player left, or as soon as even the best 
+        '   possible players for the remaining slots couldn't beat the best lineup found so far.
+        '   Parameters: a list of player objects
+        '   Returns: a Lineup object (or False if there is no valid lineup), and the number of search nodes visited
+        '''
+
+        #   Here's how the algorithm works:
+        #   1. Order the slots from rarest to most common ship (using get_ordered_rare_ship_list)
+        #   2. For each ship, list its owners from most to least combo points, so good lineups are found early
+        #   3. Fill one slot at a time, trying each remaining owner of that slot's ship
+        #   4. Before going deeper, add up the points of the best remaining owner for every unfilled slot.  This is
+        #      an upper bound on what this partial lineup could score, so if it can't beat the best lineup so far, drop it
+        #   5. When every slot is filled, keep the lineup if it is the best so far
+
+        # get slot numbers in order of rarest to most common ship
+        slot_order = []
+        for ship in self.get_ordered_rare_ship_list(player_list):
+            for slot in range(len(self.target_ship_lineup)):
+                if self.target_ship_lineup[slot] == ship and slot not in slot_order:
+                    slot_order.append(slot)
+                    break
+
+        # for each ship, the owners and their combo points, best first
+        player_index = {player: i for i, player in enumerate(player_list)}
+        ship_owners = {}
+        for ship in set(self.target_ship_lineup):
+            owners = [(Lineup.get_combo_points(player, ship), player_index[player]) for player in self.get_list_players_owning_ship(ship, player_list)]
+            owners.sort(key=lambda x: x[0], reverse=True)
+            ship_owners[ship] = owners
+
+        # the player index picked for each slot, which players are used, and the best lineup so far
+        lineup = [None] * len(self.target_ship_lineup)
+        used_players = [False] * len(player_list)
+        best = {'score': -math.inf, 'lineup': None, 'nodes': 0}
+
+        def get_upper_bound(depth):
+            ''' add up the best remaining owner's points for each unfilled slot '''
+            bound = 0
+            for slot in slot_order[depth:]:
+                for points, player in ship_owners[self.target_ship_lineup[slot]]:
+                    if not used_players[player]:
+                        bound += points
+                        break
+                else:
+                    # no owner left for this slot
+                    return -math.inf
+            return bound
+
+        def search(depth, score):
+            ''' fill the slot at this depth with each remaining owner, then search the next slot '''
+            best['nodes'] += 1
+
+            # every slot is filled, keep it if it's the best so far
+            if depth == len(slot_order):
+                if score > best['score']:
+                    best['score'] = score
+                    best['lineup'] = list(lineup)
+                return
+
+            # drop this partial lineup if it can't beat the best so far (or a slot can't be filled)
+            if score + get_upper_bound(depth) <= best['score']:
+                return
+
+            slot = slot_order[depth]
+            ship = self.target_ship_lineup[slot]
+            # if the previous slot was the same ship, only pick players after that one so swapped players aren't tried twice
+            if depth > 0 and self.target_ship_lineup[slot_order[depth-1]] == ship:
+                min_player = lineup[slot_order[depth-1]] + 1
+            else:
+                min_player = 0
+
+            for points, player in ship_owners[ship]:
+                if not used_players[player] and player >= min_player:
+                    used_players[player] = True
+                    lineup[slot] = player
+                    search(depth + 1, score + points)
+                    used_players[player] = False
+                    lineup[slot] = None
+
+        search(0, 0)
+
+        # print message about stats
+        print(f"Branch and bound search visited {best['nodes']} nodes")
+
+        if best['lineup'] is None:
+            return False, best['nodes']
+        return Lineup([player_list[i] for i in best['lineup']], self, 1), best['nodes']
+
+    def generate_top_k_lineups(self, player_list, k):
+        '''
+        '   This algorithm finds the k best lineups, in best to worst order, without generating every permutation.
+        '   It uses Murty's algorithm for ranking assignments, so the work grows with k instead of with n!
+        '   Parameters: a list of player objects (can be longer than the target ship lineup), number of lineups (int)
+        '   Returns: list of up to k Lineup objects, or False if the players cannot form the target ship lineup
+        '''
+
+        #   Here's how the algorithm works:
+        #   1. Solve the assignment problem for the best lineup, and put it in a priority queue (the frontier)
+        #   2. Pop the best lineup from the frontier and add it to the results
+        #   3. Split the rest of the possible lineups into smaller groups that don't overlap: for each ship/player
+        #      pair in the popped lineup, one group keeps the pairs before it but bans that pair
+        #   4. Solve the best lineup of each group and push it onto the frontier
+        #   5. Repeat from step 2 until we have k lineups or the frontier is empty
+        #   Working with ship/player pairs instead of slot/player pairs means two players swapping the same 
+        #   ship (ie both Klebers) is not counted as a different lineup
+
+        # get the slot x player matrix of combo points
+        score_matrix = self.get_score_matrix(player_list)
+
+        # solve for the best lineup
+        best_score, assignment = solve_assignment(score_matrix)
+        if assignment is None:
+            return False
+
+        # frontier entries are (negative score, counter, assignment, forced ship/player pairs, excluded ship/player pairs)
+        # the counter breaks ties so that equal scores come out in the order they were found
+        frontier = [(-best_score, 0, assignment, [], [])]
+        counter = 1
+
+        # list of lineups to return
+        lineups = []
+
+        while frontier and len(lineups) < k:
+            # get the next best lineup, the lineup ID is its rank
+            neg_score, _, assignment, forced, excluded = heapq.heappop(frontier)
+            lineups.append(Lineup([player_list[j] for j in assignment], self, len(lineups)+1))
+
+            # split the rest of this group into smaller groups
+            new_forced = list(forced)
+            for row in range(len(score_matrix)):
+                pair = (self.target_ship_lineup[row], assignment[row])
+                # pairs that are already forced can't be split on
+                if pair in forced:
+                    continue
+
+                # this group bans the popped lineup's pair
+                new_excluded = excluded + [pair]
+                sub_score, sub_assignment = solve_assignment(self.constrain_score_matrix_by_ship(score_matrix, new_forced, new_excluded))
+                if sub_assignment is not None:
+                    heapq.heappush(frontier, (-sub_score, counter, sub_assignment, new_forced, new_excluded))
+                    counter += 1
+
+                # later groups keep the popped lineup's pair
+                new_forced = new_forced + [pair]
+
+        return lineups
+
+    def constrain_score_matrix_by_ship(self, score_matrix, forced, excluded):
+        '''
+        '   This function turns forced/excluded ship/player pairs into slot/player pairs and applies them to a score matrix.
+        '   A forced pair takes the next free slot of that ship, and an excluded pair bans the player from every slot of that ship.
+        '   Parameters: score matrix, forced and excluded (lists of (ship name, player column))
+        '   Returns: new score matrix (see constrain_score_matrix)
+        '''
+        # put each forced player into the first slot of that ship that hasn't been used yet
+        forced_slots = []
+        used_slots = []
+        for ship, column in forced:
+            for slot in range(len(self.target_ship_lineup)):
+                if self.target_ship_lineup[slot] == ship and slot not in used_slots:
+                    used_slots.append(slot)
+                    forced_slots.append((slot, column))
+                    break
+
+        # ban each excluded player from every slot of that ship
+        excluded_slots = []
+        for ship, column in excluded:
+            for slot in range(len(self.target_ship_lineup)):
+                if self.target_ship_lineup[slot] == ship:
+                    excluded_slots.append((slot, column))
+
+        return constrain_score_matrix(score_matrix, forced_slots, excluded_slots)
+
+    def check_lineup_feasibility(self, player_list):
+        '''
+        '   This function checks if the players can fill every slot of the target ship lineup, without scoring anything.
+        '   It finds a maximum matching of slots to players who own the slot's ship.  If some slots can't be filled,
+        '   it reports a group of slots that have fewer owning players than slots (Hall's theorem).
+        '   Parameters: list of Player objects
+        '   Returns: True/False, and a message explaining why the lineup can't be filled (empty string if it can)
+        '''
+        # quick check first: every ship needs at least as many owners as times it appears in the lineup
+        ship_dict = self.get_dict_players_with_ships(player_list)
+        for ship in ship_dict:
+            if ship_dict[ship] < self.target_ship_lineup.count(ship):
+                owners = self.get_list_players_owning_ship(ship, player_list)
+                return False, get_feasibility_message(owners, [ship] * self.target_ship_lineup.count(ship))
+
+        # for each slot, get the index of each player who owns the ship
+        player_index = {player: i for i, player in enumerate(player_list)}
+        slot_owners = []
+        for ship in self.target_ship_lineup:
+            slot_owners.append([player_index[player] for player in self.get_list_players_owning_ship(ship, player_list)])
+
+        # the slot each player is matched with (None if the player isn't matched)
+        player_match = [None] * len(player_list)
+
+        def find_augmenting_path(slot, visited):
+            ''' try to match this slot, moving other slots to different players if needed '''
+            for player in slot_owners[slot]:
+                if player not in visited:
+                    visited.add(player)
+                    if player_match[player] is None or find_augmenting_path(player_match[player], visited):
+                        player_match[player] = slot
+                        return True
+            return False
+
+        # try to match each slot, remembering which slots couldn't be matched
+        unmatched_slots = []
+        for slot in range(len(self.target_ship_lineup)):
+            if not find_augmenting_path(slot, set()):
+                unmatched_slots.append(slot)
+
+        # every slot matched means the lineup can be filled
+        if not unmatched_slots:
+            return True, ''
+
+        # otherwise, find every slot that can be reached from an unmatched slot by alternating between
+        # "a player who owns the slot's ship" and "the slot that player is matched with".  these slots 
+        # only have the reached players to fill them, and there are fewer players than slots
+        witness_slots = list(unmatched_slots)
+        witness_players = []
+        for slot in witness_slots:                  # the list grows while we iterate through it
+            for player in slot_owners[slot]:
+                if player not in witness_players:
+                    witness_players.append(player)
+                    witness_slots.append(player_match[player])
+
+        return False, get_feasibility_message([player_list[i] for i in witness_players], 
+                                              [self.target_ship_lineup[slot] for slot in sorted(witness_slots)])
+
+    def generate_best_compositions(self, player_list, compositions, top_n=10):
+        '''
+        '   This algorithm picks the best ship compositions for the players, not just the best lineup for one composition.
+        '   The work that doesn't depend on the composition is done once and shared: each ship's owners are stored as a
+        '   bitset (one bit per player), and each ship's combo points are scored once per player.  Each composition also
+        '   gets an upper bound on its score: for each ship, the points of its best owners (one per slot), ignoring that
+        '   a player can only be in one slot.  Compositions are solved as assignment problems best bound first, and the
+        '   search stops as soon as no bound left can beat the top_n best scores, so most compositions are never solved.
+        '   With rules, compositions are built in bound order from each ship type's groups of ships, so the millions
+        '   of compositions that rules can make aren't all built either.
+        '   Parameters: list of Player objects, compositions (list of lists of ship names, or a dict of rules for
+        '               get_compositions_from_rules ie {'Battleship': 2, 'Cruiser': 4, 'Destroyer': 2}), number of results (int)
+        '   Returns: list of up to top_n (composition, Lineup) pairs, best to worst (compositions with the same score
+        '            in the order they were solved)
+        '''
+        # each "part" is a list of groups of ships, and a composition is one group from each part.  rules have one part
+        # per ship type, and a list of compositions is one part with each composition as a group
+        if isinstance(compositions, dict):
+            parts = self.get_composition_type_groups(compositions, player_list)
+        else:
+            parts = [[list(composition) for composition in compositions]]
+
+        # shared work: combo points of every player for each ship, the best owners' points for each ship and number of
+        # slots, and owner bitsets, all made the first time a ship is needed
+        ship_points = {}
+        ship_bounds = {}
+
+        def get_group_bound(ships):
+            ''' upper bound on the points of a group of ships: each ship's best owners, one per slot (-inf if too few owners) '''
+            bound = 0
+            for ship in set(ships):
+                count = ships.count(ship)
+                if (ship, count) not in ship_bounds:
+                    if ship not in ship_points:
+                        ship_points[ship] = [Lineup.get_combo_points(player, ship) for player in player_list]
+                    best_points = sorted((points for points in ship_points[ship] if points != -math.inf), reverse=True)[:count]
+                    ship_bounds[(ship, count)] = sum(best_points) if len(best_points) == count else -math.inf
+                bound += ship_bounds[(ship, count)]
+            return bound
+
+        # each part's groups, best bound first (groups that can't be filled are dropped)
+        sorted_parts = []
+        for groups in parts:
+            bounded_groups = [(get_group_bound(group), group) for group in groups]
+            sorted_parts.append(sorted([bounded_group for bounded_group in bounded_groups if bounded_group[0] != -math.inf], 
+                                       key=lambda bounded_group: bounded_group[0], reverse=True))
+        if not all(sorted_parts):
+            print("No composition could be filled by the players")
+            return []
+        owner_bits = self.get_ship_owner_bits(set(ship for part in sorted_parts for bound, group in part for ship in group), player_list)
+
+        # max heap (by negative bound) of compositions to try, as the position of the group picked from each part.  
+        # popping one adds the compositions with one of its groups moved one down, so they come out in bound order
+        start = (0,) * len(sorted_parts)
+        to_try = [(-sum(part[0][0] for part in sorted_parts), start)]
+        seen = {start}
+
+        # min heap of (score, -counter, composition, assignment), so ties keep the earlier composition
+        best_compositions = []
+        counter = 0
+        checked_count = 0
+        while to_try:
+            negative_bound, positions = heapq.heappop(to_try)
+            # nothing left can beat the top_n best scores (with some room for rounding)
+            if len(best_compositions) == top_n and -negative_bound <= best_compositions[0][0] + 1e-9:
+                break
+
+            for i in range(len(positions)):
+                if positions[i] + 1 < len(sorted_parts[i]):
+                    next_positions = positions[:i] + (positions[i] + 1,) + positions[i+1:]
+                    if next_positions not in seen:
+                        seen.add(next_positions)
+                        heapq.heappush(to_try, (-sum(sorted_parts[j][next_positions[j]][0] for j in range(len(next_positions))), next_positions))
+
+            # skip compositions that the owners can't possibly fill
+            composition = [ship for i in range(len(positions)) for ship in sorted_parts[i][positions[i]][1]]
+            checked_count += 1
+            if not is_composition_possible(composition, owner_bits):
+                continue
+
+            # solve the best lineup for this composition, using the shared combo points as the rows
+            score, assignment = solve_assignment([ship_points[ship] for ship in composition])
+            if assignment is None:
+                continue
+
+            counter += 1
+            if len(best_compositions) < top_n:
+                heapq.heappush(best_compositions, (score, -counter, composition, assignment))
+            elif score > best_compositions[0][0]:
+                heapq.heapreplace(best_compositions, (score, -counter, composition, assignment))
+
+        # print message about stats
+        print(f"{checked_count} compositions were checked in best bound order: {counter} were solved and could be filled by the players")
+
+        # best to worst, with each composition's best Lineup
+        best_compositions.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        return [(composition, Lineup([player_list[j] for j in assignment], self, i+1, composition)) 
+                for i, (score, neg_counter, composition, assignment) in enumerate(best_compositions)]
+
+    def generate_team_lineups(self, team_compositions, player_list=None, prioritize_first_team=False):
+        '''
+        '   This algorithm splits players into several clan battle teams that play at the same time, so no player is
+        '   in two teams.  All of the teams' slots are put into one assignment problem, so even a 50 player roster
+        '   is solved in well under a second.
+        '   By default the combined score of all teams is as high as possible.  With prioritize_first_team, the first team
+        '   gets the best score it can, then the second team gets the best score it can with who's left, and so on
+        '   (as long as every team can still be filled).
+        '   Parameters: list of compositions (one list of ship names per team), list of Player objects (defaults to
+        '               the active players in the roster), prioritize_first_team (boolean)
+        '   Returns: list of Lineup objects (one per team, lineup ID is the team number), or False if the teams can't be filled
+        '''
+        # default to every active player in the roster
+        if player_list is None:
+            player_list = [player for player in self.roster.values() if player.is_active]
+
+        # one row per slot of every team, one column per player
+        team_matrices = []
+        for composition in team_compositions:
+            team_matrices.append([[Lineup.get_combo_points(player, ship) for player in player_list] for ship in composition])
+
+        # to prioritize the first team, each team's points are scaled so that a better score for an earlier team
+        # always beats any score for the later teams.  this needs the biggest possible difference between two scores for each team,
+        # and the smallest: points are made whole numbers of millionths first, so two different team scores are at least 1
+        # apart (differences smaller than a millionth count as ties).  Python ints don't round, however big they get
+        if prioritize_first_team:
+            team_matrices = [[[round(score * 10**6) if score != -math.inf else score for score in row] for row in team] for team in team_matrices]
+            finite_scores = [score for team in team_matrices for row in team for score in row if score != -math.inf]
+            score_spread = (max(finite_scores) - min(finite_scores)) if finite_scores else 0
+            scale = 1
+            for t in range(len(team_matrices)-1, -1, -1):
+                team_matrices[t] = [[score * scale for score in row] for row in team_matrices[t]]
+                scale *= len(team_compositions[t]) * score_spread + 1
+
+        # solve all teams at once
+        score_matrix = [row for team in team_matrices for row in team]
+        score, assignment = solve_assignment(score_matrix)
+        if assignment is None:
+            return False
+
+        # split the assignment back into teams
+        lineups = []
+        first_row = 0
+        for t in range(len(team_compositions)):
+            team_assignment = assignment[first_row:first_row + len(team_compositions[t])]
+            lineups.append(Lineup([player_list[j] for j in team_assignment], self, t+1, team_compositions[t]))
+            first_row += len(team_compositions[t])
+
+        return lineups
+
+    def get_compositions_from_rules(self, rules, player_list):
+        '''
+        '   This function builds every ship composition that follows the rules, using the ships in WOWsGame.game_ships.
+        '   Compositions that the players can't possibly fill (not enough owners) are left out.  Rules can make millions
+        '   of compositions, so generate_best_compositions doesn't use this, it builds them in order from 
+        '   get_composition_type_groups instead
+        '   Parameters: dict of ship type: number of ships, ie {'Battleship': 2, 'Cruiser': 4, 'Destroyer': 2}, list of Player objects
+        '   Returns: list of compositions (lists of ship names)
+        '''
+        type_groups = self.get_composition_type_groups(rules, player_list)
+        owner_bits = self.get_ship_owner_bits(set(ship for groups in type_groups for group in groups for ship in group), player_list)
+
+        # put one group of each type together, and keep it if the players could fill the whole composition
+        compositions = []
+        for groups in product(*type_groups):
+            composition = [ship for ships in groups for ship in ships]
+            if is_composition_possible(composition, owner_bits):
+                compositions.append(composition)
+
+        return compositions
+
+    def get_composition_type_groups(self, rules, player_list):
+        '''
+        '   This function builds, for each ship type in the rules, every group of ships of that type (repeats allowed) 
+        '   that the players could fill, using the ships in WOWsGame.game_ships
+        '   Parameters: dict of ship type: number of ships, ie {'Battleship': 2, 'Cruiser': 4, 'Destroyer': 2}, list of Player objects
+        '   Returns: list with one list of groups (lists of ship names) per ship type, in the rules' order
+        '''
+        # owner bitsets for every game ship
+        game_ship_names = [ship['name'] for ship in self.game_info.game_ships.values()]
+        owner_bits = self.get_ship_owner_bits(game_ship_names, player_list)
+
+        type_groups = []
+        for ship_type, count in rules.items():
+            type_ships = sorted(set(ship['name'] for ship in self.game_info.game_ships.values() if ship['type'] == ship_type and owner_bits[ship['name']]))
+            type_groups.append([list(ships) for ships in combinations_with_replacement(type_ships, count) if is_composition_possible(ships, owner_bits)])
+        return type_groups
+
+    def get_ship_owner_bits(self, ship_names, player_list):
+        '''
+        '   This function stores which players own each ship as a bitset: bit i is set if player_list[i] owns the ship
+        '   Parameters: ship names (strings), list of Player objects
+        '   Returns: dict of ship name: bitset (int)
+        '''
+        player_index = {player: i for i, player in enumerate(player_list)}
+        owner_bits = {}
+        for ship in ship_names:
+            bits = 0
+            for player in self.get_list_players_owning_ship(ship, player_list):
+                bits |= 1 << player_index[player]
+            owner_bits[ship] = bits
+        return owner_bits
+
+    def get_score_matrix(self, player_list):
+        '''
+        '   This function builds a matrix of combo points for every ship slot and player pairing
+        '   Parameters: list of Player objects
+        '   Returns: nested list, one row per slot in target_ship_lineup and one column per player (-inf if not owned)
+        '''
+        return [[Lineup.get_combo_points(player, ship) for player in player_list] for ship in self.target_ship_lineup]
+
     def get_list_players_owning_ship(self, ship_name, player_list):
         '''
         '   This function will return a list of players in a given list who own a ship
-        '   Parameters: ship_name (string) and list of Player objects
-        '   Return: list of Player objects who own the ship
+        '   Parameters: ship_name (string) and list of Player objects from the roster
+        '   Return: list of Player objects who own the ship, in player_list order
         '''
-        # setup return list of players
-        return_list = []
-        # interate through players in player list
-        for player in player_list:
-            if ship_name in player.ships.keys():
-                return_list.append(player)
-        
-        # return return list
-        return return_list
+        # the owner index only knows roster players, so anyone else would silently look like they own nothing
+        unknown_ids = [player.player_id for player in player_list if player.player_id not in self.roster]
+        if unknown_ids:
+            raise KeyError(f'players {unknown_ids} are not in the {self.clan_tag} roster')
+        # check each player against the ship's set of owners
+        owner_ids = self.ship_owner_ids.get(ship_name, set())
+        return [player for player in player_list if player.player_id in owner_ids]
 
     def get_ordered_rare_ship_list(self, player_list):
         ''' 
@@ -825,47 +3027,162 @@ class Clan2:
                 pass
             # else if ship is not in dictionary
             else: 
-                # init counter to 0
-                counter = 0
-                # iterate through players
-                for player in player_list:
-                    # check to see if player has that ship
-                    if ship in player.ships.keys():
-                        # increment counter if ship is there
-                        counter += 1
-                # add that ship to dictionary as a key with the number of players as the value
-                return_dict[ship] = counter
+                # add that ship to dictionary as a key with the number of players who own it as the value
+                return_dict[ship] = len(self.get_list_players_owning_ship(ship, player_list))
             
         # return return dict
         return return_dict
 
-    def update_roster(self):
+    def get_member_ids(self):
         '''
-        '   A function that will update the roster of players when given a clan tag
-        '
+        '   A function that gets the player IDs of the clan's members from the WG API.  It's used to refresh the
+        '   roster, so a cached response isn't used
+        '   Returns: list of player IDs (None if the request failed)
         '''
-        # get ship info (all ships, with tier, name, type, and available upgrades)
-        response = requests.get(f"https://api.worldofwarships.{self.game_info.region}/wows/clans/info/?application_id={self.game_info.api_key}&clan_id={self.clan_id}")
-        query = json.loads(response.text)
+        # get clan info, including the member ids
+        query = self.game_info.api_client.get('clans/info/', {'clan_id': self.clan_id}, use_cache=False)
 
         # verify query worked
         try:
             # attempt to get page count for querying wiki
             if query['status'] == "ok":
                 print("Updating clan player roster from WG servers...data pull successful.")
+            else:
+                print(f"Error getting roster from WG API: {query['error']}.  This error thrown from get_member_ids method")
+                return None
+            return query['data'][str(self.clan_id)]['members_ids']
         except:
-            print("Error getting roster from WG API.  This error thrown from update_roster method")
+            print("Error getting roster from WG API.  This error thrown from get_member_ids method")
+            return None
+
+    def update_roster(self):
+        '''
+        '   A function that will update the roster of players when given a clan tag
+        '
+        '''
+        # get the clan's member ids
+        member_ids = self.get_member_ids()
+        if member_ids is None:
             return
 
         # empty object to return
         players = {}
 
         # iterate through member ids, create new player for each
-        for player_id in query['data'][str(self.clan_id)]['members_ids']:
+        for player_id in member_ids:
             players[player_id] = Player2(player_id, self.game_info)
 
-        # store players
-        save_obj(players, "clan_roster")
+        # store players, and use them as the roster
+        self.game_info.store.save_roster(self.clan_id, players)
+        self.set_roster(players)
+
+        # return players
+        return players
+
+    def update_roster_bulk(self):
+        '''
+        '   A faster version of update_roster.  Basic account info for every member is pulled in one request (up to 
+        '   100 players per request) instead of one request per player.  Ship stats still take one request per
+        '   player, since the ships/stats endpoint only takes one account ID, but those requests are sent concurrently.
+        '''
+        # get the clan's member ids
+        member_ids = self.get_member_ids()
+        if member_ids is None:
+            return
+
+        # get every member's account info and ship stats at once
+        account_infos = self.game_info.get_account_info_bulk(member_ids, use_cache=False)
+        ship_stats = self.game_info.get_ship_stats_bulk([player_id for player_id in member_ids if account_infos.get(str(player_id)) is not None], use_cache=False)
+
+        # empty object to return
+        players = {}
+
+        # iterate through member ids, create new player for each using the account info that was already pulled
+        for player_id in member_ids:
+            account_info = account_infos.get(str(player_id))
+            if account_info is None:
+                print(f"No account info returned for player {player_id}, skipping.  This error thrown from update_roster_bulk method")
+                continue
+            players[player_id] = Player2(player_id, self.game_info, account_info, ship_stats[str(player_id)])
+
+        # store players, and use them as the roster
+        self.game_info.store.save_roster(self.clan_id, players)
+        self.set_roster(players)
+
+        # return players
+        return players
+
+    def update_roster_incremental(self):
+        '''
+        '   A faster version of update_roster_bulk for a roster that was saved before.  Every member's account info is
+        '   pulled (cheap, up to 100 players per request), but ship stats are only pulled again for players whose
+        '   last_battle_time moved forward since the saved roster, and for new members.  Players who left the clan 
+        '   are dropped, and everyone else is reused from the saved roster.
+        '''
+        # get the clan's member ids
+        member_ids = self.get_member_ids()
+        if member_ids is None:
+            return
+
+        # get the saved roster, or the current one if there isn't a saved roster
+        previous_roster = self.game_info.store.load_roster(self.clan_id, self.game_info) or getattr(self, 'roster', None) or {}
+
+        # get every member's account info at once (not from the cache, or players who just played would be missed)
+        account_infos = self.game_info.get_account_info_bulk(member_ids, use_cache=False)
+
+        # find who needs new ship stats: new members, members who played since the saved roster, and members without
+        # a saved last battle time (their last pull failed).  hidden profiles don't give a last battle time, so 
+        # they're only pulled again if there's no saved one
+        changed_ids = []
+        for player_id in member_ids:
+            account_info = account_infos.get(str(player_id))
+            if account_info is None:
+                continue
+            last_battle_time = account_info.get('last_battle_time')
+            saved_last_battle_time = getattr(previous_roster.get(player_id), 'last_battle_time', None)
+            if saved_last_battle_time is None or (last_battle_time is not None and last_battle_time > saved_last_battle_time):
+                changed_ids.append(player_id)
+
+        # get ship stats for only those players
+        ship_stats = self.game_info.get_ship_stats_bulk(changed_ids, use_cache=False)
+
+        # empty object to return
+        players = {}
+        new_count = 0
+
+        # iterate through member ids, reusing saved players where possible
+        changed_id_set = set(changed_ids)
+        for player_id in member_ids:
+            account_info = account_infos.get(str(player_id))
+
+            if player_id in previous_roster:
+                # saved player, point them at the current game info
+                player = previous_roster[player_id]
+                player.game_info = self.game_info
+            elif account_info is not None:
+                # new member, start from an empty player and fill them in the same way as a saved player
+                player = Player2.from_stored_info(player_id, self.game_info, None, None, None, {})
+                new_count += 1
+            else:
+                print(f"No account info returned for player {player_id}, skipping.  This error thrown from update_roster_incremental method")
+                continue
+
+            # update whatever was pulled.  the new last battle time is only kept once the ship stats are updated too,
+            # otherwise a failed ships/stats pull would make the player look up to date and they'd never be pulled again
+            saved_last_battle_time = player.last_battle_time
+            if account_info is not None:
+                player.apply_account_info(account_info)
+            if player_id in changed_id_set and not player.apply_ship_stats(ship_stats.get(str(player_id))):
+                player.last_battle_time = saved_last_battle_time
+            players[player_id] = player
+
+        # some print messages about stats
+        departed_count = len([player_id for player_id in previous_roster if player_id not in players])
+        print(f"Roster refresh: {new_count} new players, {len(changed_ids) - new_count} players updated, {len(players) - len(changed_ids)} players unchanged, {departed_count} players left the clan")
+
+        # store players, and use them as the roster
+        self.game_info.store.save_roster(self.clan_id, players)
+        self.set_roster(players)
 
         # return players
         return players
@@ -876,7 +3193,7 @@ class Player2:
     '   Attributes: username_wg (string)
     '               username_discord (string)
     '               join_date (string), 
-    '               ships (nested dict)
+    '               ships (nested dict, keyed by ship name)
     '               is_active (boolean)
     '               is_alpha_team (boolean)
     '               overall_PR (int)
@@ -884,21 +3201,58 @@ class Player2:
     '               overall_avg_damage (int)
     '               main_ship_class (string)
     '               
-    '   Methods: __repr__
+    '   Methods: from_stored_info - rebuild a player from the game data store
+    '            __repr__
     '
     '''
-    def __init__(self, id, game_info):
+
+    # fields requested from the account/info and ships/stats endpoints
+    account_info_fields = ['last_battle_time', 'nickname', 'statistics.pvp.battles', 'statistics.pvp.wins']
+    ship_stats_fields = ['ship_id', 'pvp.battles', 'pvp.damage_dealt', 'pvp.wins']
+
+    def __init__(self, id, game_info, account_info=None, ship_stats=None):
         ''' 
         '   The init function for setting up a player
-        '   Parameters: list of strings (their line on the Google sheet)       
+        '   Parameters: player ID, WOWsGame object, and the player's account info and ships/stats response 
+        '               if they were already pulled from the WG API
         '   Returns: none (sets up their lists of ships and some other attributes)
         '''
 
         # ATTRIBUTES
         self.player_id = id                     # player ID from WG UI
         self.game_info = game_info              # store pointer to WOWsGame obj for access to ships and clans
-        self.update_player_api_info()
+        # only request the account info and ship stats if they weren't given
+        if account_info is None:
+            self.update_player_api_info()
+        else:
+            self.apply_account_info(account_info)
+            if ship_stats is None:
+                self.update_ship_stats()
+            else:
+                self.apply_ship_stats(ship_stats)
+
+        self.set_default_attributes()
 
+    @classmethod
+    def from_stored_info(cls, id, game_info, username_wg, last_battle_time, overall_WR, ships):
+        '''
+        '   Rebuild a player from the game data store, without any WG API requests
+        '   Parameters: player ID, WOWsGame object, stored username, last battle time, overall win rate and 
+        '               dict of ship ID: ship stats
+        '   Returns: Player2 object
+        '''
+        player = cls.__new__(cls)
+        player.player_id = id
+        player.game_info = game_info
+        player.username_wg = username_wg
+        player.last_battle_time = last_battle_time
+        player.overall_WR = overall_WR
+        player.ships = ships
+        player.set_default_attributes()
+        return player
+
+    def set_default_attributes(self):
+        ''' set the attributes that aren't pulled from the WG API '''
         # unused..will be specified through UI, if at all
         self.username_discord = ''              # Username within Discord      
         self.is_active = True                   # is player an active player
@@ -934,53 +3288,94 @@ class Player2:
         #                                 'ship_avg_damage': ship_avg_damage
         #                                 }
 
+    @staticmethod
+    def get_ship_entry(ship_id, ship_WR, ship_avg_damage, ship_battles):
+        '''
+        '   A function that builds the nested dict for one of the player's ships
+        '   Parameters: ship ID, and the player's win rate, average damage and battle count in the ship
+        '   Returns: dict of ship attributes.  preferences aren't in the WG API, so they start out False
+        '''
+        return {    #'is_ship_available': True,
+                    #'legendary': False, 
+                    'player_preferred': False, 
+                    'admiral_strong_preferred': False,
+                    'admiral_weak_preferred': False,
+                    #'ship_PR': ship_PR,
+                    'ship_id': ship_id,
+                    'ship_WR': ship_WR,
+                    'ship_avg_damage': ship_avg_damage,
+                    'ship_battles': ship_battles
+                }
+
     def update_player_api_info(self):
         '''
         '   A function that will get WG API info for a player: username, last logout, ships unlocked, etc
         '
         '''
-        # get ship info (all ships, with tier, name, type, and available upgrades)
-        response = requests.get(f"https://api.worldofwarships.{self.game_info.region}/wows/account/info/?application_id={self.game_info.api_key}&account_id={self.player_id}&fields=last_battle_time%2C+nickname%2C+statistics.pvp.battles%2C+statistics.pvp.wins")
-        query = json.loads(response.text)
+        # get basic account info
+        query = self.game_info.api_client.get('account/info/', {'account_id': self.player_id, 'fields': Player2.account_info_fields}, use_cache=False)
 
         # verify query worked
         try:
             if query['status'] == "ok":
                 print("Updating player basic info from WG servers...data pull successful.")
+            else:
+                print(f"Error getting player data from WG API: {query['error']}.  This error thrown from WOWsGame update_player_api_info method")
+                return
         except:
             print("Error getting player data from WG API.  This error thrown from WOWsGame update_player_api_info method")
             return
 
+        # update attributes, then ship stats
+        self.apply_account_info(query['data'][str(self.player_id)])
+        self.update_ship_stats()
+
+    def apply_account_info(self, account_info):
+        '''
+        '   A function that sets the player's attributes from their account/info data
+        '   Parameters: the player's dict from the account/info 'data' (see account_info_fields)
+        '''
         # update attributes
-        self.username_wg = query['data'][str(self.player_id)]['nickname']                       # user nickname
-        self.last_battle_time = query['data'][str(self.player_id)]['last_battle_time']          # time of last battle in timestamp ie 1528408800000 //  is 06/07/2018 @ 10:00pm (UTC)
-        wins = query['data'][str(self.player_id)]['statistics']['pvp']['wins']                  # total number of pvp wins
-        total_battles = query['data'][str(self.player_id)]['statistics']['pvp']['battles']      # total number of pvp battles
-        self.overall_WR = round(wins/total_battles,3)                                           # winrate, rounded to 3 decimals
+        self.username_wg = account_info['nickname']                       # user nickname
+        # time of last battle in timestamp ie 1528408800000 //  is 06/07/2018 @ 10:00pm (UTC).  hidden profiles don't
+        # give one, so a saved one is kept
+        if account_info.get('last_battle_time') is not None or getattr(self, 'last_battle_time', None) is None:
+            self.last_battle_time = account_info.get('last_battle_time')
+        # hidden profiles have no statistics, so their win rate is unknown
+        pvp_stats = (account_info.get('statistics') or {}).get('pvp') or {}
+        wins = pvp_stats.get('wins')                                      # total number of pvp wins
+        total_battles = pvp_stats.get('battles')                          # total number of pvp battles
+        self.overall_WR = round(wins/total_battles,3) if wins is not None and total_battles else None    # winrate, rounded to 3 decimals
 
         # self.overall_PR = 1500                  # Overall Personal Rating
         # self.overall_WR = .6                    # Overall Win Rate
         # self.overall_avg_damage = 90,000        # Overall Avg Damage
 
-        # create URL string for desired game ships
-        ship_url = ''
-        # iterating through and adding string version of the ship ID plus divider %2C+ string
-        for ship in self.game_info.game_ships:
-            ship_url += str(ship) + '%2C+'
-        # strip final %2C+ off
-        ship_url = ship_url[:len(ship_url)-4]
-
+    def update_ship_stats(self):
+        '''
+        '   A function that will get WG API ship stats for a player, for all ships in game_ships
+        '
+        '''
         # get that player's ship stats for all ships of concern.  if the player doesn't have that ship, then no pvp stats will be returned
-        response = requests.get(f"https://api.worldofwarships.{self.game_info.region}/wows/ships/stats/?application_id={self.game_info.api_key}&ship_id={ship_url}&account_id={self.player_id}&fields=ship_id%2C+pvp.battles%2C+pvp.damage_dealt%2C+pvp.wins")
-        query = json.loads(response.text)
+        query = self.game_info.api_client.get('ships/stats/', {'account_id': self.player_id, 'ship_id': list(self.game_info.game_ships), 'fields': Player2.ship_stats_fields}, use_cache=False)
+        self.apply_ship_stats(query)
 
+    def apply_ship_stats(self, query):
+        '''
+        '   A function that sets the player's ships from a ships/stats response
+        '   Parameters: the JSON response (dict) from the ships/stats endpoint for this player
+        '   Returns: True if the ships were updated, False if the response was an error (the ships are left as they were)
+        '''
         # verify query worked
         try:
             if query['status'] == "ok":
                 print("Updating ship info from WG servers...data pull successful.")
+            else:
+                print(f"Error getting player ship stat data from WG API: {query['error']}.  This error thrown from update_player_api_info method")
+                return False
         except:
             print("Error getting player ship stat data from WG API.  This error thrown from update_player_api_info method")
-            return
+            return False
 
         # Create empty dict for player ships
         self.ships = {}
@@ -1010,20 +3405,14 @@ class Player2:
                     ship_WR = 0
                     ship_avg_damage = 0
 
-                # create ship key/nested dict
-                self.ships[ship_id] = {     #'is_ship_available': True,
-                                            #'legendary': False, 
-                                            #'player_preferred': player_pref, 
-                                            #'admiral_strong_preferred': admiral_strong_pref,
-                                            #'admiral_weak_preferred': admiral_weak_pref,
-                                            #'ship_PR': ship_PR,
-                                            'ship_WR': ship_WR,
-                                            'ship_avg_damage': ship_avg_damage,
-                                            'ship_battles': ship_total_battles
-                                        }
+                # create ship key/nested dict.  ships are keyed by name, like Player.ships, so the lineup algorithms
+                # can look them up by the names in the ship lineup
+                ship = self.game_info.game_ships.get(str(ship_id))
+                if ship is not None:
+                    self.ships[ship['name']] = Player2.get_ship_entry(ship_id, ship_WR, ship_avg_damage, ship_total_battles)
         except TypeError:
             print(f"API for player {self.username_wg} {self.player_id} shows they have NoneType ships from game_ships")
-
+        return True
 
 
     
@@ -1031,56 +3420,139 @@ class Player2:
     # dunder function so that the player's WG username is how that player is displayed
     def __repr__(self):
         return self.username_wg
+
+
+class ModuleUnpickler(pickle.Unpickler):
+    '''
+    '   Pickles only store the name of each object's class and its module.  Objects pickled while this file runs as
+    '   a script (the GUI) are saved under __main__, and objects pickled after it's imported (tests, the lineups
+    '   command run through another script) are saved under cb_team_builder.  This unpickler looks up both in this
+    '   module, so old pickles (ie clan_roster.pkl, which holds __main__.Player2 objects) load either way
+    '''
+    def find_class(self, module, name):
+        if module in ('__main__', 'cb_team_builder'):
+            module = __name__
+        return super().find_class(module, name)
  
 
 # =====================    END OF CLASSES  ======================= # 
 
 
 # =====================   Non-class FUNCTIONS  =========================== #
-def get_sheets_data(spreadsheets_id, range_name):
-    '''
-    '   This function handles the authentication and retrieval of data from a Google Sheet
-    '   Parameters: The spreadsheet id and the range of data to pull    Return: 2D nested list of rows/cols
-    '''
-
-    # this is all commented out while temporarily using CSV version
-
-    # # If modifying these scopes, delete the file token.pickle.  (not sure what this is for)
-    # SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-
-    # creds = None
-    # # The file token.pickle stores the user's access and refresh tokens, and is
-    # # created automatically when the authorization flow completes for the first
-    # # time.
-    # if os.path.exists('token.pickle'):
-    #     with open('token.pickle', 'rb') as token:
-    #         creds = pickle.load(token)
-    # # If there are no (valid) credentials available, let the user log in.
-    # if not creds or not creds.valid:
-    #     if creds and creds.expired and creds.refresh_token:
-    #         creds.refresh(Request())
-    #     else:
-    #         flow = InstalledAppFlow.from_client_secrets_file(
-    #             'secrets.json', SCOPES)
-    #         creds = flow.run_local_server(port=0)
-    #     # Save the credentials for the next run
-    #     with open('token.pickle', 'wb') as token:
-    #         pickle.dump(creds, token)
-
-    # service = build('sheets', 'v4', credentials=creds)
-
-    # # Call the Sheets API
-    # sheet = service.spreadsheets()
-    # result = sheet.values().get(spreadsheetId=spreadsheets_id,
-    #                             range=range_name).execute()
-    # values = result.get('values', [])
-
-    # delete next 5 rows when turning Google Sheets
-    values = []
-    with open('resources\Test Clan Info - KSD Tier 10.csv', 'r', encoding='utf-8') as f:
-        rows = f.read().split('\n')
-    for row in rows:
-        values.append(row.split(','))
+def get_api_key():
+    '''
+    '   A function for getting the WG API key, from the WG_API_KEY environment variable or the hidden api_keys.py file
+    '   Returns: API key (string), empty if neither is set (only stored data can be used then)
+    '''
+    if os.environ.get('WG_API_KEY'):
+        return os.environ['WG_API_KEY']
+    try:
+        import api_keys
+        return api_keys.wg_api_key
+    except ImportError:
+        return ''
+
+def get_ship_name_key(name):
+    '''
+    '   A function for comparing ship names without case or accents
+    '   Parameters: ship name (string)      Returns: the name in lower case with accents removed, ie "Kléber" -> "kleber"
+    '''
+    decomposed = unicodedata.normalize('NFKD', name.strip())
+    return ''.join(character for character in decomposed if not unicodedata.combining(character)).casefold()
+
+def get_lineup_dict(lineup):
+    '''
+    '   A function for turning a Lineup into plain data, for JSON output
+    '   Parameters: Lineup object       Returns: dict of the lineup's rank, score and ship/player slots
+    '''
+    return {'rank': lineup.id,
+            'score': lineup.score,
+            'slots': [{'ship': ship, 'player': player.username_wg, 'player_id': player.player_id} for player, ship in lineup.player_and_ship_list]}
+
+def run_lineups_command(args):
+    '''
+    '   A function for the "lineups" command: finds a clan's top lineups without the GUI, and prints them as text or JSON
+    '   Parameters: parsed command line arguments (see cli_main)
+    '   Returns: exit code (0 ok, 1 if the players can't form the composition, 2 for bad input)
+    '''
+    # progress messages from loading/refreshing would break the JSON, so they go to stderr when printing JSON
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        game = WOWsGame(get_api_key(), args.realm, cache_path=args.cache_path, offline=args.offline, store_path=args.store_path)
+        try:
+            clan = Clan2(args.clan, game)
+        except KeyError:
+            print(f"Clan tag {args.clan} is not in the clan directory", file=sys.stderr)
+            return 2
+        if args.refresh:
+            clan.update_roster_incremental()
+        elif not clan.roster:
+            print(f"{args.clan} has no stored roster yet, use --refresh to get it through the WG API", file=sys.stderr)
+
+        # composition defaults to the clan's target ship lineup.  names are matched to the game's ship names without
+        # case or accents, so "Kleber" can be typed for "Kléber"
+        if args.composition:
+            clan.target_ship_lineup = []
+            for name in args.composition.split(','):
+                ship = game.get_ship_name(name.strip())
+                if ship is None:
+                    print(f"Ship {name.strip()} is not in the game's ship list", file=sys.stderr)
+                    return 2
+                clan.target_ship_lineup.append(ship)
+
+        # players default to every active player in the roster
+        if args.players:
+            player_list = []
+            for name in args.players.split(','):
+                player = clan.get_player(name.strip())
+                if player is None:
+                    print(f"Player {name.strip()} is not in {args.clan}'s roster", file=sys.stderr)
+                    return 2
+                player_list.append(player)
+        else:
+            player_list = [player for player in clan.roster.values() if player.is_active]
+
+        # check that the players can form the composition at all, then find the top lineups
+        is_feasible, feasibility_message = clan.check_lineup_feasibility(player_list)
+        lineups = clan.generate_top_k_lineups(player_list, args.top) if is_feasible else []
+
+    if args.json:
+        print(json.dumps({'clan': clan.clan_tag,
+                          'composition': clan.target_ship_lineup,
+                          'players': [player.username_wg for player in player_list],
+                          'feasible': is_feasible,
+                          'message': feasibility_message,
+                          'lineups': [get_lineup_dict(lineup) for lineup in lineups]}, indent=2))
+    else:
+        print(f"{clan.clan_tag} ({clan.clan_name}): {', '.join(clan.target_ship_lineup)}")
+        if not is_feasible:
+            print(feasibility_message)
+        for lineup in lineups:
+            print(f"Lineup {lineup.id}  Score: {lineup.score}")
+            for player, ship in lineup.player_and_ship_list:
+                print(f"    {ship}: {player.username_wg}")
+
+    return 0 if is_feasible else 1
+
+def get_sheets_data(spreadsheets_id, range_name, use_google_sheets=False, csv_path=os.path.join('resources', 'Test Clan Info - KSD Tier 10.csv')):
+    '''
+    '   This function gets the clan info spreadsheet, either from a Google Sheet or from a local CSV copy.  The Google
+    '   Sheets API packages are only imported (through sheets_backend.py) when use_google_sheets is True
+    '   Parameters: The spreadsheet id and the range of data to pull, use_google_sheets (boolean), and the path
+    '               of the CSV to read otherwise
+    '   Return: 2D nested list of rows/cols
+    '''
+    if use_google_sheets:
+        try:
+            import sheets_backend
+        except ImportError as error:
+            raise ImportError(f"Reading a Google Sheet needs google-api-python-client and google-auth-oauthlib ({error})") from error
+        values = sheets_backend.get_sheet_values(spreadsheets_id, range_name)
+    else:
+        values = []
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            rows = f.read().split('\n')
+        for row in rows:
+            values.append(row.split(','))
 
     # if unable to find the sheet
     if not values:
@@ -1089,6 +3561,342 @@ def get_sheets_data(spreadsheets_id, range_name):
     else:
         return values
 
+def get_numpy():
+    '''
+    '   A function that imports NumPy the first time it's needed, so it doesn't slow down starting the app
+    '   Returns: the numpy module, or None if it isn't installed
+    '''
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            return None
+    return np
+
+def solve_assignment(score_matrix):
+    '''
+    '   This function solves the assignment problem using the Hungarian algorithm.  Each row (ship slot) gets a
+    '   different column (player) so that the total score is as high as possible.  Runs in O(rows^2 * columns).
+    '   Parameters: score matrix (nested list, rows <= columns, -inf marks a pairing that isn't allowed)
+    '   Returns: best total score and list of the column picked for each row, or -inf and None if impossible
+    '''
+    # number of rows (slots) and columns (players)
+    n = len(score_matrix)
+    if n == 0:
+        return 0, []
+    m = len(score_matrix[0])
+
+    # there has to be at least one player per slot
+    if m < n:
+        return -math.inf, None
+
+    # get all allowed scores, there has to be at least one
+    finite_scores = [score for row in score_matrix for score in row if score != -math.inf]
+    if not finite_scores:
+        return -math.inf, None
+
+    # the algorithm minimizes cost, so cost is negative score.  pairings that aren't allowed get a penalty cost
+    # that is so big that any assignment using one costs more than every assignment that doesn't
+    max_cost = -min(finite_scores)
+    min_cost = -max(finite_scores)
+    penalty = n * max_cost - (n - 1) * min_cost + 1
+    cost = [[-score if score != -math.inf else penalty for score in row] for row in score_matrix]
+
+    # row potentials (u), column potentials (v), row matched to each column (p), and the path used to reach each column (way)
+    # these are 1-indexed, with column 0 used as a starting point for each new row
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+
+    # add rows one at a time, each time finding the cheapest augmenting path
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [math.inf] * (m + 1)
+        used = [False] * (m + 1)
+
+        # grow the tree of rows/columns until we reach a free column
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = math.inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    current = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if current < minv[j]:
+                        minv[j] = current
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            # update potentials
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # flip the matching along the augmenting path
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    # convert to the column picked for each row
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if p[j] != 0:
+            assignment[p[j] - 1] = j - 1
+
+    # add up the score in slot order.  if a pairing that isn't allowed was needed, there is no valid assignment
+    total_score = 0
+    for i in range(n):
+        total_score += score_matrix[i][assignment[i]]
+    if total_score == -math.inf:
+        return -math.inf, None
+
+    return total_score, assignment
+
+def repair_assignment_after_add(score_matrix, assignment, column):
+    '''
+    '   This function updates a best assignment (see solve_assignment) after a column (player) is added, without 
+    '   solving it again.  The new best assignment is the old one with at most one chain of rows moving over: a row 
+    '   takes the new column, another row takes the column it left, and so on (or nothing changes)
+    '   Parameters: score matrix (with the new column), the best assignment without the new column (list of the column
+    '               picked for each row), the new column's index
+    '   Returns: best total score and list of the column picked for each row
+    '''
+    # every column a chain can end up leaving unused, with the best chain for it.  the new column itself means no change
+    reassignments = find_best_reassignments(score_matrix, assignment, [column])
+    gain, moves = max(reassignments.values(), key=lambda reassignment: reassignment[0])
+    return apply_reassignment(score_matrix, assignment, moves)
+
+def repair_assignment_after_remove(score_matrix, assignment, column):
+    '''
+    '   This function updates a best assignment (see solve_assignment) after a column (player) is removed, without 
+    '   solving it again.  The row that had the removed column takes another one: a free column, or one another row
+    '   leaves for a different column, and so on
+    '   Parameters: score matrix (still with the removed column, which isn't used), the best assignment with the 
+    '               removed column (list of the column picked for each row), the removed column's index
+    '   Returns: best total score and list of the column picked for each row (column indexes don't change), or -inf 
+    '            and None if the rows can't all be filled without the removed column
+    '''
+    # nothing changes if the removed column wasn't used
+    if column not in assignment:
+        return apply_reassignment(score_matrix, assignment, ())
+
+    # the row that lost its column, and the columns it can take without moving any other row
+    open_row = assignment.index(column)
+    assignment = list(assignment)
+    assignment[open_row] = None
+    used_columns = set(assignment)
+    free_columns = [j for j in range(len(score_matrix[open_row])) if j != column and j not in used_columns]
+
+    # for every column that a chain of moves (starting from a free column) can leave unused, the best chain.  
+    # then the open row takes the column with the best chain gain + its own points
+    reassignments = find_best_reassignments(score_matrix, assignment, free_columns)
+    options = [(gain + score_matrix[open_row][j], moves + ((open_row, j),)) for j, (gain, moves) in reassignments.items() 
+               if score_matrix[open_row][j] != -math.inf]
+    if not options:
+        return -math.inf, None
+    gain, moves = max(options, key=lambda option: option[0])
+    return apply_reassignment(score_matrix, assignment, moves)
+
+def find_best_reassignments(score_matrix, assignment, start_columns):
+    '''
+    '   This function finds the best chains of rows moving to other columns, for repair_assignment_after_add/remove.  
+    '   A chain starts with an unused column, a row moves into it (leaving its own column unused), another row moves 
+    '   into that one, and so on.  Moving a row can lower the score, so the best chains are found with a longest path
+    '   version of Bellman-Ford over the columns.  If the assignment was the best one, no chain of moves back to the
+    '   same column can raise the score, so the search ends, and the best chains never move a row twice.
+    '   Parameters: score matrix, assignment (list of the column for each row, None for a row without one), list of 
+    '               unused columns to start from
+    '   Returns: dict of each column a chain can leave unused: (score gained (float), tuple of (row, new column) moves)
+    '''
+    # column: the row using it
+    column_rows = {assignment[row]: row for row in range(len(assignment)) if assignment[row] is not None}
+
+    best = {column: (0, ()) for column in start_columns}
+    changed = list(best)
+    while changed:
+        next_changed = {}
+        for unused_column in changed:
+            gain, moves = best[unused_column]
+            # any row can move into the unused column, leaving its own column unused
+            for column, row in column_rows.items():
+                if column == unused_column or score_matrix[row][unused_column] == -math.inf:
+                    continue
+                new_gain = gain + score_matrix[row][unused_column] - score_matrix[row][column]
+                # only take strictly better chains (with some room for rounding), so equal chains don't go in circles
+                if column not in best or new_gain > best[column][0] + 1e-9:
+                    best[column] = (new_gain, moves + ((row, unused_column),))
+                    next_changed[column] = True
+        changed = list(next_changed)
+    return best
+
+def apply_reassignment(score_matrix, assignment, moves):
+    '''
+    '   This function moves rows to new columns and adds up the new assignment's score
+    '   Parameters: score matrix, assignment (list of the column for each row), tuple of (row, new column) moves
+    '   Returns: total score and the new assignment (a new list), or -inf and None if a row has no column
+    '''
+    new_assignment = list(assignment)
+    for row, column in moves:
+        new_assignment[row] = column
+    if None in new_assignment or len(set(new_assignment)) != len(new_assignment):
+        return -math.inf, None
+
+    total_score = 0
+    for row in range(len(new_assignment)):
+        total_score += score_matrix[row][new_assignment[row]]
+    return total_score, new_assignment
+
+def stream_scored_lineups(ship_groups, ship_points, player_list, team_size, fixed_picks=(), should_stop=None, check_interval=256):
+    '''
+    '   This generator gives every distinct valid lineup one at a time (see Clan2.stream_lineup_candidates).
+    '   It is a plain function so that other processes can run it without a Clan2 object.
+    '   should_stop is called every check_interval search steps (valid lineups or not, since most branches can be dead
+    '   ends), and the search ends early if it returns True
+    '   Parameters: list of (ship, list of slots), dict of ship: {player: combo points} for owners only, 
+    '               list of players, number of slots, players already picked for the first ship groups (list of tuples),
+    '               optional function returning True to stop, number of search steps between should_stop calls
+    '   Returns: yields (score, tuple of players in slot order)
+    '''
+    # the player picked for each slot, and that combo's points
+    lineup = [None] * team_size
+    points = [0] * team_size
+    # search steps so far (players picked for a ship group), and whether should_stop asked to stop
+    step_count = 0
+    is_stopped = False
+
+    def fill_ship_group(group_index, remaining_players):
+        ''' pick owning players for one group of same-ship slots, then move on to the next group '''
+        # every group is filled, so the lineup is done.  add up points in slot order, same as Lineup
+        if group_index == len(ship_groups):
+            score = 0
+            for slot_points in points:
+                score += slot_points
+            yield score, tuple(lineup)
+            return
+
+        ship, slots = ship_groups[group_index]
+        # only players who own this ship can be picked (or the fixed pick for this group)
+        if group_index < len(fixed_picks):
+            choices = [fixed_picks[group_index]]
+        else:
+            owners = [player for player in remaining_players if player in ship_points[ship]]
+            choices = combinations(owners, len(slots))
+        nonlocal step_count, is_stopped
+        for picked_players in choices:
+            step_count += 1
+            if should_stop is not None and step_count % check_interval == 0 and should_stop():
+                is_stopped = True
+            if is_stopped:
+                return
+            for i in range(len(slots)):
+                lineup[slots[i]] = picked_players[i]
+                points[slots[i]] = ship_points[ship][picked_players[i]]
+            yield from fill_ship_group(group_index + 1, [player for player in remaining_players if player not in picked_players])
+
+    yield from fill_ship_group(0, list(player_list))
+
+def evaluate_lineup_shard(ship_groups, ship_points, player_list, team_size, fixed_picks, top_n):
+    '''
+    '   This function is run by each process in Clan2.generate_lineup_parallel.  It streams the valid lineups of one
+    '   shard and keeps the best top_n.
+    '   Parameters: see stream_scored_lineups, plus the number of lineups to keep
+    '   Returns: list of (score, lineup number in this shard, lineup) sorted best to worst, and the number of valid lineups
+    '''
+    # min heap of (score, -counter, lineup), so the worst kept lineup is on top and ties keep the earlier lineup
+    best_lineups = []
+    valid_count = 0
+
+    for score, lineup in stream_scored_lineups(ship_groups, ship_points, player_list, team_size, fixed_picks):
+        valid_count += 1
+        if len(best_lineups) < top_n:
+            heapq.heappush(best_lineups, (score, -valid_count, lineup))
+        elif score > best_lineups[0][0]:
+            heapq.heapreplace(best_lineups, (score, -valid_count, lineup))
+
+    best_lineups.sort(reverse=True)
+    return [(score, -neg_counter, lineup) for score, neg_counter, lineup in best_lineups], valid_count
+
+def is_composition_possible(composition, owner_bits):
+    '''
+    '   This function quickly rules out compositions using ship owner bitsets (see Clan2.get_ship_owner_bits).  Each ship
+    '   needs enough owners for the number of times it appears, and all ships together need enough different owners.
+    '   A composition that passes might still not be possible, but one that fails never is.
+    '   Parameters: composition (list of ship names), dict of ship name: owner bitset
+    '   Returns: True/False
+    '''
+    all_owners = 0
+    for ship in set(composition):
+        if bin(owner_bits[ship]).count('1') < composition.count(ship):
+            return False
+        all_owners |= owner_bits[ship]
+    return bin(all_owners).count('1') >= len(composition)
+
+def get_feasibility_message(player_list, ship_list):
+    '''
+    '   This function explains why a group of slots can't be filled, ie "3 players (a, b, c) cover the 4 slots for Moskva, Kleber x3"
+    '   Parameters: list of Player objects who own the ships, list of ship names (one per slot)
+    '   Returns: message (string)
+    '''
+    # list each ship once, with a count if it is needed more than once
+    ship_names = []
+    for ship in ship_list:
+        if ship not in ship_names:
+            ship_names.append(ship)
+    ship_string = ', '.join(ship if ship_list.count(ship) == 1 else f"{ship} x{ship_list.count(ship)}" for ship in ship_names)
+
+    # name the players, if there are any
+    if player_list:
+        player_string = f" ({', '.join(str(player) for player in player_list)})"
+    else:
+        player_string = ''
+
+    # "1 player covers" or "3 players cover"
+    if len(player_list) == 1:
+        player_count_string = "1 player" + player_string + " covers"
+    else:
+        player_count_string = f"{len(player_list)} players{player_string} cover"
+
+    return f"{player_count_string} the {len(ship_list)} slot{'s' if len(ship_list) != 1 else ''} for {ship_string}"
+
+def constrain_score_matrix(score_matrix, forced, excluded):
+    '''
+    '   This function makes a copy of a score matrix where some row/column pairings are forced or not allowed
+    '   Parameters: score matrix (nested list), forced (list of (row, column)), excluded (list of (row, column))
+    '   Returns: new score matrix, with -inf for every pairing that is no longer allowed
+    '''
+    # copy the matrix so the original isn't changed
+    new_matrix = [list(row) for row in score_matrix]
+
+    # a forced pairing means the rest of that row and that column can't be used
+    for row, column in forced:
+        for j in range(len(new_matrix[row])):
+            if j != column:
+                new_matrix[row][j] = -math.inf
+        for i in range(len(new_matrix)):
+            if i != row:
+                new_matrix[i][column] = -math.inf
+
+    # an excluded pairing can't be used
+    for row, column in excluded:
+        new_matrix[row][column] = -math.inf
+
+    return new_matrix
+
 def save_obj(obj, name ):
     ''' 
     '   A function for saving an object to a file using pickle
@@ -1103,45 +3911,92 @@ def load_obj(name ):
     '   Parameters: filename     Returns: object
     '''
     with open('resources/' + name + '.pkl', 'rb') as f:
-        return pickle.load(f)
+        return ModuleUnpickler(f).load()
+
+def loads_obj(data):
+    ''' 
+    '   A function for loading an object from pickled bytes (ie from the store), see ModuleUnpickler
+    '   Parameters: bytes     Returns: object
+    '''
+    return ModuleUnpickler(io.BytesIO(data)).load()
 # =====================    END OF FUNCTIONS  ============================= #
 
 
 # ============================    MAIN  ================================== #
 
 
-# The ID and range of the test  spreadsheet.
-clan_info_spreadsheet_ID = '14oxx0qpWg7VWhRyYIVP6uv5YL40BQI15APGDOwsdZdQ'
-range_name = 'KSD Tier 10'
-team_size = 8
-
-# for seeing if the Google Sheets API get works
-# print(get_sheets_data(clan_info_spreadsheet_ID, range_name))          
-
-# # uncomment below when basic UI ready
-# # 2D list of strings from Google Sheets
-try:
-    sheets_output = get_sheets_data(clan_info_spreadsheet_ID, range_name)        
-    print(sheets_output)     
-except:
-    print("Error reaching Google Sheets, exiting. ")
-    exit()
-
-# create Game object, passing in hidden API key
-game = WOWsGame(api_keys.wg_api_key, 'NA')
-
-# # create Clan object using output from sheets
-# clan = Clan(sheets_output)         
-clan = Clan2('KSD', game)
-
-# set up GUI
-root = Tk()
-
-# open image for right side
-image = PhotoImage(file='images\wows_icon.png')
-
-# create instance of interface
-gui = Interface(root, clan, image)
-
-# main Tkinter loop
-root.mainloop()
+def main():
+    '''
+    '   The GUI entry point: reads the clan info, loads the clan and runs the Tkinter window
+    '''
+    # The ID and range of the test  spreadsheet.
+    clan_info_spreadsheet_ID = '14oxx0qpWg7VWhRyYIVP6uv5YL40BQI15APGDOwsdZdQ'
+    range_name = 'KSD Tier 10'
+    team_size = 8
+    # read the spreadsheet from Google Sheets (True) or from the local CSV copy (False)
+    use_google_sheets = False
+
+    # for seeing if the Google Sheets API get works
+    # print(get_sheets_data(clan_info_spreadsheet_ID, range_name))          
+
+    # # uncomment below when basic UI ready
+    # # 2D list of strings from Google Sheets
+    try:
+        sheets_output = get_sheets_data(clan_info_spreadsheet_ID, range_name, use_google_sheets)        
+        print(sheets_output)     
+    except:
+        print("Error reaching Google Sheets, exiting. ")
+        exit()
+
+    # create Game object, passing in hidden API key
+    game = WOWsGame(get_api_key(), 'NA')
+
+    # # create Clan object using output from sheets
+    # clan = Clan(sheets_output)         
+    # generated lineups are remembered in a file, so they're still there the next time the app starts
+    clan = Clan2('KSD', game, LineupCache(os.path.join('resources', 'lineup_cache.db')))
+
+    # set up GUI
+    root = Tk()
+
+    # open image for right side
+    image = PhotoImage(file=os.path.join('images', 'wows_icon.png'))
+
+    # create instance of interface
+    gui = Interface(root, clan, image)
+
+    # main Tkinter loop
+    root.mainloop()
+
+def cli_main(argv=None):
+    '''
+    '   The command line entry point.  With no command (or "gui") the GUI is started, and the "lineups" command 
+    '   prints a clan's top lineups without Tk, ie:
+    '       python cb_team_builder.py lineups KSD --players "name1,name2,..." --composition "Kremlin,Yamato,..." --json
+    '   Parameters: list of arguments (defaults to sys.argv)      Returns: exit code
+    '''
+    parser = argparse.ArgumentParser(description="World of Warships Clan Battles team builder")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('gui', help="start the GUI (the default)")
+    lineups_parser = commands.add_parser('lineups', help="print a clan's top lineups")
+    lineups_parser.add_argument('clan', help="clan tag")
+    lineups_parser.add_argument('--players', help="comma separated WG usernames (default: every active player in the roster)")
+    lineups_parser.add_argument('--composition', help="comma separated ship names, one per slot (default: the clan's target ship lineup)")
+    lineups_parser.add_argument('--top', type=int, default=10, help="number of lineups to print (default 10)")
+    lineups_parser.add_argument('--json', action='store_true', help="print JSON instead of text")
+    lineups_parser.add_argument('--realm', default='NA', choices=['NA', 'RU', 'EU', 'ASIA'])
+    lineups_parser.add_argument('--refresh', action='store_true', help="refresh the roster through the WG API first")
+    lineups_parser.add_argument('--offline', action='store_true', help="only use cached WG API responses")
+    lineups_parser.add_argument('--store-path', default='resources/wows_data.db', help="game data store file")
+    lineups_parser.add_argument('--cache-path', default='resources/api_cache.db', help="WG API response cache file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'lineups':
+        return run_lineups_command(args)
+    main()
+    return 0
+
+# only run the app when this file is run directly.  processes started by generate_lineup_parallel import this
+# file, and they shouldn't open the GUI
+if __name__ == '__main__':
+    sys.exit(cli_main())
@@ -0,0 +1,67 @@
+# Import time benchmark for cb_team_builder.py
+# Imports the app in a fresh Python process with "python -X importtime", prints the total import time and the
+# slowest modules, and exits with an error if the total is over the budget, so startup regressions get caught.
+# Usage (from the repo folder): python misc/import_time_benchmark.py [--budget-ms 400] [--top 15] [--runs 5]
+# tests/test_import_time.py runs it with the default budget as part of the test suite
+
+import argparse
+import os.path
+import subprocess
+import sys
+
+def get_import_times(module_name, cwd):
+    '''
+    '   Import a module in a new Python process with -X importtime
+    '   Parameters: module name (string), folder to run from
+    '   Returns: the module's total import time, and a dict of each module it imports directly: import time 
+    '            (both cumulative, in microseconds)
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module_name} failed:\n{result.stderr[-2000:]}")
+
+    # lines look like "import time:       self [us] |  cumulative | imported package", with 2 spaces of indent in
+    # front of the package name per level of nesting.  a package's line comes after the lines of what it imports
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative_time, name = line[len('import time:'):].split('|')
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative_time)
+        elif depth == 0:
+            if name == module_name:
+                return int(cumulative_time), children
+            children = {}
+    raise RuntimeError(f"no import time found for {module_name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long importing cb_team_builder takes")
+    parser.add_argument('--module', default='cb_team_builder', help="module to import")
+    parser.add_argument('--budget-ms', type=float, default=400, help="fail if the median total import time is over this (0 for no budget)")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest top level imports to list")
+    parser.add_argument('--runs', type=int, default=5, help="number of fresh processes to time (the median is reported)")
+    args = parser.parse_args()
+
+    # run from the repo folder so the app module is importable
+    repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = sorted((get_import_times(args.module, repo_folder) for i in range(args.runs)), key=lambda run: run[0])
+    total_us, children = runs[len(runs) // 2]
+    total_ms = total_us / 1000
+
+    # slowest imports made directly by the module, by cumulative time
+    slowest = sorted(children.items(), key=lambda item: item[1], reverse=True)
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs} runs)")
+    for name, us in slowest[:args.top]:
+        print(f"    {us / 1000:8.1f} ms  {name}")
+
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"Import time {total_ms:.1f} ms is over the {args.budget_ms:.1f} ms budget")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Google Sheets backend for cb_team_builder.py
+# The Google API packages are slow to import, so cb_team_builder.py only imports this file when a Google Sheet
+# is used as the clan info source.  Requires: google-api-python-client, google-auth-oauthlib
+
+# These imports required for Google Sheets API
+import pickle
+import os.path
+from googleapiclient.discovery import build
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+
+# If modifying these scopes, delete the file token.pickle.
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+
+def get_sheet_values(spreadsheets_id, range_name):
+    '''
+    '   This function handles the authentication and retrieval of data from a Google Sheet
+    '   Parameters: The spreadsheet id and the range of data to pull    Return: 2D nested list of rows/cols
+    '''
+    creds = None
+    # The file token.pickle stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first
+    # time.
+    if os.path.exists('token.pickle'):
+        with open('token.pickle', 'rb') as token:
+            creds = pickle.load(token)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                'secrets.json', SCOPES)
+            creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        with open('token.pickle', 'wb') as token:
+            pickle.dump(creds, token)
+
+    service = build('sheets', 'v4', credentials=creds)
+
+    # Call the Sheets API
+    sheet = service.spreadsheets()
+    result = sheet.values().get(spreadsheetId=spreadsheets_id,
+                                range=range_name).execute()
+    return result.get('values', [])
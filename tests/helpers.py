@@ -0,0 +1,56 @@
+# Shared helpers for the tests: small random rosters, and brute force answers to check the solvers against
+# Usage: from helpers import make_players, make_clan (pytest puts the tests folder on the import path)
+
+import itertools
+import math
+
+import cb_team_builder as cbt
+
+SHIPS = ['Kremlin', 'Yamato', 'Smolensk', 'Moskva', 'Kléber', 'Gearing']
+
+def make_players(rng, count):
+    ''' random players, each owning some of SHIPS with random preferences '''
+    players = []
+    for player_id in range(count):
+        ships = {}
+        for ship_id, ship in enumerate(SHIPS):
+            if rng.random() < 0.6:
+                ships[ship] = cbt.Player2.get_ship_entry(ship_id, 0.5, 1000, 10)
+                for preference in ('admiral_strong_preferred', 'admiral_weak_preferred', 'player_preferred'):
+                    ships[ship][preference] = rng.random() < 0.3
+        player = cbt.Player2.from_stored_info(player_id, None, f'p{player_id}', 0, 0.5, ships)
+        player.is_alpha_team = rng.random() < 0.5
+        players.append(player)
+    return players
+
+def make_clan(players, composition):
+    ''' a Clan2 with the players as its roster, without a WOWsGame or store '''
+    clan = cbt.Clan2.__new__(cbt.Clan2)
+    clan.clan_tag = 'TEST'
+    clan.roster = {player.player_id: player for player in players}
+    clan.target_ship_lineup = list(composition)
+    clan.lineup_cache = cbt.LineupCache()
+    return clan
+
+def make_composition(rng):
+    ''' 3 to 5 slots, sometimes with a ship more than once '''
+    composition = rng.sample(SHIPS, rng.randint(3, 4))
+    if rng.random() < 0.5:
+        composition.append(composition[0])
+    return composition
+
+def brute_force_lineups(players, composition):
+    ''' every distinct valid lineup, as {frozenset of (ship, player ID): score} '''
+    lineups = {}
+    for picked in itertools.permutations(players, len(composition)):
+        points = [cbt.Lineup.get_combo_points(player, ship) for player, ship in zip(picked, composition)]
+        if -math.inf not in points:
+            lineups[frozenset((ship, player.player_id) for player, ship in zip(picked, composition))] = sum(points)
+    return lineups
+
+def brute_force_assignment(score_matrix):
+    ''' best total score of a slot x player matrix by trying every assignment, -inf if there isn't one '''
+    best = -math.inf
+    for columns in itertools.permutations(range(len(score_matrix[0])), len(score_matrix)):
+        best = max(best, sum(score_matrix[row][column] for row, column in enumerate(columns)))
+    return best
@@ -0,0 +1,71 @@
+# Tests for the "lineups" command line entry point of cb_team_builder.py, using a game data store made in a 
+# temporary folder (nothing is requested from the WG API)
+# Usage (from the repo folder): python -m pytest -q
+
+import json
+import random
+
+import pytest
+
+import cb_team_builder as cbt
+from helpers import SHIPS, make_players, brute_force_lineups
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    ''' a store with the helpers' ships and a clan TEST of random players '''
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('WG_API_KEY', 'test-key')
+    path = str(tmp_path / 'wows_data.db')
+    game = cbt.WOWsGame('test-key', 'NA', cache_path=None, store_path=path)
+    game.store.save_ships({str(ship_id): {'name': SHIPS[ship_id], 'type': 'Cruiser'} for ship_id in range(len(SHIPS))})
+    game.store.save_clans({'TEST': {'id': 5, 'name': 'Test Clan'}})
+    # the store keeps ship stats, not preferences, so the players only differ by the ships they own
+    game.store.save_roster(5, {player.player_id: player for player in make_players(random.Random(3), 7)})
+    return path
+
+def run_lineups(capsys, store_path, *arguments):
+    ''' Returns: exit code and printed output of the lineups command '''
+    exit_code = cbt.cli_main(['lineups', 'TEST', '--store-path', store_path, '--cache-path', store_path + '.cache', *arguments])
+    return exit_code, capsys.readouterr().out
+
+def test_lineups_command_prints_the_top_lineups_as_json(capsys, store_path):
+    exit_code, output = run_lineups(capsys, store_path, '--composition', 'kremlin, Kleber,Gearing', '--top', '5', '--json')
+
+    result = json.loads(output)
+    assert exit_code == 0
+    assert result['clan'] == 'TEST' and result['feasible'] and result['message'] == ''
+    # ship names are matched without case or accents
+    assert result['composition'] == ['Kremlin', 'Kléber', 'Gearing']
+
+    game = cbt.WOWsGame('test-key', 'NA', cache_path=None, store_path=store_path)
+    players = list(cbt.Clan2('TEST', game).roster.values())
+    expected = sorted(brute_force_lineups(players, result['composition']).values(), reverse=True)[:5]
+    assert [lineup['score'] for lineup in result['lineups']] == pytest.approx(expected)
+    assert [lineup['rank'] for lineup in result['lineups']] == list(range(1, len(expected) + 1))
+    for lineup in result['lineups']:
+        assert [slot['ship'] for slot in lineup['slots']] == result['composition']
+
+def test_lineups_command_text_output_and_player_list(capsys, store_path):
+    exit_code, output = run_lineups(capsys, store_path, '--composition', 'Kremlin,Yamato', '--players', 'p0, p4,p5,p6', '--top', '2')
+
+    assert exit_code == 0
+    lines = output.splitlines()
+    assert lines[0] == 'TEST (Test Clan): Kremlin, Yamato'
+    assert [line.split('  ')[0] for line in lines[1:] if not line.startswith('    ')] == ['Lineup 1', 'Lineup 2']
+    # only the given players are used
+    assert {line.split(': ')[1] for line in lines if line.startswith('    ')} <= {'p0', 'p4', 'p5', 'p6'}
+
+def test_lineups_command_reports_infeasible_compositions(capsys, store_path):
+    # 7 players can't fill 8 slots
+    exit_code, output = run_lineups(capsys, store_path, '--composition', ','.join(SHIPS + SHIPS[:2]), '--json')
+
+    result = json.loads(output)
+    assert exit_code == 1
+    assert not result['feasible'] and result['message'] and result['lineups'] == []
+
+@pytest.mark.parametrize('arguments', [['--composition', 'Kremlin,Not A Ship'], ['--players', 'p0,nobody']])
+def test_lineups_command_rejects_bad_input(capsys, store_path, arguments):
+    assert run_lineups(capsys, store_path, *arguments)[0] == 2
+
+def test_lineups_command_rejects_unknown_clans(capsys, store_path):
+    assert cbt.cli_main(['lineups', 'NOPE', '--store-path', store_path, '--cache-path', store_path + '.cache']) == 2
@@ -0,0 +1,101 @@
+# Tests for picking ship compositions and splitting players into several teams in cb_team_builder.py
+# Each result is checked against exhaustive enumeration on small random rosters.
+# Usage (from the repo folder): python -m pytest -q
+
+import itertools
+import random
+import types
+
+import pytest
+
+import cb_team_builder as cbt
+from helpers import SHIPS, make_players, make_clan, make_composition, brute_force_lineups
+
+# ship ID: {'name', 'type'}, like WOWsGame.game_ships
+GAME_SHIPS = {'1': {'name': 'Kremlin', 'type': 'Battleship'}, '2': {'name': 'Yamato', 'type': 'Battleship'},
+              '3': {'name': 'Smolensk', 'type': 'Cruiser'}, '4': {'name': 'Moskva', 'type': 'Cruiser'},
+              '5': {'name': 'Kléber', 'type': 'Destroyer'}, '6': {'name': 'Gearing', 'type': 'Destroyer'}}
+
+def get_best_score(players, composition):
+    ''' best lineup score of a composition by brute force, None if it can't be filled '''
+    lineups = brute_force_lineups(players, composition)
+    return max(lineups.values()) if lineups else None
+
+@pytest.mark.parametrize('seed', range(20))
+def test_best_compositions_from_a_list_match_brute_force(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 7))
+    compositions = [make_composition(rng) for i in range(rng.randint(1, 8))]
+    clan = make_clan(players, compositions[0])
+    top_n = rng.randint(1, 5)
+
+    results = clan.generate_best_compositions(players, compositions, top_n)
+    expected = sorted((score for score in (get_best_score(players, composition) for composition in compositions) if score is not None), reverse=True)
+
+    assert [lineup.score for composition, lineup in results] == pytest.approx(expected[:top_n])
+    for composition, lineup in results:
+        assert [ship for player, ship in lineup.player_and_ship_list] == composition
+        assert lineup.score == pytest.approx(get_best_score(players, composition))
+
+@pytest.mark.parametrize('seed', range(20))
+def test_best_compositions_from_rules_match_brute_force(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 7))
+    clan = make_clan(players, SHIPS[:4])
+    clan.game_info = types.SimpleNamespace(game_ships=GAME_SHIPS)
+    rules = {'Battleship': 1, 'Cruiser': rng.randint(1, 2), 'Destroyer': 1}
+    top_n = rng.randint(1, 5)
+
+    # every composition that follows the rules, by brute force
+    ship_names = {ship_type: [ship['name'] for ship in GAME_SHIPS.values() if ship['type'] == ship_type] for ship_type in rules}
+    all_compositions = [[ship for group in groups for ship in group] 
+                        for groups in itertools.product(*[itertools.combinations_with_replacement(ship_names[ship_type], count) for ship_type, count in rules.items()])]
+    # compositions are compared as sorted tuples, since the slot order doesn't change the score
+    best_scores = {tuple(sorted(composition)): get_best_score(players, composition) for composition in all_compositions}
+    possible = [composition for composition in best_scores if best_scores[composition] is not None]
+
+    # the rules' compositions leave out only compositions that can't be filled
+    built = [tuple(sorted(composition)) for composition in clan.get_compositions_from_rules(rules, players)]
+    assert len(set(built)) == len(built)
+    assert set(possible) <= set(built) <= set(best_scores)
+
+    results = clan.generate_best_compositions(players, rules, top_n)
+    assert [lineup.score for composition, lineup in results] == pytest.approx(sorted((best_scores[composition] for composition in possible), reverse=True)[:top_n])
+    for composition, lineup in results:
+        assert lineup.score == pytest.approx(best_scores[tuple(sorted(composition))])
+
+def brute_force_team_scores(players, team_compositions):
+    ''' each team's score, for every way the players can fill all of the teams (as a list of tuples) '''
+    slots = [(team, ship) for team in range(len(team_compositions)) for ship in team_compositions[team]]
+    team_scores = []
+    for picked in itertools.permutations(players, len(slots)):
+        scores = [0] * len(team_compositions)
+        for player, (team, ship) in zip(picked, slots):
+            scores[team] += cbt.Lineup.get_combo_points(player, ship)
+        if -float('inf') not in scores:
+            team_scores.append(tuple(scores))
+    return team_scores
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('prioritize_first_team', [False, True])
+def test_team_lineups_match_brute_force(seed, prioritize_first_team):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(5, 8))
+    team_compositions = [rng.sample(SHIPS, rng.randint(2, 3)) for team in range(2)]
+    clan = make_clan(players, team_compositions[0])
+
+    lineups = clan.generate_team_lineups(team_compositions, players, prioritize_first_team)
+    team_scores = brute_force_team_scores(players, team_compositions)
+
+    if not team_scores:
+        assert lineups is False
+        return
+    # no player is in two teams, and each team plays its composition
+    picked_ids = [player.player_id for lineup in lineups for player, ship in lineup.player_and_ship_list]
+    assert len(set(picked_ids)) == len(picked_ids)
+    assert [[ship for player, ship in lineup.player_and_ship_list] for lineup in lineups] == team_compositions
+    if prioritize_first_team:
+        # the best first team score, then the best second team score with who's left
+        assert [lineup.score for lineup in lineups] == pytest.approx(list(max(team_scores)))
+    else:
+        assert sum(lineup.score for lineup in lineups) == pytest.approx(max(sum(scores) for scores in team_scores))
@@ -0,0 +1,22 @@
+# Startup regression test: runs misc/import_time_benchmark.py, which fails if importing cb_team_builder takes
+# longer than its default budget (ie because a slow import like NumPy or the Google API client moved back to the top)
+# Usage (from the repo folder): python -m pytest -q tests/test_import_time.py
+
+import os.path
+import subprocess
+import sys
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_import_time_is_within_budget():
+    result = subprocess.run([sys.executable, os.path.join(REPO_FOLDER, 'misc', 'import_time_benchmark.py'), '--runs', '3'],
+                            cwd=REPO_FOLDER, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+def test_slow_imports_are_deferred():
+    # these are only needed for some commands, so importing the app must not import them
+    result = subprocess.run([sys.executable, '-c', 'import sys, cb_team_builder; print(sorted(sys.modules))'],
+                            cwd=REPO_FOLDER, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    for name in ('numpy', 'googleapiclient', 'google_auth_oauthlib', 'sheets_backend'):
+        assert f"'{name}'" not in result.stdout
@@ -0,0 +1,285 @@
+# Regression tests for the lineup solvers in cb_team_builder.py
+# Each solver is checked against exhaustive enumeration on small random rosters.
+# Usage (from the repo folder): python -m pytest -q
+
+import itertools
+import math
+import random
+import re
+import threading
+import time
+
+import pytest
+
+import cb_team_builder as cbt
+from helpers import SHIPS, make_players, make_clan, make_composition, brute_force_lineups, brute_force_assignment
+
+@pytest.mark.parametrize('seed', range(40))
+def test_solve_assignment_matches_brute_force(seed):
+    rng = random.Random(seed)
+    rows = rng.randint(1, 5)
+    columns = rng.randint(rows, 7)
+    score_matrix = [[rng.choice([-math.inf, 0, 10, 50, 60, 110]) if rng.random() < 0.7 else -math.inf 
+                     for column in range(columns)] for row in range(rows)]
+
+    score, assignment = cbt.solve_assignment(score_matrix)
+    best = brute_force_assignment(score_matrix)
+
+    if best == -math.inf:
+        assert assignment is None
+    else:
+        assert score == pytest.approx(best)
+        assert len(set(assignment)) == rows
+        assert sum(score_matrix[row][assignment[row]] for row in range(rows)) == pytest.approx(best)
+
+@pytest.mark.parametrize('seed', range(25))
+def test_top_k_lineups_match_brute_force(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 7))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+    k = rng.randint(1, 15)
+
+    lineups = clan.generate_top_k_lineups(players, k)
+    expected = sorted(brute_force_lineups(players, composition).values(), reverse=True)
+
+    if not expected:
+        assert lineups is False
+        return
+    assert [lineup.score for lineup in lineups] == pytest.approx(expected[:k])
+    # no lineup is returned twice, not even with same-ship players swapped
+    keys = [frozenset((ship, player.player_id) for player, ship in lineup.player_and_ship_list) for lineup in lineups]
+    assert len(set(keys)) == len(keys)
+
+@pytest.mark.parametrize('seed', range(40))
+def test_feasibility_check_and_hall_witness(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(3, 6))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+
+    is_feasible, message = clan.check_lineup_feasibility(players)
+
+    assert is_feasible == bool(brute_force_lineups(players, composition))
+    if is_feasible:
+        assert message == ''
+        return
+
+    # the witness: a group of slots, and every player who owns any of their ships, with fewer players than slots
+    player_count = int(re.match(r"(\d+) player", message).group(1))
+    slot_count, ship_string = re.search(r" the (\d+) slots? for (.*)$", message).groups()
+    witness_ships = set(re.sub(r" x\d+$", '', ship) for ship in ship_string.split(', '))
+    owners = [player for player in players if any(ship in player.ships for ship in witness_ships)]
+    assert player_count == len(owners)
+    assert player_count < int(slot_count) <= len(composition)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_solver_matches_full_solve(seed):
+    rng = random.Random(seed)
+    roster = make_players(rng, 10)
+    clan = make_clan(roster, make_composition(rng))
+    solver = cbt.IncrementalLineupSolver(clan)
+    selected = []
+
+    for step in range(40):
+        if selected and (rng.random() < 0.4 or len(selected) == len(roster)):
+            player = rng.choice(selected)
+            selected.remove(player)
+            solver.remove_player(player)
+        else:
+            player = rng.choice([player for player in roster if player not in selected])
+            selected.append(player)
+            solver.add_player(player)
+
+        best = brute_force_assignment(clan.get_score_matrix(selected)) if len(selected) >= len(clan.target_ship_lineup) else -math.inf
+        lineup = solver.get_best_lineup()
+        if best == -math.inf:
+            assert lineup is False
+        else:
+            assert lineup.score == pytest.approx(best)
+            assert len(set(player.player_id for player, ship in lineup.player_and_ship_list)) == len(clan.target_ship_lineup)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_distinct_lineups_skip_same_ship_swaps(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 6))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+
+    lineups = list(clan.get_distinct_lineup_permutations(players))
+    keys = [frozenset((ship, player.player_id) for player, ship in zip(lineup, composition)) for lineup in lineups]
+    every_key = {frozenset((ship, player.player_id) for player, ship in zip(picked, composition))
+                 for picked in itertools.permutations(players, len(composition))}
+    # every ship/player assignment exactly once, and counted without generating them
+    assert len(set(keys)) == len(keys) == clan.count_distinct_lineups(len(players))
+    assert set(keys) == every_key
+
+    result, bad_count, total_count = clan.generate_lineup(players, len(composition))
+    expected = sorted(brute_force_lineups(players, composition).values(), reverse=True)
+    assert total_count == len(keys)
+    assert total_count - bad_count == len(expected)
+    if not expected:
+        assert result is False
+    else:
+        assert [lineup.score for lineup in result] == pytest.approx(expected)
+
+def test_generate_lineup_rejects_a_team_size_that_does_not_match():
+    players = make_players(random.Random(0), 5)
+    clan = make_clan(players, ['Kremlin', 'Yamato', 'Gearing'])
+    with pytest.raises(ValueError):
+        clan.generate_lineup(players, 4)
+
+@pytest.mark.parametrize('seed', range(25))
+def test_streaming_lineups_match_brute_force(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 8))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+    top_n = rng.randint(1, 30)
+
+    lineups, bad_count, total_count = clan.generate_lineup_streaming(players, top_n)
+    expected = brute_force_lineups(players, composition)
+
+    assert total_count == clan.count_distinct_lineups(len(players))
+    assert total_count - bad_count == len(expected)
+    if not expected:
+        assert lineups is False
+        return
+    # the best top_n scores, and each lineup is a real assignment with that score
+    assert [lineup.score for lineup in lineups] == pytest.approx(sorted(expected.values(), reverse=True)[:top_n])
+    for lineup in lineups:
+        assert expected[frozenset((ship, player.player_id) for player, ship in lineup.player_and_ship_list)] == pytest.approx(lineup.score)
+
+@pytest.mark.parametrize('seed', range(25))
+def test_branch_and_bound_matches_brute_force(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 8))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+
+    lineup, node_count = clan.generate_lineup_branch_and_bound(players)
+    expected = brute_force_lineups(players, composition)
+
+    if not expected:
+        assert lineup is False
+        return
+    assert lineup.score == pytest.approx(max(expected.values()))
+    assert expected[frozenset((ship, player.player_id) for player, ship in lineup.player_and_ship_list)] == pytest.approx(lineup.score)
+    # the visited nodes are reported: at least one, and never more than one per slot of every distinct lineup
+    assert 0 < node_count <= clan.count_distinct_lineups(len(players)) * len(composition)
+
+def get_lineup_rows(lineups):
+    ''' (lineup ID, score, player IDs in slot order) of each lineup, to compare the results of two solvers exactly '''
+    if not lineups:
+        return lineups
+    return [(lineup.id, lineup.score, tuple(player.player_id for player, ship in lineup.player_and_ship_list)) for lineup in lineups]
+
+@pytest.mark.parametrize('seed', range(25))
+def test_vectorized_lineups_match_streaming(seed):
+    pytest.importorskip('numpy')
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(4, 8))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+    top_n = rng.randint(1, 30)
+
+    streaming_lineups, bad_count, total_count = clan.generate_lineup_streaming(players, top_n)
+    # small batches, so lineups are carried over between batches
+    vectorized_lineups, vectorized_bad_count, vectorized_total_count = clan.generate_lineup_vectorized(players, top_n, batch_size=7)
+
+    assert (vectorized_bad_count, vectorized_total_count) == (bad_count, total_count)
+    assert get_lineup_rows(vectorized_lineups) == get_lineup_rows(streaming_lineups)
+    # with no top_n, every valid lineup
+    all_lineups = clan.generate_lineup_vectorized(players, None)[0]
+    assert sorted(lineup.score for lineup in all_lineups or []) == pytest.approx(sorted(brute_force_lineups(players, composition).values()))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parallel_lineups_match_streaming(seed):
+    rng = random.Random(seed)
+    players = make_players(rng, rng.randint(6, 8))
+    composition = make_composition(rng)
+    clan = make_clan(players, composition)
+
+    streaming_result = clan.generate_lineup_streaming(players, 20)
+    parallel_result = clan.generate_lineup_parallel(players, 20, workers=2, prefix_groups=rng.randint(1, 2))
+
+    assert parallel_result[1:] == streaming_result[1:]
+    assert get_lineup_rows(parallel_result[0]) == get_lineup_rows(streaming_result[0])
+
+def test_streaming_search_can_be_cancelled_when_most_branches_are_dead_ends():
+    # 12 players who own every ship but the last one, which nobody owns: no branch ever finds a valid lineup
+    players = make_players(random.Random(0), 12)
+    for player in players:
+        player.ships = {ship: cbt.Player2.get_ship_entry(0, 0.5, 1000, 10) for ship in SHIPS[:-1]}
+    clan = make_clan(players, SHIPS + SHIPS[:2])
+    cancel_event = threading.Event()
+    progress_calls = []
+
+    timer = threading.Timer(0.2, cancel_event.set)
+    timer.start()
+    start = time.monotonic()
+    lineups, bad_count, total_count = clan.generate_lineup_streaming(players, 10, lambda *progress: progress_calls.append(progress), 
+                                                                     cancel_event, progress_interval=0.05)
+    elapsed = time.monotonic() - start
+    timer.cancel()
+
+    # cancelled soon after the event was set, and progress kept coming while nothing valid was found
+    assert elapsed < 1
+    assert lineups is False and bad_count is None
+    assert len(progress_calls) >= 2
+    assert all(0 <= fraction <= 1 and valid_count == 0 for fraction, valid_count, best_lineups in progress_calls)
+
+def test_cancelled_searches_are_not_cached():
+    players = make_players(random.Random(1), 7)
+    clan = make_clan(players, ['Kremlin', 'Yamato', 'Smolensk'])
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    assert clan.generate_lineup_cached(players, 10, cancel_event=cancel_event)[1] is None
+    result = clan.generate_lineup_cached(players, 10)
+    assert result[1] is not None
+    assert clan.lineup_cache.get_stats() == {'hits': 0, 'misses': 2}
+
+def test_lineup_store_pages_lineups_without_making_them_all():
+    players = make_players(random.Random(2), 8)
+    clan = make_clan(players, ['Kremlin', 'Yamato', 'Smolensk', 'Kléber'])
+    lineups = clan.generate_lineup_streaming(players, 500)[0]
+    reference = clan.generate_lineup(players, 4)[0]
+
+    assert len(lineups) == min(500, len(reference))
+    assert lineups.lineups == {}
+    # a page is made into Lineup objects, and only that page
+    page = lineups.get_page(10, 5)
+    assert [lineup.score for lineup in page] == pytest.approx([lineup.score for lineup in reference[10:15]])
+    assert sorted(lineups.lineups) == list(range(10, 15))
+    assert lineups.get_page(len(lineups) - 2, 5) == lineups[-2:]
+    # lookups by ID give the same objects, and unknown IDs give None
+    assert lineups.get_lineup(page[0].id) is page[0]
+    assert lineups.get_lineup(-1) is None
+    with pytest.raises(IndexError):
+        lineups[len(lineups)]
+
+def test_roster_indexes_follow_roster_changes():
+    players = make_players(random.Random(4), 6)
+    clan = make_clan(players, ['Kremlin', 'Yamato'])
+
+    assert clan.get_player('p3') is players[3] and clan.get_player('nobody') is None
+    assert clan.get_player_by_id(4) is players[4] and clan.get_player_by_id(99) is None
+    for ship in SHIPS:
+        assert clan.ship_owner_ids.get(ship, set()) == {player.player_id for player in players if ship in player.ships}
+        assert clan.get_list_players_owning_ship(ship, players[::-1]) == [player for player in players[::-1] if ship in player.ships]
+
+    # replacing the roster rebuilds the indexes
+    new_players = make_players(random.Random(5), 3)
+    for player in new_players:
+        player.username_wg = f'new{player.player_id}'
+    clan.set_roster({player.player_id: player for player in new_players})
+    assert clan.get_player('p3') is None and clan.get_player('new1') is new_players[1]
+    assert clan.ship_owner_ids.get('Kremlin', set()) == {player.player_id for player in new_players if 'Kremlin' in player.ships}
+
+def test_players_missing_from_the_roster_are_reported():
+    players = make_players(random.Random(4), 6)
+    clan = make_clan(players[:4], ['Kremlin', 'Yamato'])
+
+    with pytest.raises(KeyError, match=r'\[4, 5\] are not in the TEST roster'):
+        clan.get_list_players_owning_ship('Kremlin', players)
@@ -0,0 +1,280 @@
+# Tests for the on-disk stores in cb_team_builder.py: the game data store, the clan search index and the lineup cache
+# Usage (from the repo folder): python -m pytest -q
+
+import os.path
+import pickle
+import random
+import shutil
+
+import pytest
+
+import cb_team_builder as cbt
+from helpers import make_players, make_clan
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ship ID: {'name', 'type'}, like WOWsGame.game_ships
+GAME_SHIPS = {'1': {'name': 'Kremlin', 'type': 'Battleship'}, '2': {'name': 'Yamato', 'type': 'Battleship'},
+              '3': {'name': 'Kléber', 'type': 'Destroyer'}}
+
+def make_game(tmp_path, monkeypatch, legacy_files=()):
+    ''' a WOWsGame with its store in a temporary folder, after copying some of the repo's old .pkl files there '''
+    os.makedirs(tmp_path / 'resources')
+    for name in legacy_files:
+        shutil.copy(os.path.join(REPO_FOLDER, 'resources', name + '.pkl'), tmp_path / 'resources')
+    monkeypatch.chdir(tmp_path)
+    # the API isn't used, so the url doesn't need a server
+    return cbt.WOWsGame('test-key', 'NA', api_url='http://127.0.0.1:9', cache_path=None, store_path=str(tmp_path / 'wows_data.db'))
+
+def make_player(game, player_id, ship_names):
+    ships = {GAME_SHIPS[ship_id]['name']: cbt.Player2.get_ship_entry(int(ship_id), 0.5, 1000 * int(ship_id), 10) 
+             for ship_id in GAME_SHIPS if GAME_SHIPS[ship_id]['name'] in ship_names}
+    return cbt.Player2.from_stored_info(player_id, game, f'player{player_id}', 100 + player_id, 0.55, ships)
+
+def test_store_round_trips_ships_clans_and_rosters(tmp_path, monkeypatch):
+    game = make_game(tmp_path, monkeypatch)
+    store = game.store
+    store.save_ships(GAME_SHIPS)
+    store.save_clans({'AAA': {'id': 1, 'name': 'Clan A'}, 'BBB': {'id': 2, 'name': 'Clan B'}})
+
+    assert store.load_ships() == GAME_SHIPS
+    assert store.get_clan('BBB') == {'id': 2, 'name': 'Clan B'}
+    assert store.get_clan('CCC') is None
+    assert store.load_clan_directory() == {'AAA': {'id': 1, 'name': 'Clan A'}, 'BBB': {'id': 2, 'name': 'Clan B'}}
+
+    store.save_roster(1, {10: make_player(game, 10, ['Kremlin', 'Kléber']), 11: make_player(game, 11, ['Yamato'])})
+    store.save_roster(2, {20: make_player(game, 20, ['Kremlin'])})
+    roster = store.load_roster(1, game)
+    assert sorted(roster) == [10, 11]
+    assert roster[10].username_wg == 'player10' and roster[10].last_battle_time == 110 and roster[10].overall_WR == 0.55
+    assert roster[10].ships == make_player(game, 10, ['Kremlin', 'Kléber']).ships
+    assert roster[10].game_info is game
+
+    # players who left are removed, and only that clan's players are touched
+    store.save_roster(1, {11: make_player(game, 11, ['Yamato', 'Kremlin'])})
+    assert sorted(store.load_roster(1, game)) == [11]
+    assert sorted(store.load_roster(1, game)[11].ships) == ['Kremlin', 'Yamato']
+    assert sorted(store.load_roster(2, game)) == [20]
+
+def test_legacy_pickles_load_when_the_module_is_imported():
+    # clan_roster.pkl was saved by the GUI script, so its players are __main__.Player2
+    with open(os.path.join(REPO_FOLDER, 'resources', 'clan_roster.pkl'), 'rb') as f:
+        data = f.read()
+    assert b'__main__' in data
+
+    roster = cbt.loads_obj(data)
+
+    assert roster and all(isinstance(player, cbt.Player2) for player in roster.values())
+
+def test_legacy_pickles_are_copied_into_the_store(tmp_path, monkeypatch):
+    game = make_game(tmp_path, monkeypatch, ['all_ships', 'clan_directory', 'clan_roster'])
+    legacy_roster = cbt.load_obj('clan_roster')
+
+    clan = cbt.Clan2(cbt.Clan2.legacy_roster_clan_tag, game)
+
+    assert game.store.load_ships() == cbt.load_obj('all_ships')
+    assert sorted(clan.roster) == sorted(legacy_roster)
+    assert sorted(game.store.load_roster(clan.clan_id, game)) == sorted(legacy_roster)
+    # other clans don't get the old roster
+    other_tag = next(tag for tag in game.get_clan_directory() if tag != cbt.Clan2.legacy_roster_clan_tag)
+    assert cbt.Clan2(other_tag, game).roster == {}
+
+def brute_force_search(clan_directory, query, limit):
+    ''' rank every clan by checking each one: tag prefixes, name prefixes, tag substrings, then name substrings '''
+    query = query.strip().lower()
+    if not query:
+        return []
+    tags = sorted(clan_directory)
+    keys = {'tag': [tag.lower() for tag in tags], 'name': [clan_directory[tag]['name'].lower() for tag in tags]}
+    found = []
+    for key_name, is_prefix in (('tag', True), ('name', True), ('tag', False), ('name', False)):
+        key_list = keys[key_name]
+        if is_prefix:
+            matches = sorted((i for i in range(len(tags)) if key_list[i].startswith(query)), key=lambda i: (key_list[i], i))
+        else:
+            matches = sorted((i for i in range(len(tags)) if query in key_list[i]), key=lambda i: (key_list[i].find(query), len(key_list[i]), key_list[i], i))
+        found += [i for i in matches if i not in found]
+    return [(tags[i], clan_directory[tags[i]]) for i in found[:limit]]
+
+def make_clan_directory(rng, count):
+    ''' random clan tags and names, from a few letters so that many of them match the same queries '''
+    clan_directory = {}
+    while len(clan_directory) < count:
+        tag = ''.join(rng.choice('ABKSD_') for i in range(rng.randint(2, 5)))
+        name = ' '.join(rng.choice(['Kill', 'Steal', 'Denied', 'Bad', 'Sad', 'kas']) for i in range(rng.randint(1, 3)))
+        clan_directory[tag] = {'id': len(clan_directory), 'name': name}
+    return clan_directory
+
+@pytest.mark.parametrize('seed', range(10))
+def test_clan_search_matches_brute_force(seed):
+    rng = random.Random(seed)
+    clan_directory = make_clan_directory(rng, 200)
+    index = cbt.ClanSearchIndex(clan_directory)
+
+    for i in range(30):
+        text = rng.choice(list(clan_directory) + [info['name'] for info in clan_directory.values()])
+        start = rng.randrange(len(text))
+        query = text[start:start + rng.randint(1, 4)]
+        if rng.random() < 0.5:
+            query = query.swapcase()
+        limit = rng.randint(1, 15)
+        assert index.search(query, limit) == brute_force_search(clan_directory, query, limit)
+    assert index.search('   ', 5) == []
+    assert index.search('zzz', 5) == []
+
+def test_clan_search_index_is_saved_as_plain_data(tmp_path, monkeypatch):
+    game = make_game(tmp_path, monkeypatch)
+    clan_directory = make_clan_directory(random.Random(0), 50)
+    game.store.save_clans(clan_directory)
+
+    results = game.search_clans('ka', 10)
+
+    # the saved index doesn't name the class, so it loads the same whether the file was run as a script or imported
+    data = game.store.connection.execute("SELECT data FROM search_index").fetchone()[0]
+    assert b'ClanSearchIndex' not in data and b'cb_team_builder' not in data
+    assert game.store.load_search_index().search('ka', 10) == results
+
+    # an index saved as a pickled object by an older version is rebuilt
+    with game.store.connection:
+        game.store.connection.execute("UPDATE search_index SET data = ?", (pickle.dumps(cbt.ClanSearchIndex(clan_directory)),))
+    assert game.store.load_search_index() is None
+    game.clan_search_index = None
+    assert game.search_clans('ka', 10) == results
+    assert game.store.load_search_index() is not None
+
+    # changing the clan directory drops the saved index
+    game.store.save_clans({'NEW': {'id': 99, 'name': 'Kappa'}})
+    assert game.store.load_search_index() is None
+
+def test_game_data_is_loaded_on_first_use(tmp_path, monkeypatch):
+    game = make_game(tmp_path, monkeypatch)
+    game.store.save_ships(GAME_SHIPS)
+    game.store.save_clans({'AAA': {'id': 1, 'name': 'Clan A'}})
+    game.store.save_roster(1, {10: make_player(game, 10, ['Kremlin'])})
+
+    # nothing is read from the store until it's used
+    game = cbt.WOWsGame('test-key', 'NA', api_url='http://127.0.0.1:9', cache_path=None, store_path=str(tmp_path / 'wows_data.db'))
+    assert not game.is_loaded('game_ships') and not game.is_loaded('clan_directory')
+    clan = cbt.Clan2('AAA', game)
+    assert not clan.is_loaded('roster')
+
+    progress = []
+    clan.load_resources(lambda done, total, step: progress.append((done, total, step)))
+    assert game.is_loaded('game_ships') and clan.is_loaded('roster')
+    assert [done for done, total, step in progress] == list(range(len(progress)))
+    assert sorted(clan.roster) == [10]
+    assert game.game_ships == GAME_SHIPS
+
+def test_unpickled_game_opens_its_store_when_used(tmp_path, monkeypatch):
+    game = make_game(tmp_path, monkeypatch)
+    game.store.save_ships(GAME_SHIPS)
+
+    copy = pickle.loads(pickle.dumps(game))
+
+    assert not copy.is_loaded('store') and not copy.is_loaded('api_client')
+    assert copy.store.load_ships() == GAME_SHIPS
+    assert copy.game_ships == GAME_SHIPS
+
+def test_lineup_cache_keeps_the_most_recently_used_results_in_memory():
+    cache = cbt.LineupCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used, so it's the one dropped
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get_stats() == {'hits': 3, 'misses': 1}
+
+def test_lineup_cache_results_are_kept_on_disk_across_restarts(tmp_path):
+    path = str(tmp_path / 'lineup_cache.db')
+    cache = cbt.LineupCache(path, max_entries=1)
+    cache.put('a', [1, 2, 3])
+    cache.put('b', [4, 5])
+    # 'a' isn't in memory anymore, but is still on disk
+    assert cache.get('a') == [1, 2, 3]
+
+    cache = cbt.LineupCache(path)
+    assert cache.get('a') == [1, 2, 3]
+    assert cache.get('b') == [4, 5]
+    assert cache.get('c') is None
+
+def test_lineup_cache_disk_is_limited_by_entries_and_bytes(tmp_path):
+    path = str(tmp_path / 'lineup_cache.db')
+    cache = cbt.LineupCache(path, max_entries=0, max_disk_entries=3)
+    for key in 'abcd':
+        cache.put(key, key)
+    assert cache.get('a') is None
+    assert [cache.get(key) for key in 'bcd'] == ['b', 'c', 'd']
+
+    result_bytes = len(pickle.dumps('x' * 1000, pickle.HIGHEST_PROTOCOL))
+    path = str(tmp_path / 'lineup_cache_bytes.db')
+    cache = cbt.LineupCache(path, max_entries=0, max_disk_bytes=result_bytes * 2)
+    for key in 'abc':
+        cache.put(key, key * 1000)
+    # only the 2 newest results fit
+    assert cache.get('a') is None
+    assert cache.get('b') == 'b' * 1000 and cache.get('c') == 'c' * 1000
+
+    # a result bigger than the whole limit is only kept in memory, and doesn't push the others out
+    cache.max_entries = 1
+    cache.put('big', 'x' * 10000)
+    assert cache.get('big') == 'x' * 10000
+    assert cbt.LineupCache(path).get('big') is None
+    assert cache.get('b') == 'b' * 1000 and cache.get('c') == 'c' * 1000
+
+def get_lineup_rows(lineups):
+    ''' (lineup ID, score, player IDs in slot order) of each lineup '''
+    return [(lineup.id, lineup.score, tuple(player.player_id for player, ship in lineup.player_and_ship_list)) for lineup in lineups]
+
+def get_ship_players(lineup):
+    ''' ship: sorted player IDs in that ship's slots '''
+    ship_players = {}
+    for player, ship in lineup.player_and_ship_list:
+        ship_players.setdefault(ship, []).append(player.player_id)
+    return {ship: sorted(player_ids) for ship, player_ids in ship_players.items()}
+
+def test_lineup_cache_key_changes_with_what_the_lineups_depend_on(monkeypatch):
+    players = make_players(random.Random(3), 8)
+    clan = make_clan(players, ['Kremlin', 'Yamato', 'Kléber'])
+    key = clan.get_lineup_cache_key(players, 10)
+
+    # player order and slot order don't change the lineups
+    assert clan.get_lineup_cache_key(players[::-1], 10) == key
+    clan.target_ship_lineup = ['Kléber', 'Kremlin', 'Yamato']
+    assert clan.get_lineup_cache_key(players, 10) == key
+
+    assert clan.get_lineup_cache_key(players[:-1], 10) != key
+    assert clan.get_lineup_cache_key(players, 20) != key
+    clan.target_ship_lineup = ['Kléber', 'Kremlin', 'Gearing']
+    assert clan.get_lineup_cache_key(players, 10) != key
+    clan.target_ship_lineup = ['Kremlin', 'Yamato', 'Kléber']
+
+    monkeypatch.setattr(cbt.Lineup, 'mod_is_alpha', cbt.Lineup.mod_is_alpha + 0.1)
+    assert clan.get_lineup_cache_key(players, 10) != key
+    monkeypatch.undo()
+
+    ship = next(ship for ship in clan.target_ship_lineup if ship in players[0].ships)
+    players[0].ships[ship]['admiral_strong_preferred'] = not players[0].ships[ship]['admiral_strong_preferred']
+    assert clan.get_lineup_cache_key(players, 10) != key
+
+def test_cached_lineups_match_the_lineups_they_were_made_from(monkeypatch):
+    players = make_players(random.Random(5), 8)
+    clan = make_clan(players, ['Kremlin', 'Yamato', 'Smolensk', 'Kléber'])
+    lineups, bad_count, total_count = clan.generate_lineup_cached(players, 10)
+    assert lineups
+
+    # a second call must come from the cache
+    monkeypatch.setattr(clan, 'generate_lineup_streaming', lambda *args, **kwargs: pytest.fail('lineups were made again'))
+    cached_lineups, cached_bad_count, cached_total_count = clan.generate_lineup_cached(players, 10)
+    assert (cached_bad_count, cached_total_count) == (bad_count, total_count)
+    assert get_lineup_rows(cached_lineups) == get_lineup_rows(lineups)
+
+    # the same ships in another slot order get the same players in each ship's slot
+    clan.target_ship_lineup = ['Kléber', 'Smolensk', 'Yamato', 'Kremlin']
+    reordered_lineups, _, _ = clan.generate_lineup_cached(players, 10)
+    assert clan.lineup_cache.get_stats() == {'hits': 2, 'misses': 1}
+    for lineup, reordered_lineup in zip(lineups, reordered_lineups):
+        assert (reordered_lineup.id, reordered_lineup.score) == (lineup.id, lineup.score)
+        assert [ship for player, ship in reordered_lineup.player_and_ship_list] == clan.target_ship_lineup
+        assert get_ship_players(reordered_lineup) == get_ship_players(lineup)
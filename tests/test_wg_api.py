@@ -0,0 +1,253 @@
+# Tests for the WG API client and roster loading in cb_team_builder.py, run against a local stub server
+# (see wg_api_stub.py), so nothing is sent to WG.
+# Usage (from the repo folder): python -m pytest -q
+
+import asyncio
+import time
+
+import pytest
+import requests
+
+import cb_team_builder as cbt
+from wg_api_stub import StubWGApi
+
+# ship ID: {'name', 'type'}, the game ships the stub's players can own
+GAME_SHIPS = {'1': {'name': 'Kremlin', 'type': 'Battleship'}, '2': {'name': 'Yamato', 'type': 'Battleship'},
+              '3': {'name': 'Smolensk', 'type': 'Cruiser'}, '4': {'name': 'Gearing', 'type': 'Destroyer'}}
+
+@pytest.fixture
+def stub_api():
+    api = StubWGApi()
+    yield api
+    api.close()
+
+@pytest.fixture
+def game(stub_api, tmp_path, monkeypatch):
+    ''' a WOWsGame using the stub server, with its cache and store in a temporary folder '''
+    # the old resources/*.pkl files are looked for in the current folder, so there aren't any to migrate
+    monkeypatch.chdir(tmp_path)
+    game = cbt.WOWsGame('test-key', 'NA', api_url=stub_api.url, requests_per_second=1000,
+                        cache_path=str(tmp_path / 'api_cache.db'), store_path=str(tmp_path / 'wows_data.db'))
+    game.store.save_ships(GAME_SHIPS)
+    game.store.save_clans({'TEST': {'id': 5, 'name': 'Test Clan'}})
+    return game
+
+def test_bulk_roster_batches_account_info(stub_api, game):
+    clan = cbt.Clan2('TEST', game)
+
+    players = clan.update_roster_bulk()
+
+    # one clan request, one account/info request for every member, and one ships/stats request per member
+    assert len(stub_api.get_requests('clans/info/')) == 1
+    account_requests = stub_api.get_requests('account/info/')
+    assert len(account_requests) == 1
+    assert sorted(int(player_id) for player_id in account_requests[0]['account_id'].split(',')) == stub_api.members
+    assert sorted(int(params['account_id']) for params in stub_api.get_requests('ships/stats/')) == stub_api.members
+
+    # players are built from the combined responses, and stored
+    assert sorted(players) == stub_api.members
+    for player_id, player in players.items():
+        assert player.username_wg == f'player{player_id}'
+        assert player.overall_WR == 0.6
+        assert sorted(player.ships) == sorted(GAME_SHIPS[ship_id]['name'] for ship_id in StubWGApi.get_ship_ids(player_id, GAME_SHIPS))
+    assert sorted(game.store.load_roster(5, game)) == stub_api.members
+    assert clan.roster is players
+
+def test_bulk_account_info_takes_100_players_per_request(stub_api, game):
+    player_ids = list(range(2000, 2250))
+
+    account_infos = game.get_account_info_bulk(player_ids)
+
+    assert sorted(len(params['account_id'].split(',')) for params in stub_api.get_requests('account/info/')) == [50, 100, 100]
+    assert sorted(int(player_id) for player_id in account_infos) == player_ids
+
+def test_get_many_sends_requests_at_the_same_time(stub_api):
+    stub_api.delay = 0.2
+    client = cbt.WGApiClient(stub_api.url, 'test-key', concurrency=8, requests_per_second=1000)
+    request_list = [('account/info/', {'account_id': [player_id]}) for player_id in range(3000, 3008)]
+
+    start = time.monotonic()
+    queries = client.get_many(request_list)
+    elapsed = time.monotonic() - start
+
+    # 8 requests that take 0.2 seconds each, all at once
+    assert elapsed < 0.2 * 8 / 2
+    # results are in the same order as the requests
+    assert [list(query['data']) for query in queries] == [[str(player_id)] for player_id in range(3000, 3008)]
+
+def test_fetch_many_can_be_awaited(stub_api):
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000)
+
+    queries = asyncio.run(client.fetch_many([('clans/info/', {'clan_id': clan_id}) for clan_id in (1, 2, 3)]))
+
+    assert [list(query['data']) for query in queries] == [['1'], ['2'], ['3']]
+
+def test_clan_directory_and_ships_are_crawled_concurrently(stub_api, game):
+    clan_directory = game.update_all_clan_directory()
+    game_ships = game.update_ships()
+
+    # every page of clans, stopping after the first empty one
+    assert len(clan_directory) == 100 * stub_api.clan_pages
+    assert game.get_clan_info('C2X7') == {'id': 2007, 'name': 'Clan 2 7'}
+    # every page of ships, keeping only the ships at the game tier
+    assert sorted(game_ships) == sorted(str(page * 10 + i) for page in range(1, stub_api.ship_pages + 1) for i in (0, 2))
+    assert game.store.load_ships() == game_ships
+
+def test_token_bucket_limits_the_request_rate():
+    bucket = cbt.TokenBucket(20, capacity=1)
+
+    start = time.monotonic()
+    waits = [bucket.acquire() for i in range(6)]
+    elapsed = time.monotonic() - start
+
+    # the first token is ready, each of the other 5 waits for a refill at 20 tokens per second
+    assert waits[0] == 0
+    assert elapsed >= 5 / 20 * 0.9
+
+def test_request_limit_exceeded_is_retried_with_backoff(stub_api):
+    stub_api.limit_exceeded_count = 2
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, backoff_base=0.01)
+
+    query = client.get('clans/info/', {'clan_id': 5})
+
+    assert query['status'] == 'ok'
+    stats = client.get_stats()
+    assert (stats['requests'], stats['retried'], stats['limit_exceeded']) == (3, 2, 2)
+
+def test_request_limit_exceeded_is_returned_after_the_last_retry(stub_api):
+    stub_api.limit_exceeded_count = 10
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, max_retries=2, backoff_base=0.01)
+
+    query = client.get('clans/info/', {'clan_id': 5})
+
+    assert query['error']['message'] == 'REQUEST_LIMIT_EXCEEDED'
+    assert client.get_stats()['requests'] == 3
+
+def test_network_errors_are_retried_then_raised(stub_api):
+    # nothing is listening once the stub is closed
+    url = stub_api.url
+    stub_api.close()
+    client = cbt.WGApiClient(url, 'test-key', requests_per_second=1000, max_retries=2, backoff_base=0.01)
+
+    with pytest.raises(requests.RequestException):
+        client.get('clans/info/', {'clan_id': 5})
+
+    stats = client.get_stats()
+    assert (stats['requests'], stats['retried'], stats['transport_errors']) == (3, 2, 3)
+
+def test_rate_limiter_is_shared_by_concurrent_requests(stub_api):
+    client = cbt.WGApiClient(stub_api.url, 'test-key', concurrency=10, requests_per_second=20)
+    client.rate_limiter = cbt.TokenBucket(20, capacity=1)
+
+    start = time.monotonic()
+    client.get_many([('clans/info/', {'clan_id': clan_id}) for clan_id in range(6)])
+
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+    assert client.get_stats()['throttled'] >= 5
+
+def get_stats_request_ids(stub_api):
+    ''' player IDs of the ships/stats requests so far, sorted '''
+    return sorted(int(params['account_id']) for params in stub_api.get_requests('ships/stats/'))
+
+def test_incremental_refresh_only_pulls_changed_players(stub_api, game):
+    clan = cbt.Clan2('TEST', game)
+    clan.update_roster_bulk()
+    stub_api.requests.clear()
+
+    # one player played, one left, one joined, and one hid their profile (no last battle time)
+    stub_api.last_battle_times[1001] = 200
+    stub_api.last_battle_times[1003] = None
+    stub_api.members = [player_id for player_id in stub_api.members if player_id != 1002] + [1100]
+    players = clan.update_roster_incremental()
+
+    assert get_stats_request_ids(stub_api) == [1001, 1100]
+    assert sorted(players) == sorted(stub_api.members)
+    stored = game.store.load_roster(5, game)
+    assert sorted(stored) == sorted(stub_api.members)
+    assert stored[1001].last_battle_time == 200
+    # the hidden profile keeps its saved last battle time
+    assert stored[1003].last_battle_time == 100
+    assert stored[1100].username_wg == 'player1100' and stored[1100].ships
+
+    # nothing changed since, so nobody is pulled again
+    stub_api.requests.clear()
+    clan.update_roster_incremental()
+    assert get_stats_request_ids(stub_api) == []
+
+def test_incremental_refresh_pulls_failed_players_again(stub_api, game):
+    clan = cbt.Clan2('TEST', game)
+    clan.update_roster_bulk()
+
+    # a player who played and a new member, whose ship stats can't be pulled
+    stub_api.last_battle_times[1001] = 200
+    stub_api.members = stub_api.members + [1100]
+    stub_api.failing_stats_ids = {1001, 1100}
+    clan.update_roster_incremental()
+
+    # their last battle times aren't moved forward, so they still look out of date
+    stored = game.store.load_roster(5, game)
+    assert stored[1001].last_battle_time == 100
+    assert stored[1100].last_battle_time is None
+
+    # and they're pulled again on the next refresh
+    stub_api.failing_stats_ids = set()
+    stub_api.requests.clear()
+    clan.update_roster_incremental()
+    assert get_stats_request_ids(stub_api) == [1001, 1100]
+    stored = game.store.load_roster(5, game)
+    assert stored[1001].last_battle_time == 200
+    assert stored[1100].last_battle_time == 100 and stored[1100].ships
+
+def test_fresh_responses_come_from_the_cache(stub_api, tmp_path):
+    cache = cbt.ResponseCache(str(tmp_path / 'api_cache.db'))
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, cache=cache)
+
+    first = client.get('clans/info/', {'clan_id': 5})
+    second = client.get('clans/info/', {'clan_id': 5})
+
+    assert second == first
+    assert len(stub_api.get_requests('clans/info/')) == 1
+    assert cache.get_stats() == {'hits': 1, 'misses': 1}
+
+    # refreshes skip the cache, and the new response replaces the cached one
+    client.get('clans/info/', {'clan_id': 5}, use_cache=False)
+    assert len(stub_api.get_requests('clans/info/')) == 2
+
+    # the cache is on disk, so a new client uses it too
+    other_client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, cache=cbt.ResponseCache(str(tmp_path / 'api_cache.db')))
+    assert other_client.get('clans/info/', {'clan_id': 5}) == first
+    assert len(stub_api.get_requests('clans/info/')) == 2
+
+def test_cached_responses_expire(stub_api, tmp_path):
+    cache = cbt.ResponseCache(str(tmp_path / 'api_cache.db'), ttls={'clans/info/': 0.1})
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, cache=cache)
+
+    client.get('clans/info/', {'clan_id': 5})
+    time.sleep(0.15)
+    client.get('clans/info/', {'clan_id': 5})
+    # endpoints without a time to live aren't cached
+    client.get('account/info/', {'account_id': [1000]})
+    client.get('account/info/', {'account_id': [1000]})
+
+    assert len(stub_api.get_requests('clans/info/')) == 2
+    assert len(stub_api.get_requests('account/info/')) == 2
+
+def test_errors_are_not_cached(stub_api, tmp_path):
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, max_retries=0, cache=cbt.ResponseCache(str(tmp_path / 'api_cache.db')))
+
+    stub_api.limit_exceeded_count = 1
+    assert client.get('clans/info/', {'clan_id': 5})['status'] == 'error'
+    assert client.get('clans/info/', {'clan_id': 5})['status'] == 'ok'
+    assert len(stub_api.get_requests('clans/info/')) == 2
+
+def test_offline_mode_only_uses_the_cache(stub_api, tmp_path):
+    client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, cache=cbt.ResponseCache(str(tmp_path / 'api_cache.db')))
+    first = client.get('clans/info/', {'clan_id': 5})
+
+    offline_client = cbt.WGApiClient(stub_api.url, 'test-key', requests_per_second=1000, 
+                                     cache=cbt.ResponseCache(str(tmp_path / 'api_cache.db'), ttls={'clans/info/': 0}, offline=True))
+
+    # cached responses are used no matter how old, even by refreshes, and nothing is requested
+    assert offline_client.get('clans/info/', {'clan_id': 5}, use_cache=False) == first
+    assert offline_client.get('clans/info/', {'clan_id': 6})['error']['message'] == 'NOT_CACHED_OFFLINE'
+    assert len(stub_api.get_requests('clans/info/')) == 1
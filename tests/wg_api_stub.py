@@ -0,0 +1,104 @@
+# A local stand-in for the WG API, for testing the API client and roster refreshes without the network
+# Usage: api = StubWGApi() ... WOWsGame(..., api_url=api.url) ... api.close()
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+class StubWGApi:
+    '''
+    '   This class runs a fake WG API server on a free local port, in a background thread.  Its answers come from
+    '   the attributes below, which tests can change between requests, and every request is recorded.
+    '   Attributes: url (base url to give WOWsGame/WGApiClient), members (list of the clan's player IDs),
+    '               last_battle_times (dict of player ID: last battle time, None for a hidden profile),
+    '               failing_stats_ids (set of player IDs whose ships/stats requests fail),
+    '               limit_exceeded_count (the next this many requests get REQUEST_LIMIT_EXCEEDED),
+    '               delay (seconds to wait before each answer), ship_pages, clan_pages (pages of ships and clans),
+    '               requests (list of (endpoint, dict of query parameters), in the order they were received)
+    '''
+
+    def __init__(self):
+        self.members = list(range(1000, 1010))
+        self.last_battle_times = {player_id: 100 for player_id in self.members}
+        self.failing_stats_ids = set()
+        self.limit_exceeded_count = 0
+        self.delay = 0
+        self.ship_pages = 2
+        self.clan_pages = 3
+        self.requests = []
+        self.lock = threading.Lock()
+
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                body = json.dumps(stub.get_response(url.path[len('/wows/'):], params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_requests(self, endpoint):
+        ''' Returns: the query parameters of every request to an endpoint so far '''
+        with self.lock:
+            return [params for request_endpoint, params in self.requests if request_endpoint == endpoint]
+
+    @staticmethod
+    def get_ship_ids(player_id, ship_ids):
+        ''' the ships a player owns, out of the ship IDs asked for: every other ship, starting from a different one per player '''
+        return [ship_id for ship_id in ship_ids if (player_id + int(ship_id)) % 2 == 0]
+
+    def get_response(self, endpoint, params):
+        ''' Returns: the JSON response (dict) for a request '''
+        with self.lock:
+            self.requests.append((endpoint, params))
+            if self.limit_exceeded_count > 0:
+                self.limit_exceeded_count -= 1
+                return {'status': 'error', 'error': {'code': 407, 'message': 'REQUEST_LIMIT_EXCEEDED'}}
+        if self.delay:
+            time.sleep(self.delay)
+
+        if endpoint == 'clans/info/':
+            return {'status': 'ok', 'data': {params['clan_id']: {'members_ids': list(self.members)}}}
+
+        if endpoint == 'account/info/':
+            return {'status': 'ok', 'data': {player_id: {'nickname': f'player{player_id}',
+                                                         'last_battle_time': self.last_battle_times.get(int(player_id), 100),
+                                                         'statistics': {'pvp': {'wins': 6, 'battles': 10}}}
+                                             for player_id in params['account_id'].split(',')}}
+
+        if endpoint == 'ships/stats/':
+            player_id = int(params['account_id'])
+            if player_id in self.failing_stats_ids:
+                return {'status': 'error', 'error': {'code': 504, 'message': 'SOURCE_NOT_AVAILABLE'}}
+            ship_ids = self.get_ship_ids(player_id, params.get('ship_id', '').split(','))
+            return {'status': 'ok', 'data': {str(player_id): [{'ship_id': int(ship_id), 'pvp': {'wins': 3, 'battles': 4, 'damage_dealt': 400000}}
+                                                              for ship_id in ship_ids]}}
+
+        if endpoint == 'encyclopedia/ships/':
+            page = int(params.get('page_no', 1))
+            return {'status': 'ok', 'meta': {'page_total': self.ship_pages, 'page': page},
+                    'data': {str(page * 10 + i): {'name': f'Ship {page}-{i}', 'type': 'Cruiser', 'tier': 10 if i % 2 == 0 else 9}
+                             for i in range(4)}}
+
+        if endpoint == 'clans/list/':
+            page = int(params.get('page_no', 1))
+            clans = [{'tag': f'C{page}X{i}', 'clan_id': page * 1000 + i, 'name': f'Clan {page} {i}'} for i in range(100)] if page <= self.clan_pages else []
+            return {'status': 'ok', 'meta': {'count': len(clans)}, 'data': clans}
+
+        return {'status': 'error', 'error': {'code': 404, 'message': 'METHOD_NOT_FOUND'}}